@@ -6,6 +6,8 @@
 # under the Modified BSD License.
 #
 """Removes projects from a translation file and then saves it as a new file.
+To only export some projects in the first place, `livss export --projects`
+does this without loading the whole translator.
 """
 
 from lslib.base.file.utility.TranslationFile import TranslationFile
@@ -37,6 +37,8 @@ def setup_argparse():
                                                 help=prsr_EXPORT_help)
     sub_update  = subprsrs.add_parser(prsr_UPDATE, description=prsr_UPDATE_desc,
                                                 help=prsr_UPDATE_help)
+    sub_watch = subprsrs.add_parser(prsr_WATCH, description=prsr_WATCH_desc,
+                                                help=prsr_WATCH_help)
     sub_script= subprsrs.add_parser(prsr_SCRIPT,description=prsr_SCRIPT_desc,
                                                 help=prsr_SCRIPT_help) 
     
@@ -53,6 +55,11 @@ def setup_argparse():
     #export subcommand
     # input    the file/directory that should be the target of an export
     # output   the file/directory that should be the location of said export
+    # --projects  only export the projects whose names match these patterns (eg, User*)
+    # --langs     only export the language codes that match these patterns (eg, 1033 20??)
+    # --pipeline  scan resources, merge projects and fill in the system files at the same time
+    # --lang-jobs, --proj-jobs, --inflight  the workers and limit of the pipeline
+    # --mem-budget  spill the system level projects to disk past this many megabytes
     #
     # Subcommands of Export
     #   util           options for dumping utility files from the input target
@@ -66,6 +73,15 @@ def setup_argparse():
     sub_export.add_argument('-l','--level', choices=['sys','proj','lang'], help="set the level to build the export to, read the HOWTO if you don't know.",dest='export_level')
     sub_export.add_argument('--mem', action='store_true', help="Keep everything in memory and only saves the level specified, generates new files.",dest='export_mem')
     sub_export.add_argument('--keep', action='store_true', help="Use what was currently generated in the input path, don't generate new files.",dest='export_existing')
+    sub_export.add_argument('--db', action='store_true', help="Keep the system level files in a master database too, with --keep the database is read instead.",dest='export_db')
+    sub_export.add_argument('-j','--jobs', metavar='N', type=int, help="Load existing utility files with N processes at once (used with --keep).",dest='export_jobs')
+    sub_export.add_argument('--projects', metavar='pattern', nargs='+', help="Only export the projects whose names match these patterns (eg, User*).",dest='export_projects')
+    sub_export.add_argument('--langs', metavar='pattern', nargs='+', help="Only export the language codes that match these patterns (eg, 1033 20??).",dest='export_langs')
+    sub_export.add_argument('--pipeline', action='store_true', help="Scan resources, merge projects and fill in the system files at the same time.",dest='export_pipeline')
+    sub_export.add_argument('--lang-jobs', metavar='N', type=int, help="Scan resources with N processes at once (used with --pipeline).",dest='export_langjobs')
+    sub_export.add_argument('--proj-jobs', metavar='N', type=int, help="Merge projects with N processes at once (used with --pipeline).",dest='export_projjobs')
+    sub_export.add_argument('--inflight', metavar='N', type=int, help="At most N resources or projects wait on the next level of the pipeline.",dest='export_inflight')
+    sub_export.add_argument('--mem-budget', metavar='MB', type=float, help="Spill the system level projects held in memory to disk past this many megabytes.",dest='export_membudget')
     sub_export.add_argument('input', help='the file/directory that should be the target of an export')
     sub_export.add_argument('output', help='the file/directory that should be the location of said export')
     
@@ -83,30 +99,70 @@ def setup_argparse():
     #    -s, --sort       Sort the list of strings alphabetically
     #    -c, --langcodes  Provide a list of language codes you want in the translator file
     #    -p, --prune      Takes a path to a file that has a list of strings that shouldn't be in the translation file
+    #    --prune-cache    Takes a path to a file to remember which strings were pruned between runs
+    #    -f, --format     The type of Excel file to write, xls (the default) or xlsx (no row limit)
+    #    --conflict-report  Takes a path to write a CSV of the strings that have more than one translation
+    #    --since          Takes an older translator, master database or System files; only strings changed since then are exported
+    #    --split-by-lang  Write a translator for each language code after the first, with just that language and the first
+    #    --shards         Split the projects into this many shards that are built by their own workers and then merged
+    #    --shard          Only build this shard (0 based) into the hand-off directory, to merge later
+    #    --merge-shards   Only merge the shards in the hand-off directory into the translator
+    #    --handoff        The directory the shards are saved to and merged from
     translator_sub_parse.add_argument('-s','--sort', action='store_true', help="Sort the list of strings alphabetically", dest='export_translator_order')
     translator_sub_parse.add_argument('-c','--langcodes', metavar='code', nargs='+', help="Provide a list of language codes you want in the translator file",dest='export_translator_langcodes')
     translator_sub_parse.add_argument('-p','--prune', metavar='path', nargs=1, help="Takes a path to a file that has a list of strings that shouldn't be in the translation file",dest='export_translator_prunepath')
+    translator_sub_parse.add_argument('--prune-cache', metavar='path', help="Takes a path to a file to remember which strings were pruned between runs",dest='export_translator_prunecache')
+    translator_sub_parse.add_argument('-f','--format', choices=['xls','xlsx'], help="The type of Excel file to write, xls (the default) or xlsx (no row limit)",dest='export_translator_format')
+    translator_sub_parse.add_argument('--conflict-report', metavar='path', help="Takes a path to write a CSV of the strings that have more than one translation",dest='export_translator_conflictreport')
+    translator_sub_parse.add_argument('--since', metavar='path', help="Takes an older translator, master database or System files; only strings changed since then are exported",dest='export_translator_since')
+    translator_sub_parse.add_argument('--split-by-lang', action='store_true', help="Write a translator for each language code after the first, with just that language and the first",dest='export_translator_splitlang')
+    translator_sub_parse.add_argument('--shards', metavar='num', type=int, help="Split the projects into this many shards that are built by their own workers and then merged",dest='export_translator_shards')
+    translator_sub_parse.add_argument('--shard', metavar='num', type=int, help="Only build this shard (0 based) into the hand-off directory, to merge later",dest='export_translator_shard')
+    translator_sub_parse.add_argument('--merge-shards', action='store_true', help="Only merge the shards in the hand-off directory into the translator",dest='export_translator_mergeshards')
+    translator_sub_parse.add_argument('--handoff', metavar='path', help="The directory the shards are saved to and merged from",dest='export_translator_handoff')
     translator_sub_parse.add_argument('-m','--mark', action='store_true', help="Highlights possible conflicts in the new translation file", dest='export_translator_markconflicts')
 
     #update subcommand
-    # -t, --translator   Location of input translator file
+    # -t, --translator   Location of input translator file, or several split by language
     # -d, --dialogs      Location of input dialogs file
     # -m, --menus        Location of input menus file
     # -s, --strings      Location of input string table file
+    # -b, --database     Location of input master database
     # -c, --langcode     Limit what lang code in the input file gets updated, this can be a list.
     # -o, --outtype      What should we be updating? (sys, proj, rcs)
     # -n, --new          Generates new files for whatever outtype is set to (cannot be rcs).
+    # --dry-run          Only report how many lines would change in each resource file, nothing is written.
+    # --projects         Only update the projects whose names match these patterns (eg, User*).
+    # --langs            Only update the language codes that match these patterns (eg, 1033 20??).
     # output             The directory/file to update
     locations = sub_update.add_mutually_exclusive_group(required=True)
-    locations.add_argument('-t','--translator',metavar='path',help='Location of input translator file',dest='update_translator')
+    locations.add_argument('-t','--translator',metavar='path',nargs='+',help='Location of input translator file, or several split by language',dest='update_translator')
     locations.add_argument('-d','--dialogs',metavar='path',help='Location of input dialogs file',dest='update_dialogs')
     locations.add_argument('-m','--menus',metavar='path',help='Location of input menus file',dest='update_menus')
     locations.add_argument('-s','--strings',metavar='path',help='Location of input string table file',dest='update_strings')
+    locations.add_argument('-b','--database',metavar='path',help='Location of input master database',dest='update_database')
     sub_update.add_argument('-c','--langcode', metavar='code', nargs='+', help="Limit what lang code in the input file gets updated, this can be a list.", dest='update_langcodes')
     sub_update.add_argument('-o','--outtype', metavar='type', choices=['sys','proj','rcs'], help='What should we be updating?', dest='update_to')
     sub_update.add_argument('-n','--new',action='store_true', help='Generates new files for whatever outtype is set to (cannot be rcs).', dest='update_new')
+    sub_update.add_argument('--dry-run', action='store_true', help='Only report how many lines would change in each resource file, nothing is written.', dest='update_dryrun')
+    sub_update.add_argument('--projects', metavar='pattern', nargs='+', help='Only update the projects whose names match these patterns (eg, User*).', dest='update_projects')
+    sub_update.add_argument('--langs', metavar='pattern', nargs='+', help='Only update the language codes that match these patterns (eg, 1033 20??).', dest='update_langs')
     sub_update.add_argument('output',help='The directory/file to update')
     
+    #watch subcommand
+    # --interval   Seconds between each look at the directory (default 2).
+    # --debounce   Seconds without a change before the projects are rebuilt (default 1).
+    # --db         Keep the master database up to date too.
+    # -j, --jobs   Load existing utility files with N processes at once.
+    # --projects   Only watch the projects whose names match these patterns (eg, User*).
+    # input        The system directory to watch
+    sub_watch.add_argument('--interval', metavar='seconds', type=float, help="Seconds between each look at the directory (default 2).", dest='watch_interval')
+    sub_watch.add_argument('--debounce', metavar='seconds', type=float, help="Seconds without a change before the projects are rebuilt (default 1).", dest='watch_debounce')
+    sub_watch.add_argument('--db', action='store_true', help="Keep the master database up to date too.", dest='watch_db')
+    sub_watch.add_argument('-j','--jobs', metavar='N', type=int, help="Load existing utility files with N processes at once.", dest='watch_jobs')
+    sub_watch.add_argument('--projects', metavar='pattern', nargs='+', help="Only watch the projects whose names match these patterns (eg, User*).", dest='watch_projects')
+    sub_watch.add_argument('input', help='The system directory to watch')
+    
     #script subcommand
     # --dump   instead of reading in a file, all default configurations are dumped to the given file
     # path     takes a path to a file to run it. For more information on scripting, see the howto file.
@@ -184,5 +240,5 @@ def main():
     
 ############################# Main functionality #############################
 if __name__ == "__main__": main()
-else: print(__usage__%{'prog':"livss.py"})
+elif __name__ != "__mp_main__": print(__usage__%{'prog':"livss.py"}) # not in worker processes.
 ##############################################################################
\ No newline at end of file
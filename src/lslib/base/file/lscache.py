@@ -0,0 +1,357 @@
+#
+# Author: Alexander Dean <dstar@csh.rit.edu>
+# Copyright (c) 2011, RailComm LLC
+# All rights reserved. Redistribution and use in source and binary forms, with
+# or without modification are permitted provided that the conditions are met
+# under the Modified BSD License.
+#
+"""Reading the utility files back in (the CSV and XML ones) is slow, mostly
+because of the csv module and ElementTree. So whenever one of them is saved
+a binary copy of the same data is put right next to it (the 'sidecar', which
+is just the file name with CACHE_EXT added on). The next time the file is
+loaded, if the sidecar is still describing the same text file it is used
+instead. The text files are always the source of truth, the sidecar can be
+deleted at any time and nothing will be lost.
+
+The format of a sidecar is as follows:
+                            [HEADER]
+                            [STRING LENGTHS]
+                            [STRING DATA]
+                            [INTEGERS]
+Header - magic number, format version, the kind of file it is a copy of, and
+        the size and modification time of the text file when it was written.
+        If the text file doesn't match these anymore the sidecar is ignored.
+
+String Lengths/Data - Every string is only stored once (interned) and all of
+        them are kept in one utf-8 blob. Everything else refers to a string
+        by its index in this table, or -1 for None.
+
+Integers - A flat array of integers that describe the structure of the file,
+        see LSCSVCache and LSXMLCache for what they are for each format.
+"""
+import os
+import sys
+import struct
+import logging
+from array     import array
+from itertools import accumulate
+
+CACHE_EXT = ".lsc"
+
+class LSCacheKind:
+    """The type of text file the sidecar is a copy of. These are checked when
+    reading so we never read a dialog cache as a string table, etc.
+    """
+    MENUS, DIALOGS, STRTBLS, SYSMENUS, SYSDIALOGS, SYSSTRTBLS = range(1,7)
+
+
+class LSCache:
+    """Holds the bits that are shared between reading and writing a sidecar.
+    Set ENABLED to False to stop reading and writing them altogether.
+    """
+    ENABLED = True
+    MAGIC   = b"LSC\x00"
+    VERSION = 1
+    HEADER  = struct.Struct("<4sHBxQqIII")
+    NONE    = -1
+
+    @staticmethod
+    def getPath(path):
+        """Returns the path of the sidecar for the given text file."""
+        return path + CACHE_EXT
+
+    @staticmethod
+    def remove(path):
+        """Removes the sidecar for the given text file if it exists."""
+        try: os.remove(LSCache.getPath(path))
+        except OSError: pass
+
+
+class LSCacheWriter( LSCache ):
+    """Builds up the string table and integer array, and then writes them out
+    to the sidecar of the text file given. The text file must already be
+    saved (and closed) when write() is called, since its size and
+    modification time are recorded.
+    """
+    def __init__(self, path, kind):
+        self._path = path
+        self._kind = kind
+        self._strs = {}
+        self._ints = array("i")
+
+    def intern(self, s):
+        """Gets the index of the string, adding it if we haven't seen it."""
+        if s is None: return LSCache.NONE
+        idx = self._strs.get(s)
+        if idx is None:
+            idx = len(self._strs)
+            self._strs[s] = idx
+        return idx
+
+    def add(self, num):
+        """Adds an integer to the end of the array."""
+        self._ints.append(num)
+
+    def addString(self, s):
+        """Interns the string and adds its index."""
+        self._ints.append(self.intern(s))
+
+    def reserve(self):
+        """Adds a placeholder integer and returns where it is so that it can
+        be filled in later with set()."""
+        self._ints.append(0)
+        return len(self._ints)-1
+
+    def set(self, pos, num):
+        """Fills in a placeholder from reserve()."""
+        self._ints[pos] = num
+
+    def tell(self):
+        """Returns the position the next integer will be added at."""
+        return len(self._ints)
+
+    def write(self):
+        """Writes the sidecar out. Failing to write it is not an error, the
+        text file is still there, so it is just logged.
+        """
+        if not LSCache.ENABLED: return False
+        cpath = LSCache.getPath(self._path)
+        tmppath = cpath+".tmp"
+        try:
+            stat = os.stat(self._path)
+            strs = list(self._strs.keys())
+            lens = array("I", [len(s) for s in strs])
+            blob = "".join(strs).encode("utf-8", "surrogatepass")
+            ints = self._ints
+            if sys.byteorder != "little":
+                lens = array("I", lens); lens.byteswap()
+                ints = array("i", ints); ints.byteswap()
+            with open(tmppath, "wb") as f:
+                f.write(LSCache.HEADER.pack(LSCache.MAGIC, LSCache.VERSION,
+                                            self._kind, stat.st_size,
+                                            stat.st_mtime_ns, len(strs),
+                                            len(blob), len(ints)))
+                f.write(lens.tobytes())
+                f.write(blob)
+                f.write(ints.tobytes())
+            os.replace(tmppath, cpath)
+            return True
+        except Exception as e:
+            logging.debug("Could not write cache for %s: %s"%(self._path, e))
+            try: os.remove(tmppath)
+            except OSError: pass
+            return False
+
+
+class LSCacheReader( LSCache ):
+    """Reads a sidecar back in. Use the static read() to get one, as it
+    returns None if the sidecar is missing, stale, or not what we expected.
+    """
+    def __init__(self, strs, ints):
+        self._strs = strs
+        self._ints = ints
+
+    @staticmethod
+    def read(path, kind):
+        """Reads the sidecar of the text file given if it is usable."""
+        if not LSCache.ENABLED: return None
+        cpath = LSCache.getPath(path)
+        try:
+            stat = os.stat(path)
+            with open(cpath, "rb") as f:
+                data = f.read()
+        except OSError: return None
+        try:
+            magic, version, ckind, size, mtime, nstrs, nblob, nints = \
+                                    LSCache.HEADER.unpack_from(data, 0)
+            if magic != LSCache.MAGIC or version != LSCache.VERSION or \
+               ckind != kind: return None
+            if size != stat.st_size or mtime != stat.st_mtime_ns: return None
+
+            pos = LSCache.HEADER.size
+            lens = array("I"); lens.frombytes(data[pos:pos+4*nstrs]); pos+=4*nstrs
+            blob = data[pos:pos+nblob].decode("utf-8", "surrogatepass"); pos+=nblob
+            ints = array("i"); ints.frombytes(data[pos:pos+4*nints])
+            if sys.byteorder != "little":
+                lens.byteswap(); ints.byteswap()
+            if len(ints) != nints: return None
+            ends = list(accumulate(lens))
+            strs = [blob[e-l:e] for e,l in zip(ends, lens)]
+            return LSCacheReader(strs, ints)
+        except Exception as e:
+            logging.debug("Ignoring unreadable cache for %s: %s"%(path, e))
+            return None
+
+    def getString(self, idx):
+        """Returns the string at the index or None if it was None."""
+        if idx < 0: return None
+        return self._strs[idx]
+
+
+class LSCSVCache():
+    """The layout of a CSV file (LSCSV) inside of a sidecar. The integers are:
+
+        ncols, header..., nsections, (name, start, nrows)..., rows...
+
+    Where 'start' is the index in the integer array of the first row of the
+    section and every row is 'ncols' string indexes. Files without sections
+    have one section with a None name.
+    """
+    @staticmethod
+    def write(path, kind, header, sections):
+        """Writes the header and the sections (list of (name, rows)) to the
+        sidecar for path. All rows must be the length of the header and are
+        stored the way the csv module would write them."""
+        # LSCSV.readSection() can't see an empty section at the end.
+        if len(sections) > 0 and len(sections[-1][1]) == 0: sections = sections[:-1]
+        w = LSCacheWriter(path, kind)
+        ncols = len(header)
+        w.add(ncols)
+        for col in header: w.addString(col)
+        w.add(len(sections))
+        starts = []
+        for name, rows in sections:
+            w.addString(name)
+            starts.append( w.reserve() )
+            w.add(len(rows))
+        for (_, rows), pos in zip(sections, starts):
+            w.set(pos, w.tell())
+            for row in rows:
+                if len(row) != ncols: return False
+                for col in row: w.addString('' if col is None else str(col))
+        return w.write()
+
+    @staticmethod
+    def read(path, kind):
+        """Returns an LSCSVCache for path, or None if there isn't a usable
+        sidecar."""
+        reader = LSCacheReader.read(path, kind)
+        if reader is None: return None
+        try: return LSCSVCache(reader)
+        except IndexError: return None
+
+    def __init__(self, reader):
+        self.__reader = reader
+        ints = reader._ints
+        ncols = ints[0]
+        self.header = [reader.getString(i) for i in ints[1:1+ncols]]
+        self.__sections = []
+        pos = 1+ncols
+        for _ in range(ints[pos]):
+            name, start, nrows = ints[pos+1:pos+4]
+            self.__sections.append( (reader.getString(name), start, nrows) )
+            pos+=3
+        if len(self.__sections) > 0:
+            _, start, nrows = self.__sections[-1]
+            if start+nrows*ncols > len(ints): raise IndexError()
+
+    def getSectionNames(self):
+        """The names of every section in the order they were written."""
+        return [name for name,_,_ in self.__sections]
+
+    def getSection(self, index):
+        """Gets the rows of a section based on its index."""
+        _, start, nrows = self.__sections[index]
+        ncols, ints, strs = len(self.header), self.__reader._ints, self.__reader._strs
+        rows = []
+        for r in range(start, start+nrows*ncols, ncols):
+            rows.append( [strs[i] if i >= 0 else None for i in ints[r:r+ncols]] )
+        return rows
+
+    def readSection(self):
+        """Same as LSCSV.readSection(), yields the name and rows of each."""
+        for index in range(len(self.__sections)):
+            yield self.__sections[index][0], self.getSection(index)
+
+
+class LSXMLCache():
+    """The layout of a menu file (or system menu file) inside a sidecar. The
+    integers are:
+
+        nprojects, (name, start)..., projects...
+
+    Where each project is: nmenus, (id, nnodes, nodes...)... and each node
+    is: tag, id, idn, order, ntitles, (langcode, text)..., nchildren, nodes...
+    Project level files have one project with a None name. Nodes are read
+    back as tuples: (tag, id, idn, order, [(langcode, text)], [children]).
+    """
+    @staticmethod
+    def write(path, kind, projects):
+        """Writes the projects, a list of (name, [MENU Elements]), to the
+        sidecar for path."""
+        w = LSCacheWriter(path, kind)
+        w.add(len(projects))
+        starts = []
+        for name, _ in projects:
+            w.addString(name)
+            starts.append( w.reserve() )
+        for (_, menus), pos in zip(projects, starts):
+            w.set(pos, w.tell())
+            w.add(len(menus))
+            for menu in menus:
+                w.addString(menu.attrib.get("id"))
+                LSXMLCache.__writeNodes(w, list(menu))
+        return w.write()
+
+    @staticmethod
+    def __writeNodes(w, elems):
+        elems = [e for e in elems if e.tag != "TITLE"]
+        w.add(len(elems))
+        for elem in elems:
+            w.addString(elem.tag)
+            w.addString(elem.attrib.get("id"))
+            w.addString(elem.attrib.get("idn"))
+            w.addString(elem.attrib.get("order"))
+            titles = elem.findall("TITLE")
+            w.add(len(titles))
+            for title in titles:
+                w.addString(title.attrib.get("langcode"))
+                w.addString(title.text or "")
+            LSXMLCache.__writeNodes(w, list(elem))
+
+    @staticmethod
+    def read(path, kind):
+        """Returns an LSXMLCache for path, or None if there isn't a usable
+        sidecar."""
+        reader = LSCacheReader.read(path, kind)
+        if reader is None: return None
+        try: return LSXMLCache(reader)
+        except IndexError: return None
+
+    def __init__(self, reader):
+        self.__reader = reader
+        ints = reader._ints
+        self.__projects = []
+        for i in range(ints[0]):
+            name, start = ints[1+2*i:3+2*i]
+            if start >= len(ints): raise IndexError()
+            self.__projects.append( (reader.getString(name), start) )
+
+    def getProjectNames(self):
+        """The names of every project in the order they were written."""
+        return [name for name,_ in self.__projects]
+
+    def getProject(self, index):
+        """Returns the list of menus for the project as (id, [nodes])."""
+        self.__pos = self.__projects[index][1]
+        menus = []
+        for _ in range(self.__next()):
+            id = self.__nextString()
+            menus.append( (id, self.__readNodes()) )
+        return menus
+
+    def __next(self):
+        self.__pos+=1
+        return self.__reader._ints[self.__pos-1]
+
+    def __nextString(self):
+        return self.__reader.getString(self.__next())
+
+    def __readNodes(self):
+        nodes = []
+        for _ in range(self.__next()):
+            tag, id, idn, order = [self.__nextString() for _ in range(4)]
+            titles = [(self.__nextString(), self.__nextString())
+                                            for _ in range(self.__next())]
+            nodes.append( (tag, id, idn, order, titles, self.__readNodes()) )
+        return nodes
@@ -21,8 +21,10 @@ LATER:
  *Finished
  ?Don't know if helpful
 """
+import io
 import re
 import csv
+import locale
 
 class LSCSV( ):
     """A LiVSs CSV file is a normal CSV with some added features. It can
@@ -66,6 +68,52 @@ class LSCSV( ):
             if listen: lines.append( row )
         if len(lines) > 0: yield name, lines
         
+    def indexSections(self, startRow=0, path=None):
+        """Walks the file without parsing it and yields the location of each
+        section as (name, start, dataStart, end), where these are the byte
+        offsets of the header line, the first line in the section, and the
+        end of the section. Pass the data offsets to readSectionAt() to get
+        the lines of the section back out. `path` defaults to this file.
+        """
+        name, start, dataStart = None, 0, 0
+        with open(self._path if path is None else path, 'rb') as f:
+            count, offset, record, quoted = 0, 0, b"", False
+            for line in f:
+                # a record can span lines if there is a newline within quotes
+                if not quoted: recstart, record = offset, b""
+                record += line
+                offset += len(line)
+                if line.count(b'"') % 2 == 1: quoted = not quoted
+                if quoted: continue
+                count+=1
+                if count <= startRow or not record.startswith(b'['): continue
+                row = next(csv.reader([self.__decode(record).rstrip("\r\n")]), [])
+                if not self.__isHeader(row): continue
+                if name is not None: yield name, start, dataStart, recstart
+                name, start, dataStart = row[0][1:-1], recstart, offset
+            if name is not None: yield name, start, dataStart, offset
+            
+    def readSectionAt(self, dataStart, end, path=None):
+        """Reads the lines of a section given its location from indexSections().
+        """
+        with open(self._path if path is None else path, 'rb') as f:
+            f.seek(dataStart)
+            data = self.__decode(f.read(end - dataStart))
+        try: return [row for row in csv.reader(io.StringIO(data, newline=''), delimiter=',', quotechar='"')]
+        except csv.Error: return [] #explicit catch, remove NULL bytes
+        
+    def __decode(self, data):
+        """Decodes raw bytes the same way open() would have."""
+        return data.decode(locale.getpreferredencoding(False))
+    
+    def encodeLines(self, lines):
+        """Returns the bytes that writeLines() would have put in the file for
+        the given lines, so they can be spliced into an existing file.
+        """
+        buf = io.StringIO(newline='')
+        csv.writer(buf).writerows(lines)
+        return buf.getvalue().encode(locale.getpreferredencoding(False))
+        
     def writeLine(self, line, writer=None):
         """Writes a line to the excel style csv.
         """
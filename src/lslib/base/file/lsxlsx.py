@@ -0,0 +1,454 @@
+#
+# Author: Alexander Dean <dstar@csh.rit.edu>
+# Copyright (c) 2011, RailComm LLC
+# All rights reserved. Redistribution and use in source and binary forms, with
+# or without modification are permitted provided that the conditions are met
+# under the Modified BSD License.
+#
+"""The old Excel format (BIFF8, .xls) that xlwt3 writes can only have 65,536
+rows in a sheet, and the whole file is built in memory before it is written.
+Translation files for a big system can get close to that. The newer format
+(Office Open XML, .xlsx) doesn't have that problem and is just a zip file
+full of XML, so we can write it ourselves with the standard library.
+
+An xlsx file written here has the following parts:
+                    [Content_Types].xml
+                    _rels/.rels
+                    xl/workbook.xml
+                    xl/_rels/workbook.xml.rels
+                    xl/styles.xml
+                    xl/sharedStrings.xml
+                    xl/worksheets/sheet1.xml ... sheetN.xml
+
+Sheets - Rows are written out to a temporary file as they are given to us,
+        so no matter how many rows there are only one is in memory at a time.
+        When the sheet is done it is copied into the zip file after its header
+        (which needs to know how big the sheet ended up being).
+
+Shared Strings - Every string cell refers to its string by an index into one
+        table for the whole workbook, so each unique string is only stored
+        once. This table is the only thing kept in memory, and is written
+        out last.
+
+Styles - Only the few that translation files use, see XLSXStyle.
+
+Reading them back in is done with XLSXReader, which works on any xlsx file
+(not just ones we wrote) and also streams the rows of a sheet out one at a
+time. Only the shared strings are kept in memory.
+"""
+import re
+import shutil
+import zipfile
+import tempfile
+import posixpath
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+XLSX_EXT = ".xlsx"
+XLSX_SIGNATURE = b"PK\x03\x04" # it's a zip file.
+
+def isXLSXFile( path ):
+    """Checks the start of a file to see if it is an xlsx (zip) file rather
+    than an old xls one."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(XLSX_SIGNATURE)) == XLSX_SIGNATURE
+    except OSError: return False
+
+class XLSXStyle:
+    """The cell styles that can be written, they are the index of the style
+    in styles.xml. NORMAL is the default, HEADER is bold and centered (like
+    a heading should be), and CONFLICT is filled in red.
+    """
+    NORMAL, HEADER, CONFLICT = range(3)
+
+
+class XLSXWorkbook():
+    """Writes an xlsx file a sheet at a time. Make sheets with addSheet(),
+    write rows to them, and then close() the workbook to finish the file.
+    Nothing is usable until close() is called.
+    """
+    NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    RELATIONS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    PACKAGE   = "http://schemas.openxmlformats.org/package/2006/relationships"
+    CONTENT   = "http://schemas.openxmlformats.org/package/2006/content-types"
+    MAIN_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    MAX_SHEETNAME = 31
+    DATE_TIME = (1980,1,1,0,0,0) # every part gets the same time, so the same 
+                                 # rows always give the same file.
+
+    def __init__(self, path):
+        self.__path = path
+        self.__zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.__sheets  = [] # [XLSXSheet]
+        self.__strings = {} # string -> index in sharedStrings.xml
+        self.__refs    = 0  # number of string cells, for sharedStrings.xml
+
+    def addSheet(self, name, frozenRows=0, hiddenCols=None):
+        """Adds a new sheet to the end of the workbook and returns it. The
+        first `frozenRows` rows will stay put when scrolling and the columns
+        (0 based) in `hiddenCols` are hidden.
+        """
+        sheet = XLSXSheet(self, name[:XLSXWorkbook.MAX_SHEETNAME],
+                          len(self.__sheets)+1, frozenRows, hiddenCols)
+        self.__sheets.append( sheet )
+        return sheet
+
+    def close(self):
+        """Finishes off any sheets still open and writes the rest of the
+        parts of the file."""
+        try:
+            for sheet in self.__sheets: sheet.close()
+            self.__zip.writestr(self.__part("[Content_Types].xml"), self.__contentTypes())
+            self.__zip.writestr(self.__part("_rels/.rels"), self.__packageRels())
+            self.__zip.writestr(self.__part("xl/workbook.xml"), self.__workbook())
+            self.__zip.writestr(self.__part("xl/_rels/workbook.xml.rels"), self.__workbookRels())
+            self.__zip.writestr(self.__part("xl/styles.xml"), XLSXWorkbook.STYLES)
+            self.__writeSharedStrings()
+        finally: self.__zip.close()
+
+    def _intern(self, s):
+        ### Gets the shared string index for a string cell.
+        self.__refs+=1
+        idx = self.__strings.get(s)
+        if idx is None:
+            idx = self.__strings[s] = len(self.__strings)
+        return idx
+
+    def _writeSheet(self, sheet, head, body, tail):
+        ### Puts a finished sheet into the zip, the body is a file.
+        with self.__zip.open(self.__part("xl/worksheets/sheet%d.xml"%sheet.num), 'w') as part:
+            part.write(head)
+            shutil.copyfileobj(body, part, 1<<20)
+            part.write(tail)
+
+    def __part(self, name):
+        info = zipfile.ZipInfo(name, XLSXWorkbook.DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def __writeSharedStrings(self):
+        with self.__zip.open(self.__part("xl/sharedStrings.xml"), 'w') as part:
+            part.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        '<sst xmlns="%s" count="%d" uniqueCount="%d">'%(
+                        XLSXWorkbook.NAMESPACE, self.__refs, len(self.__strings))).encode("utf-8"))
+            chunk = []
+            for s in self.__strings:
+                chunk.append('<si><t xml:space="preserve">%s</t></si>'%escapeText(s))
+                if len(chunk) >= 1024:
+                    part.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+            chunk.append('</sst>')
+            part.write("".join(chunk).encode("utf-8"))
+
+    def __contentTypes(self):
+        sheets = "".join('<Override PartName="/xl/worksheets/sheet%d.xml" '
+                         'ContentType="%s.worksheet+xml"/>'%(s.num, XLSXWorkbook.MAIN_TYPE)
+                         for s in self.__sheets)
+        return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Types xmlns="%(ns)s">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/xl/workbook.xml" ContentType="%(main)s.sheet.main+xml"/>'
+                '<Override PartName="/xl/styles.xml" ContentType="%(main)s.styles+xml"/>'
+                '<Override PartName="/xl/sharedStrings.xml" ContentType="%(main)s.sharedStrings+xml"/>'
+                '%(sheets)s</Types>')%{ 'ns':XLSXWorkbook.CONTENT,
+                                        'main':XLSXWorkbook.MAIN_TYPE,
+                                        'sheets':sheets }
+
+    def __packageRels(self):
+        return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="%s">'
+                '<Relationship Id="rId1" Type="%s/officeDocument" Target="xl/workbook.xml"/>'
+                '</Relationships>')%(XLSXWorkbook.PACKAGE, XLSXWorkbook.RELATIONS)
+
+    def __workbook(self):
+        sheets = "".join('<sheet name=%s sheetId="%d" r:id="rId%d"/>'%(
+                                quoteattr(s.name), s.num, s.num) for s in self.__sheets)
+        return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<workbook xmlns="%s" xmlns:r="%s"><sheets>%s</sheets></workbook>')%(
+                XLSXWorkbook.NAMESPACE, XLSXWorkbook.RELATIONS, sheets)
+
+    def __workbookRels(self):
+        rels = ['<Relationship Id="rId%d" Type="%s/worksheet" Target="worksheets/sheet%d.xml"/>'%(
+                                s.num, XLSXWorkbook.RELATIONS, s.num) for s in self.__sheets]
+        num = len(self.__sheets)
+        rels.append('<Relationship Id="rId%d" Type="%s/styles" Target="styles.xml"/>'%(
+                                num+1, XLSXWorkbook.RELATIONS))
+        rels.append('<Relationship Id="rId%d" Type="%s/sharedStrings" Target="sharedStrings.xml"/>'%(
+                                num+2, XLSXWorkbook.RELATIONS))
+        return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="%s">%s</Relationships>')%(
+                XLSXWorkbook.PACKAGE, "".join(rels))
+
+    # The cellXfs are in the same order as XLSXStyle.
+    STYLES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+              '<fonts count="2"><font><sz val="10"/><name val="Arial"/></font>'
+              '<font><b/><sz val="10"/><name val="Arial"/></font></fonts>'
+              '<fills count="3"><fill><patternFill patternType="none"/></fill>'
+              '<fill><patternFill patternType="gray125"/></fill>'
+              '<fill><patternFill patternType="solid"><fgColor rgb="FFFF0000"/>'
+              '<bgColor indexed="64"/></patternFill></fill></fills>'
+              '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+              '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+              '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+              '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+              '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+              '<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/></cellXfs>'
+              '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+              '</styleSheet>')
+
+
+class XLSXSheet():
+    """A sheet in an XLSXWorkbook, rows are added to the end of it with
+    writeRow(). Get one from XLSXWorkbook.addSheet().
+    """
+    BUFFER_ROWS = 512 # rows to hold on to before writing them out.
+
+    def __init__(self, workbook, name, num, frozenRows=0, hiddenCols=None):
+        self.__workbook = workbook
+        self.name = name
+        self.num  = num
+        self.__frozen = frozenRows
+        self.__hidden = sorted(set(hiddenCols or []))
+        self.__body = tempfile.TemporaryFile()
+        self.__rows = []
+        self.__nrows, self.__ncols = 0, 0
+
+    def writeRow(self, values, style=XLSXStyle.NORMAL):
+        """Writes a list of values as the next row. Strings are stored as
+        shared strings and numbers as numbers, anything else is str()'d. None
+        leaves the cell empty. `style` is one of XLSXStyle."""
+        self.__nrows+=1
+        rownum = self.__nrows
+        attr = ' s="%d"'%style if style != XLSXStyle.NORMAL else ''
+        cells = []
+        for col, val in enumerate(values):
+            ref = "%s%d"%(columnName(col), rownum)
+            if val is None: continue
+            elif type(val) is str:
+                if val == '':
+                    if attr: cells.append('<c r="%s"%s/>'%(ref, attr))
+                    continue
+                cells.append('<c r="%s"%s t="s"><v>%d</v></c>'%(ref, attr,
+                                                self.__workbook._intern(val)))
+            elif type(val) in (int, float):
+                cells.append('<c r="%s"%s><v>%r</v></c>'%(ref, attr, val))
+            else:
+                cells.append('<c r="%s"%s t="s"><v>%d</v></c>'%(ref, attr,
+                                                self.__workbook._intern(str(val))))
+        self.__ncols = max(self.__ncols, len(values))
+        self.__rows.append('<row r="%d">%s</row>'%(rownum, "".join(cells)))
+        if len(self.__rows) >= XLSXSheet.BUFFER_ROWS: self.__flush()
+
+    def close(self):
+        """Finishes the sheet, no more rows can be written to it."""
+        if self.__body is None: return
+        self.__flush()
+        self.__body.seek(0)
+        try: self.__workbook._writeSheet(self, self.__head(), self.__body,
+                                         b'</sheetData></worksheet>')
+        finally:
+            self.__body.close()
+            self.__body = None
+
+    def __flush(self):
+        if len(self.__rows) == 0: return
+        self.__body.write( "".join(self.__rows).encode("utf-8") )
+        self.__rows = []
+
+    def __head(self):
+        if self.__nrows == 0: dimension = "A1"
+        else: dimension = "A1:%s%d"%(columnName(max(self.__ncols,1)-1), self.__nrows)
+        head = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+                '<worksheet xmlns="%s" xmlns:r="%s">'%(XLSXWorkbook.NAMESPACE,
+                                                       XLSXWorkbook.RELATIONS),
+                '<dimension ref="%s"/>'%dimension]
+        if self.__frozen > 0:
+            cell = "A%d"%(self.__frozen+1)
+            head.append('<sheetViews><sheetView workbookViewId="0">'
+                        '<pane ySplit="%d" topLeftCell="%s" activePane="bottomLeft" state="frozen"/>'
+                        '<selection pane="bottomLeft" activeCell="%s" sqref="%s"/>'
+                        '</sheetView></sheetViews>'%(self.__frozen, cell, cell, cell))
+        head.append('<sheetFormatPr defaultRowHeight="12.75"/>')
+        if len(self.__hidden) > 0:
+            head.append('<cols>')
+            for col in self.__hidden:
+                head.append('<col min="%d" max="%d" width="0" hidden="1" customWidth="1"/>'%(col+1, col+1))
+            head.append('</cols>')
+        head.append('<sheetData>')
+        return "".join(head).encode("utf-8")
+
+
+class XLSXReader():
+    """Reads the sheets of an xlsx file a row at a time. The rows come out
+    the same way xlrd gives them, every row is as wide as the sheet, strings 
+    are strings, numbers are floats and empty cells are ''. 
+    """
+    NS = "{%s}"%XLSXWorkbook.NAMESPACE
+    RELS_NS = "{%s}"%XLSXWorkbook.PACKAGE
+    ID_ATTR = "{%s}id"%XLSXWorkbook.RELATIONS
+    
+    def __init__(self, path):
+        self.__path = path
+        self.__zip = zipfile.ZipFile(path, 'r')
+        try:
+            self.__rels    = self.__readRels("xl/_rels/workbook.xml.rels")
+            self.__sheets  = self.__readSheetPaths() # [(name, part)]
+            self.__strings = self.__readSharedStrings()
+        except:
+            self.__zip.close()
+            raise
+    
+    def sheetNames(self):
+        """The names of all the sheets in the workbook, in order."""
+        return [name for name,_ in self.__sheets]
+    
+    def readSheet(self, name, rowstart=0):
+        """Yields the rows of the sheet by name, starting at `rowstart` (0 
+        based). Raises a KeyError if the sheet doesn't exist."""
+        parts = [part for sname, part in self.__sheets if sname == name]
+        if len(parts) == 0: raise KeyError("No sheet named: %s"%name)
+        ns = XLSXReader.NS
+        ncols, nextrow = 0, 0
+        sheetData = None
+        with self.__zip.open(parts[0]) as part:
+            for event, elem in ET.iterparse(part, events=('start','end')):
+                if event == 'start':
+                    if elem.tag == ns+'sheetData': sheetData = elem
+                    continue
+                if elem.tag == ns+'dimension':
+                    ncols = _dimensionWidth( elem.get('ref', '') )
+                elif elem.tag == ns+'row':
+                    rownum = int(elem.get('r', nextrow+1))-1
+                    row = self.__readRow( elem )
+                    ncols = max(ncols, len(row))
+                    # rows with nothing in them aren't in the file at all.
+                    for blank in range(max(nextrow, rowstart), rownum):
+                        yield ['']*ncols
+                    nextrow = rownum+1
+                    if sheetData is not None: sheetData.clear()
+                    if rownum < rowstart: continue
+                    yield row + ['']*(ncols-len(row))
+        
+    def close(self):
+        """Closes the file, nothing can be read after this."""
+        self.__zip.close()
+    
+    def __readRow(self, rowelem):
+        ### The values of a <row>, by column.
+        ns = XLSXReader.NS
+        row = []
+        for cell in rowelem.iter(ns+'c'):
+            ref = cell.get('r')
+            col = len(row) if ref is None else columnNumber( ref )
+            if col > len(row): row.extend( ['']*(col-len(row)) )
+            kind = cell.get('t', 'n')
+            if kind == 'inlineStr':
+                inline = cell.find(ns+'is')
+                row.append( '' if inline is None else self.__text(inline) )
+                continue
+            value = cell.findtext(ns+'v')
+            if value is None: row.append('')
+            elif kind == 's': row.append( self.__strings[int(value)] )
+            elif kind == 'n':
+                try: row.append( float(value) )
+                except ValueError: row.append( value )
+            elif kind == 'str': row.append( unescapeText(value) )
+            elif kind == 'b': row.append( str(int(value == '1')) )
+            else: row.append( value ) # errors and dates
+        return row
+    
+    def __text(self, elem):
+        ### The text of a shared or inline string, which is either one <t>
+        ### or a few runs of them (but not the phonetic ones).
+        ns = XLSXReader.NS
+        t = elem.find(ns+'t')
+        if t is not None: return unescapeText( t.text or '' )
+        return unescapeText( "".join(r.findtext(ns+'t') or '' for r in elem.findall(ns+'r')) )
+    
+    def __readSharedStrings(self):
+        ### All of the shared strings, in order.
+        path = self.__findPart("sharedStrings")
+        if path is None: return []
+        strings, root = [], None
+        with self.__zip.open(path) as part:
+            for event, elem in ET.iterparse(part, events=('start','end')):
+                if event == 'start':
+                    if root is None: root = elem
+                elif elem.tag == XLSXReader.NS+'si':
+                    strings.append( self.__text(elem) )
+                    root.clear()
+        return strings
+    
+    def __readSheetPaths(self):
+        ### The names of the sheets and what part each of them is in.
+        workbook = ET.fromstring( self.__zip.read("xl/workbook.xml") )
+        sheets = []
+        for sheet in workbook.iter(XLSXReader.NS+'sheet'):
+            rel = self.__rels.get( sheet.get(XLSXReader.ID_ATTR) )
+            if rel is not None: sheets.append( (sheet.get('name'), rel[1]) )
+        return sheets
+    
+    def __findPart(self, kind):
+        ### The part for the relationship type that ends with `kind`.
+        for rtype, target in self.__rels.values():
+            if rtype.endswith("/"+kind): return target
+        return None
+    
+    def __readRels(self, path):
+        ### Relationship id -> (type, part path).
+        rels = {}
+        root = ET.fromstring( self.__zip.read(path) )
+        for rel in root.iter(XLSXReader.RELS_NS+'Relationship'):
+            target = rel.get('Target', '')
+            if target.startswith('/'): target = target[1:]
+            else: target = posixpath.normpath( posixpath.join("xl", target) )
+            rels[rel.get('Id')] = (rel.get('Type', ''), target)
+        return rels
+
+
+## Column names, A, B, ... Z, AA, AB, ...
+_COLUMNS = {}
+def columnName( col ):
+    """Gets the letters for a column (0 based)."""
+    name = _COLUMNS.get(col)
+    if name is None:
+        num, name = col+1, ''
+        while num > 0:
+            num, rem = divmod(num-1, 26)
+            name = chr(ord('A')+rem)+name
+        _COLUMNS[col] = name
+    return name
+
+def columnNumber( ref ):
+    """Gets the column (0 based) out of a cell reference like 'AB12'."""
+    num = 0
+    for c in ref:
+        if 'A' <= c <= 'Z': num = num*26 + ord(c)-ord('A')+1
+        elif 'a' <= c <= 'z': num = num*26 + ord(c)-ord('a')+1
+        else: break
+    return num-1
+
+def _dimensionWidth( ref ):
+    ### The number of columns in a <dimension ref="A1:D20"/>.
+    last = ref.split(':')[-1]
+    if last == '': return 0
+    return columnNumber( last )+1
+
+## Characters XML can't hold, and CR which the parsers turn into LF, are
+## written as _xHHHH_, so a real _xHHHH_ in a string has to have its
+## underscore escaped too (as _x005F_).
+BadXMLChars = re.compile("[\x00-\x08\x0b-\x1f\ufffe\uffff]|_(?=x[0-9A-Fa-f]{4}_)")
+def escapeText( s ):
+    """Escapes a string to be put in a <t> element."""
+    s = BadXMLChars.sub(lambda m: "_x%04X_"%ord(m.group(0)), s)
+    return escape(s)
+
+EscapedXMLChar = re.compile("_x([0-9A-Fa-f]{4})_")
+def unescapeText( s ):
+    """Undoes the _xHHHH_ escapes of escapeText (the XML ones are done by
+    the parser)."""
+    if '_x' not in s: return s
+    return EscapedXMLChar.sub(lambda m: chr(int(m.group(1), 16)), s)
@@ -42,6 +42,7 @@ To see how this is parsed into this object. Check out MenuFile.py or
 rcsfile.py in lslib.base.file.utility.
 """
 
+import uuid
 import xml.etree.ElementTree as ET
 from lslib.base.file.msrcobj.msobjbase import * #@UnusedWildImport
 
@@ -52,10 +53,18 @@ class RCMenu:
     The reason it has no 'loading' functions is because it discourages 
     runtime loading in places other than file interactions. So go look at
     MenuFile.py.
+    
+    The `source` is what the menu was read from (like the language code of
+    the resource), it keeps the idns made for two copies of the same menu
+    apart so they still have to be matched up by what is in them.
     """
-    def __init__(self, id):
+    IDN_NAMESPACE = uuid.UUID("5a1c6b8e-0f3d-4e2a-9b47-6d2c81e0f4a3")
+    
+    def __init__(self, id, source=None):
         self.id = id
         self._nodes = []
+        self.__source = source
+        self.__idns = set() # idns made so far, see getNewIDN()
          
     def addChild(self, node):
         """ Utility function to make RCMenu seem like a RCMenuNode. """
@@ -222,14 +231,23 @@ class RCMenu:
             val = max(val, node.maxSize(langcode))
         return val+1#adjustment made by msvs 
     
-    def getNewIDN(self):
+    def getNewIDN(self, node=None):
         """In order to keep things lined up we need to be able to reference idn's between 
         instances of RCMenus. This is so we can check between different language codes.
         (ie, if we have two RCMenus for the same menu but one in spanish and another in 
         english. All of the concurrent nodes will need to match.)
+        
+        The idn is made out of where the `node` is in the menu (its type and
+        order), so reading the same menu twice gives back the same idns.
         """
-        import uuid #standard win uuid creation.
-        return uuid.uuid4()
+        base = "%s/%s/%s"%(self.id, self.__source, "" if node is None else 
+                                                   "%d.%d"%(node.type, node.orderid))
+        idn, count = uuid.uuid5(RCMenu.IDN_NAMESPACE, base), 0
+        while idn in self.__idns:
+            count += 1
+            idn = uuid.uuid5(RCMenu.IDN_NAMESPACE, "%s#%d"%(base, count))
+        self.__idns.add(idn)
+        return idn
 
 
 ###############################################################################
@@ -272,7 +290,7 @@ class RCMenuNode:
         self.__menuref = menuref
         self._parent   = None
         self._children = []
-        self.orderid   = 0 if order is None else order
+        self.orderid   = 0 if order is None else int(order) # files give us strings.
         self.idn       = idn
         self.value     = RCStringValue( id )
         self.type      = type
@@ -517,5 +535,5 @@ class RCMenuNode:
     def __validateIDN(self):
         if self.type != RCMenuNodeType.MENUITEM:
             if self.idn is None:
-                self.idn = self.__menuref.getNewIDN()
+                self.idn = self.__menuref.getNewIDN( self )
         
\ No newline at end of file
@@ -131,7 +131,7 @@ class RCSFile:
             # Quick double check we are in the right place before parsing further.
             if MENU_MATCHER2.search(line) is None: continue
     
-            menu = RCMenu( line[:line.index(" ")] ) # grab id and make menu obj
+            menu = RCMenu( line[:line.index(" ")], self._langcode ) # grab id and make menu obj
             
             # OK now we can start reading and parsing!
             inPopup = False
@@ -420,9 +420,29 @@ class RCSFile:
         return buffer
     
     def __saveBuffer(self, buffer):
+        ### Only writes the file if something in it changed, so the time it 
+        ### was modified isn't bumped (and Visual Studio doesn't rebuild it).
+        ### @return: the number of lines that changed.
+        changed = self.changedLines( buffer )
+        if changed == 0:
+            logging.debug("Nothing changed in %s, it was not saved."%self._path)
+            return 0
         with open(self._path, 'w') as rcs:
             for _, line in sorted(buffer.items(),key=(lambda x: x[0])):
                 rcs.write( line )
+        return changed
+    
+    def changedLines(self, buffer):
+        """Counts the lines in the buffer (from one of the updates) that are 
+        different from what is in the file right now. If the file isn't there
+        every line is counted.
+        """
+        lines = [ line for _, line in sorted(buffer.items(),key=(lambda x: x[0])) ]
+        try:
+            with open(self._path, 'r') as rcs: old = rcs.readlines()
+        except IOError: return len(lines)
+        changed = sum( 1 for new, cur in zip(lines, old) if new != cur )
+        return changed + abs(len(lines) - len(old))
     
     
     def updateMenus(self, menuFile, preloaded=True, save=True, retBuffer=True, buffer=None, smartOverlap=True):
@@ -728,16 +748,186 @@ class RCSFile:
                     
         if save: self.__saveBuffer( myBuff )
         if retBuffer: return myBuff
-        
-        
+
+    def updateFromLookup(self, lookup, save=True, retBuffer=True, buffer=None):
+        """Updates the menus, dialogs and string tables in this RCS file from
+        a TranslationLookup (see TranslationFile.getLookups()) in one pass
+        over the file. Values are found by their ids instead of searching
+        through the utility files, and only what is between the quotes of
+        each line is changed.
+        """
+        myBuff = buffer
+        if myBuff is None: myBuff = self.__readIntoBuffer()
+
+        linenum = 0
+        while linenum < len(myBuff):
+            line = myBuff[linenum]
+            if MENU_MATCHER.search(line) is not None:
+                linenum = self.__lookupMenu(myBuff, linenum, lookup)
+            elif DIALOG_MATCHER.search(line) is not None:
+                linenum = self.__lookupDialog(myBuff, linenum, lookup)
+            elif STRTBL_MATCHER.search(line) is not None:
+                linenum = self.__lookupStringTable(myBuff, linenum, lookup)
+            linenum+=1
+
+        if save: self.__saveBuffer( myBuff )
+        if retBuffer: return myBuff
+
+    def __lookupValue(self, lookup, kind, container, id):
+        ### The value for this file's language code, or the default one's
+        ### if it doesn't have one.
+        val = lookup.getValue(kind, container, id, self._langcode)
+        if val is None or val == '':
+            val = lookup.getValue(kind, container, id, self._defaultLangcode)
+        return val
+
+    def __missing(self, lookup, message):
+        ### Logs something in this file that the lookup doesn't have. A 
+        ### partial lookup leaves most things out on purpose.
+        if lookup.isPartial(): logging.debug(message)
+        else: logging.warning(message)
+
+    def __replaceValue(self, buffer, linenum, val):
+        line = buffer[linenum]
+        buffer[linenum] = '%s"%s"%s'%(line[:line.index('"')],
+                                      make_val_safe(val),
+                                      line[line.rindex('"')+1:])
+
+    def __lookupMenu(self, buffer, linenum, lookup):
+        ### Updates the menu that starts on `linenum`, returns the line it
+        ### ends on. The nodes are lined up with the menu's layout if it is
+        ### the same, otherwise they are found like in __smartMenuOverlap().
+        menuid = buffer[linenum][:buffer[linenum].index(" ")]
+        layout = lookup.getMenuLayout(menuid)
+
+        entries, depth = [], 1 # [(linenum, type, id, depth)]
+        linenum+=1
+        while linenum < len(buffer):
+            line = buffer[linenum]
+            if LAST_END_BLOCK_MATCHER.search(line) is not None: break
+            elif END_BLOCK_MATCH.search(line) is not None: depth-=1
+            elif line.lstrip().startswith("POPUP"):
+                typeid = RCMenuNodeType.POPUP if POPUP_MATCHER.search(line) is not None else None
+                entries.append( (linenum, typeid, None, depth) )
+                depth+=1
+            elif SEPARATOR_MATCHER.search(line) is not None:
+                entries.append( (linenum, RCMenuNodeType.SEPARATOR, None, depth) )
+            elif line.lstrip().startswith("MENUITEM"):
+                res = MENU_ITEM_MATCHER.search(line) or MENU_ITEM_MATCHER2.search(line)
+                if res is None and MENU_ITEM_2LINE.search(line) is not None \
+                               and linenum+1 < len(buffer):
+                    res = MENU_ITEM_MATCHER.search(line + buffer[linenum+1])
+                if res is None: entries.append( (linenum, None, None, depth) )
+                else: entries.append( (linenum, RCMenuNodeType.MENUITEM, res.groups()[1], depth) )
+            linenum+=1
+        if layout is None or not lookup.hasContainer('m', menuid): return linenum
+
+        def nodeid(xpath, typeid):
+            if typeid != RCMenuNodeType.MENUITEM: return None
+            return xpath.rsplit('.', 1)[-1]
+        found = {} # entry index -> xpath
+        if [ (t, i, d) for _, t, i, d in entries ] == \
+           [ (t, nodeid(x, t), d) for x, t, d in layout ]:
+            for num, (xpath, _, _) in enumerate(layout): found[num] = xpath
+        else:
+            self.__missing(lookup, "Menu Structure is different for %s! Finding items by their ids."%menuid)
+            items = {} # menuitem id -> xpath
+            for xpath, typeid, _ in reversed(layout):
+                if typeid == RCMenuNodeType.MENUITEM: items[nodeid(xpath, typeid)] = xpath
+            for num, (_, typeid, id, depth) in enumerate(entries):
+                if typeid == RCMenuNodeType.MENUITEM:
+                    if id in items: found[num] = items[id]
+                    else: self.__missing(lookup, "SmartOverlap: Couldn't find ID: %s, in %s."%(id, menuid))
+                elif typeid == RCMenuNodeType.POPUP:
+                    xpath = self.__guessPopup(entries, num, items)
+                    if xpath is not None: found[num] = xpath
+                    else: self.__missing(lookup, "SmartOverlap: Could not find the value for a popup menu in %s."%menuid)
+
+        for num, xpath in found.items():
+            val = self.__lookupValue(lookup, 'm', menuid, xpath)
+            if val is not None: self.__replaceValue(buffer, entries[num][0], val)
+        return linenum
+
+    def __guessPopup(self, entries, index, items):
+        ### Guesses the xpath of the popup at `index` by which popup the
+        ### menu items in it belong to, taking the most likely one.
+        depth, pids, count = entries[index][3], {}, 0
+        for _, typeid, id, itemdepth in entries[index+1:]:
+            if itemdepth <= depth: break
+            if typeid != RCMenuNodeType.MENUITEM or id not in items: continue
+            count+=1
+            parts = items[id].split('.')
+            if len(parts) <= itemdepth-depth: continue
+            pid = '.'.join( parts[:-(itemdepth-depth)] )
+            pids[pid] = pids.get(pid, 0) + 1
+        if len(pids) == 1: return list(pids.keys())[0]
+        factor = 2 if count > 2 else 1
+        pids = sorted([ p for p in pids.items() if p[1] > factor ], key=lambda x:x[1])
+        if len(pids) > 0: return pids[-1][0]
+        return None
+
+    def __lookupDialog(self, buffer, linenum, lookup):
+        ### Updates the dialog that starts on `linenum`, returns the line
+        ### it ends on.
+        did = buffer[linenum][:buffer[linenum].index(' DIALOGEX')]
+        if not lookup.hasContainer('d', did): return linenum
+
+        staticcount = 0
+        while True:
+            linenum+=1
+            if linenum >= len(buffer): break
+            line = buffer[linenum]
+            if END_BLOCK_MATCH.search(line) is not None: break
+            res = DIALOG_ENTITY_MATCHER.search(line)
+            if res is None: continue
+            oldval = '"%s",'%res.groups()[0]
+            # Statics are numbered by where they are in the dialog.
+            if DIALOG_STATIC_MATCHER.search(line) is not None:
+                id = "IDC_STATIC.%d"%staticcount
+                staticcount+=1
+            else: id = res.groups()[1]
+
+            newval = self.__lookupValue(lookup, 'd', did, id)
+            if newval is None:
+                self.__missing(lookup, "Could not find a value for %s in %s's dialog: %s"%(id,self._name,did))
+                continue
+            fst = line[:line.index('"')]
+            snd = line[len(fst+oldval):]
+            buffer[linenum] = '%s"%s",%s'%(fst,make_val_safe(newval),snd)
+        return linenum
+
+    def __lookupStringTable(self, buffer, linenum, lookup):
+        ### Updates the string table that starts on `linenum`, returns the
+        ### line it ends on.
+        linenum+=1 # skip the BEGIN
+        skip = not lookup.hasContainer('c', '')
+        while True:
+            linenum+=1
+            if linenum >= len(buffer): break
+            line = buffer[linenum]
+            if END_BLOCK_MATCH.search(line) is not None: break
+            if skip: continue
+            res = STRTBL_LINE_MATCHER.search(line) or STRTBL_2LINE_MATCHER.search(line)
+            if res is None: continue
+            newval = self.__lookupValue(lookup, 'c', '', res.groups()[0])
+            if newval is None:
+                self.__missing(lookup, "Could not find a value for %s in %s's string table"%(res.groups()[0],self._name))
+                continue
+            if STRTBL_LINE_MATCHER.search(line) is None: # the value is on the next line
+                linenum+=1
+                line = buffer[linenum]
+            buffer[linenum] = '%s"%s"\n'%(line[:line.index('"')],make_val_safe(newval))
+        return linenum
+
     def save(self, newpath, newbuffer=None):
         """ Saves a copy of the RCS file to a new location, or saves a new
-        buffered file to the new path instead.
+        buffered file to the new path instead. Returns the number of lines
+        that changed, nothing is written if that's 0.
         """
         if newbuffer is None:
             buff = self.__readIntoBuffer()
         else:
             buff = newbuffer
         self._path = newpath
-        self.__saveBuffer( buff )
+        return self.__saveBuffer( buff )
         
\ No newline at end of file
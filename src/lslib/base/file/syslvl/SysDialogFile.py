@@ -18,12 +18,16 @@ functions are provided via the BaseUtilityFileWrapper object. Any
 accessors can be pushed to a per-project level.
 """
 
+import csv
 import copy
+import logging
 from lslib.base.file.lscsv              import LSCSV
+from lslib.base.file.lscache            import LSCSVCache, LSCacheKind
 from lslib.base.file.msrcobj.dialogex   import RCDialog
 from lslib.base.file.utility.DialogFile import RCDialogFile, InMemDialog
 from lslib.base.file.msrcobj.msobjbase  import RCStringValue
 from lslib.base.file.syslvl.sysbase     import BaseUtilityFileWrapper, \
+                                               LazyProjectMap, \
                                                isSystemLevelDialog
 
 class SysDialogFile( BaseUtilityFileWrapper, LSCSV ):
@@ -38,31 +42,54 @@ class SysDialogFile( BaseUtilityFileWrapper, LSCSV ):
         self.setHasSections( True )
         self._projs = {} #map: "projName" -> [RCDialogs]
         
-    def load(self, newpath=None):
+    def load(self, newpath=None, lazy=False):
         if newpath is not None:
             if not isSystemLevelDialog( newpath ):
                 raise TypeError("Path given is not a system level dialog file.")
             else: self._path = newpath
-        self._projs = {}
-        offset = RCDialogFile.CONTROL_COLS
-        header = self.getHeader( RCDialogFile.HEADER_ROW )
-        langcodes = len(header)-offset;
-        sections = self.readSection()
-        for secname, entries in sections:
-            name, lid = self.__splitSectionName(secname)
-            if name not in self._projs: self._projs[name]=[]
-            dialog = RCDialog(lid)
-            for entry in entries:
-                value = RCStringValue(entry[0]) #id
-                for c in range(langcodes):
-                    value.addValuePair(header[offset+c], entry[offset+c])
-                dialog._values.append(value)
-            self._projs[name].append( dialog )
+        cache = LSCSVCache.read(self._path, LSCacheKind.SYSDIALOGS)
+        if cache is not None:
+            # the binary copy is up to date, so no need to touch the csv.
+            self.__header = cache.header
+            self._setSource()
+            index = {}
+            for secnum, secname in enumerate(cache.getSectionNames()):
+                name, lid = self.__splitSectionName(secname)
+                if name not in index: index[name]=[]
+                index[name].append( (lid, secnum) )
+            load = lambda locs: [ self.__buildDialog(lid, cache.getSection(secnum)) 
+                                    for lid, secnum in locs ]
+            self._projs = LazyProjectMap( load )
+            for name, locs in index.items():
+                if lazy: self._projs.addToken(name, locs)
+                else: self._projs.addLoaded(name, load(locs))
+            self.__loaded = True
+            return
+        
+        self.__header = self.getHeader( RCDialogFile.HEADER_ROW )
+        self._setSource()
+        if lazy:
+            self._projs = LazyProjectMap( self.__loadProject, self.__indexProjects() )
+        else:
+            projs = {}
+            sections = self.readSection()
+            for secname, entries in sections:
+                name, lid = self.__splitSectionName(secname)
+                if name not in projs: projs[name]=[]
+                projs[name].append( self.__buildDialog(lid, entries) )
+            self._projs = LazyProjectMap( self.__loadProject )
+            for name, dialogs in projs.items(): self._projs.addLoaded(name, dialogs)
         self.__loaded = True
         
     def save(self, newpath=None):
         # we don't care about checking if its syslvl, we are overwriting.
         if newpath is not None: self._path = newpath
+        if not self.__saveChanges():
+            self.__saveAll()
+        self._saved( self.__loadProject, self.__indexProjects )
+        
+    def __saveAll(self):
+        ### Rewrites the whole file from what is in memory.
         #create header:
         lst = {}
         for dialogs in self._projs.values():
@@ -77,8 +104,57 @@ class SysDialogFile( BaseUtilityFileWrapper, LSCSV ):
                 section = "%s.%s"%(name,dialog.id)
                 sections[section] = self.__buildLines(dialog, langorder)
         #write sections
-        writer = self.writeLine( header )
-        self.writeSections(sections, writer)
+        with open(self._path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            self.writeLine( header, writer )
+            self.writeSections(sections, writer)
+        self.__header = header
+        LSCSVCache.write(self._path, LSCacheKind.SYSDIALOGS, header, list(sections.items()))
+        
+    def __saveChanges(self):
+        ### Rewrites only the projects that changed since the file was read,
+        ### the rest are copied straight out of the old file. Returns False 
+        ### if the whole file has to be rewritten instead.
+        srcpath = self._spliceSource()
+        if srcpath is None: return False
+        langorder = self.__header[RCDialogFile.CONTROL_COLS:]
+        for name in self._projs:
+            if not self._projs.isDirty(name): continue
+            for dialog in self._projs[name]:
+                if not set(dialog.getPossibleLangs()) <= set(langorder):
+                    return False # language columns changed.
+        
+        # a project is spread over a section per dialog.
+        index, first = {}, self._source[1]
+        for secname, start, data, end in self.indexSections(path=srcpath):
+            name, _ = self.__splitSectionName(secname)
+            if name not in index: index[name]=[]
+            index[name].append( (secname, start, data, end) )
+            first = min(first, start)
+        # the unchanged projects come out of the old sidecar for the new one.
+        cache = LSCSVCache.read(srcpath, LSCacheKind.SYSDIALOGS)
+        cached = {} if cache is None else { secname:secnum 
+                                for secnum, secname in enumerate(cache.getSectionNames()) }
+        parts, sections = [(0, first)], []
+        for name in self._projs:
+            if not self._projs.isDirty(name):
+                if name not in index and len(self._projs[name]) > 0: return False
+                for secname, start, data, end in index.get(name, []):
+                    parts.append( (start, end) )
+                    if secname in cached: section = cache.getSection(cached[secname])
+                    else: section = self.readSectionAt(data, end, srcpath)
+                    sections.append( (secname, section) )
+                continue
+            lines = []
+            for dialog in self._projs[name]:
+                section = self.__buildLines(dialog, langorder)
+                lines.append( ["[%s.%s]"%(name,dialog.id)] )
+                lines.extend( section )
+                sections.append( ("%s.%s"%(name,dialog.id), section) )
+            parts.append( self.encodeLines(lines) )
+        if self._spliceFile(srcpath, parts):
+            LSCSVCache.write(self._path, LSCacheKind.SYSDIALOGS, self.__header, sections)
+        return True
         
     def getProjectList(self):
         return list(self._projs.keys())
@@ -107,17 +183,58 @@ class SysDialogFile( BaseUtilityFileWrapper, LSCSV ):
     
     def updateFromTranslation(self, otherSysFile, autosave=False):
         for proj in self._projs.keys():
+            if proj not in otherSysFile._projs:
+                logging.debug("Other system file does not have project: %s"%proj)
+                continue
             odlogs = otherSysFile._projs[proj]
-            for index in range(len(self._projs[proj])):
+            dialogs = self._projs[proj]
+            before = self.__snapshot( dialogs )
+            for index in range(len(dialogs)):
                 # for each dialog in self, find it in the other file
                 # and update it with the values in that one.    
                 for odlog in odlogs:
-                    if self._projs[proj][index].id == odlog.id:
-                        self._projs[proj][index].updateValues( odlog )
+                    if dialogs[index].id == odlog.id:
+                        dialogs[index].updateValues( odlog )
                         break
+            if self.__snapshot( dialogs ) != before:
+                self._projs[proj] = dialogs # keeps it if loaded lazily.
         if autosave: self.save()
     
     
+    def __indexProjects(self):
+        ### The location of each project in the file, see LazyProjectMap.
+        ### A project is spread over a section per dialog, so remember 
+        ### where each of them are.
+        index = {}
+        for secname, _, start, end in self.indexSections(path=self._sourcePath()):
+            name, lid = self.__splitSectionName(secname)
+            if name not in index: index[name]=[]
+            index[name].append( (lid, start, end) )
+        return index.items()
+    
+    def __loadProject(self, locations):
+        ### Lazy loader for a single project, see LazyProjectMap.
+        return [ self.__buildDialog(lid, self.readSectionAt(start, end, self._sourcePath())) 
+                    for lid, start, end in locations ]
+    
+    def __snapshot(self, dialogs):
+        ### The values of the dialogs, to check if an update changed anything.
+        return [[(val.getID(), sorted(val.values.items())) for val in dialog._values]
+                    for dialog in dialogs]
+        
+    def __buildDialog(self, lid, entries):
+        ### Turns the lines of a section into a dialog.
+        offset = RCDialogFile.CONTROL_COLS
+        langcodes = len(self.__header)-offset
+        dialog = RCDialog(lid)
+        for entry in entries:
+            value = RCStringValue(entry[0]) #id
+            for c in range(langcodes):
+                value.addValuePair(self.__header[offset+c], entry[offset+c])
+            dialog._values.append(value)
+        return dialog
+    
+    
     def __buildLines(self, dialog, langorder):
         ### Builds a 2D list of lists that are the entries for saving the 
         ### given dialog.
@@ -0,0 +1,365 @@
+#
+# Author: Alexander Dean <dstar@csh.rit.edu>
+# Copyright (c) 2011, RailComm LLC
+# All rights reserved. Redistribution and use in source and binary forms, with
+# or without modification are permitted provided that the conditions are met
+# under the Modified BSD License.
+#
+"""The three System files (menus, dialogs, and string tables) are each one
+big file, so anything that needs just a single project still has to read the
+whole thing. The Master DB is an alternative to them: a SQLite database
+(System_Strings.master.db) that holds the same information, but indexed so
+that a single project or a single string can be pulled out directly.
+
+It is made up of four tables:
+    projects   - one row per project in the system.
+    containers - one row per menu or dialog in a project, string tables have
+                 a single container per project (with no name).
+    entries    - one row per string value in a container, menus also keep
+                 their structure here (the parent entry, the type of node,
+                 the idn and the order).
+    vals       - one row per language of each entry.
+
+The database can be made from (or turned back into) the text based System
+files at any time, so the text files can still be what is kept in version
+control. SysMasterDB can also hand back System file objects that only pull
+a project out of the database when it is asked for, which means anything
+that works with the System files will work with the database.
+"""
+import sqlite3
+import logging
+
+from lslib.base.file.msrcobj.dialogex    import RCDialog
+from lslib.base.file.msrcobj.stringtable import RCStrTbl
+from lslib.base.file.msrcobj.msobjbase   import RCStringValue
+from lslib.base.file.utility.MenuFile    import MenusFromCache, InMemMenu
+from lslib.base.file.utility.DialogFile  import InMemDialog
+from lslib.base.file.utility.StrTblFile  import InMemTable
+from lslib.base.file.syslvl.sysbase      import LazyProjectMap
+from lslib.base.file.syslvl.SysMenuFile   import SysMenuFile
+from lslib.base.file.syslvl.SysDialogFile import SysDialogFile
+from lslib.base.file.syslvl.SysStrTblFile import SysStrTblFile
+
+MASTER_DB_EXT = ".db"
+SQLITE_MAGIC  = b"SQLite format 3\x00"
+
+def isMasterDB( path ):
+    """Checks if the file given is a SQLite database (by its header)."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except (IOError, OSError): return False
+
+
+class MasterDBKind:
+    """The kinds of containers that can be stored in the database."""
+    MENU, DIALOG, STRTBL = 'm', 'd', 's'
+    LIST = [MENU, DIALOG, STRTBL]
+
+
+class SysMasterDB():
+    """Wraps the SQLite database that holds all of the system's utility
+    information. Give it a path and it will create the tables if they are
+    not there yet.
+    """
+    VERSION = 1
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS info (
+            key   TEXT PRIMARY KEY,
+            value TEXT );
+        CREATE TABLE IF NOT EXISTS projects (
+            id   INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE );
+        CREATE TABLE IF NOT EXISTS containers (
+            id      INTEGER PRIMARY KEY,
+            project INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            kind    TEXT NOT NULL,
+            name    TEXT,
+            pos     INTEGER NOT NULL );
+        CREATE INDEX IF NOT EXISTS containers_project ON containers(project, kind, pos);
+        CREATE TABLE IF NOT EXISTS entries (
+            id        INTEGER PRIMARY KEY,
+            container INTEGER NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+            parent    INTEGER,
+            pos       INTEGER NOT NULL,
+            strid     TEXT,
+            type      TEXT,
+            idn       TEXT,
+            ord       TEXT );
+        CREATE INDEX IF NOT EXISTS entries_container ON entries(container, pos);
+        CREATE INDEX IF NOT EXISTS entries_strid ON entries(strid);
+        CREATE TABLE IF NOT EXISTS vals (
+            entry    INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+            langcode TEXT NOT NULL,
+            value    TEXT NOT NULL,
+            PRIMARY KEY(entry, langcode) );
+        CREATE INDEX IF NOT EXISTS vals_value ON vals(value, langcode);
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self.__conn = sqlite3.connect(path)
+        self.__conn.execute("PRAGMA foreign_keys = ON")
+        self.__conn.executescript(SysMasterDB.SCHEMA)
+        with self.__conn:
+            self.__conn.execute("INSERT OR IGNORE INTO info VALUES ('version', ?)",
+                                (str(SysMasterDB.VERSION),))
+
+    def close(self):
+        """Closes the connection to the database."""
+        self.__conn.close()
+
+    def getProjectList(self):
+        """Returns the names of all the projects in the database."""
+        return [ name for name, in self.__conn.execute("SELECT name FROM projects ORDER BY id") ]
+
+    def hasProject(self, projName, kind=None):
+        """Checks if the project is in the database, if `kind` is given it also
+        checks that it has that kind of container."""
+        if kind is None:
+            sql, args = "SELECT 1 FROM projects WHERE name=?", (projName,)
+        else:
+            sql = "SELECT 1 FROM containers c JOIN projects p ON c.project=p.id "+\
+                  "WHERE p.name=? AND c.kind=? LIMIT 1"
+            args = (projName, kind)
+        return self.__conn.execute(sql, args).fetchone() is not None
+
+    def removeProject(self, projName):
+        """Removes the project and everything in it."""
+        with self.__conn:
+            cur = self.__conn.execute("DELETE FROM projects WHERE name=?", (projName,))
+        return cur.rowcount > 0
+
+
+    ##
+    ## Getting objects out of the database.
+    ##
+    def getMenus(self, projName):
+        """Returns the list of RCMenus for the project."""
+        containers, entries = self.__readContainers(projName, MasterDBKind.MENU, True)
+        menus = []
+        for cid, name in containers:
+            menus.append( (name, entries.get(cid, [])) )
+        return MenusFromCache( menus )
+
+    def getDialogs(self, projName):
+        """Returns the list of RCDialogs for the project."""
+        containers, entries = self.__readContainers(projName, MasterDBKind.DIALOG)
+        dialogs = []
+        for cid, name in containers:
+            dialog = RCDialog( name )
+            dialog._values.extend( entries.get(cid, []) )
+            dialogs.append( dialog )
+        return dialogs
+
+    def getStringTable(self, projName):
+        """Returns the RCStrTbl for the project."""
+        containers, entries = self.__readContainers(projName, MasterDBKind.STRTBL)
+        table = RCStrTbl()
+        for cid, _ in containers:
+            table._values.extend( entries.get(cid, []) )
+        return table
+
+    def genProjLevelFile(self, kind, projName, newPath, autosave=False):
+        """Same as the System files' genProjLevelFile, but you have to say
+        what kind of file you are wanting."""
+        if not self.hasProject(projName, kind):
+            raise KeyError("Project wasn't found in the master database.")
+        if kind == MasterDBKind.MENU:     file = InMemMenu( newPath, self.getMenus(projName) )
+        elif kind == MasterDBKind.DIALOG: file = InMemDialog( newPath, self.getDialogs(projName) )
+        else:                             file = InMemTable( newPath, self.getStringTable(projName) )
+        if autosave: file.save()
+        return file
+
+    def getSysMenuFile(self, path='', projects=None):
+        """Returns a SysMenuFile that pulls its projects out of the database
+        when they are used. If `projects` is given, only those are in it."""
+        file = SysMenuFile( path )
+        file._projs = self.__lazyProjects(MasterDBKind.MENU, self.getMenus, projects)
+        return file
+
+    def getSysDialogFile(self, path='', projects=None):
+        """Returns a SysDialogFile that pulls its projects out of the database
+        when they are used. If `projects` is given, only those are in it."""
+        file = SysDialogFile( path )
+        file._projs = self.__lazyProjects(MasterDBKind.DIALOG, self.getDialogs, projects)
+        return file
+
+    def getSysStrTblFile(self, path='', projects=None):
+        """Returns a SysStrTblFile that pulls its projects out of the database
+        when they are used. If `projects` is given, only those are in it."""
+        file = SysStrTblFile( path )
+        file._projs = self.__lazyProjects(MasterDBKind.STRTBL, self.getStringTable, projects)
+        return file
+
+    def findValue(self, value, langcode=None):
+        """Looks up everywhere a string is used. Returns a list of tuples
+        (project, kind, container, strid, langcode)."""
+        sql = "SELECT p.name, c.kind, c.name, e.strid, v.langcode FROM vals v "+\
+              "JOIN entries e ON v.entry=e.id JOIN containers c ON e.container=c.id "+\
+              "JOIN projects p ON c.project=p.id WHERE v.value=?"
+        args = [value]
+        if langcode is not None:
+            sql += " AND v.langcode=?"
+            args.append(langcode)
+        return self.__conn.execute(sql+" ORDER BY p.id, c.pos, e.pos", args).fetchall()
+
+
+    ##
+    ## Putting objects into the database.
+    ##
+    def setMenus(self, projName, menus):
+        """Replaces all of the menus of the project with the ones given."""
+        containers = []
+        for menu in menus:
+            elem = menu.asXMLNode()
+            containers.append( (elem.attrib.get("id"), self.__menuEntries(elem)) )
+        self.__writeContainers(projName, MasterDBKind.MENU, containers)
+
+    def setDialogs(self, projName, dialogs):
+        """Replaces all of the dialogs of the project with the ones given."""
+        containers = []
+        for dialog in dialogs:
+            containers.append( (dialog.id, self.__valueEntries(dialog._values)) )
+        self.__writeContainers(projName, MasterDBKind.DIALOG, containers)
+
+    def setStringTable(self, projName, table):
+        """Replaces the string table of the project with the one given."""
+        values = [] if table is None else table._values
+        self.__writeContainers(projName, MasterDBKind.STRTBL, [(None, self.__valueEntries(values))])
+
+    def importFiles(self, menuFile=None, dialogFile=None, strFile=None, projects=None):
+        """Copies the projects out of the loaded System files given into the
+        database, replacing what was there for those projects."""
+        for file, setter in [(menuFile, self.setMenus),
+                             (dialogFile, self.setDialogs),
+                             (strFile, self.setStringTable)]:
+            if file is None: continue
+            for name in file.getProjectList():
+                if projects is not None and name not in projects: continue
+                setter(name, file._projs[name])
+
+    def exportFiles(self, basename, projects=None, doMenus=True, doDialogs=True, doStrings=True):
+        """Saves the database back out to the text based System files, using
+        `basename` as the path without the extension (eg,
+        'C:/mysystem/System_Strings.master')."""
+        if doMenus:   self.getSysMenuFile('', projects).save( basename+".menus" )
+        if doDialogs: self.getSysDialogFile('', projects).save( basename+".dialogs" )
+        if doStrings: self.getSysStrTblFile('', projects).save( basename+".strtbls" )
+
+    def exportProject(self, projName, basename, doMenus=True, doDialogs=True, doStrings=True):
+        """Saves the project level utility files for a single project, again
+        `basename` is the path without the extension."""
+        for do, kind, ext in [(doMenus, MasterDBKind.MENU, ".menus"),
+                              (doDialogs, MasterDBKind.DIALOG, ".dialogs"),
+                              (doStrings, MasterDBKind.STRTBL, ".strtbls")]:
+            if do and self.hasProject(projName, kind):
+                self.genProjLevelFile(kind, projName, basename+ext, autosave=True)
+
+    def updateFromTranslation(self, menuFile=None, dialogFile=None, strFile=None):
+        """Updates the values in the database with the System files given
+        (usually pulled out of a translator file). Just like the System
+        files, no new values are added, only the values are updated."""
+        for file, getter, setter in [(menuFile, self.getSysMenuFile, self.setMenus),
+                                     (dialogFile, self.getSysDialogFile, self.setDialogs),
+                                     (strFile, self.getSysStrTblFile, self.setStringTable)]:
+            if file is None: continue
+            projects = [ name for name in file.getProjectList() if self.hasProject(name) ]
+            mine = getter('', projects)
+            try: mine.updateFromTranslation( file )
+            except KeyError as e:
+                logging.warning("Translation is missing project: %s"%e)
+                continue
+            for name in projects: setter(name, mine._projs[name])
+
+
+    def __lazyProjects(self, kind, loader, projects=None):
+        ### A LazyProjectMap that queries the database for each project.
+        sql = "SELECT DISTINCT p.name FROM projects p JOIN containers c ON c.project=p.id "+\
+              "WHERE c.kind=? ORDER BY p.id"
+        names = [ name for name, in self.__conn.execute(sql, (kind,)) ]
+        if projects is not None: names = [ name for name in names if name in projects ]
+        return LazyProjectMap( loader, [(name, name) for name in names] )
+
+    def __projectID(self, projName, create=False):
+        ### Gets the row id of the project.
+        row = self.__conn.execute("SELECT id FROM projects WHERE name=?", (projName,)).fetchone()
+        if row is not None: return row[0]
+        if not create: return None
+        return self.__conn.execute("INSERT INTO projects (name) VALUES (?)", (projName,)).lastrowid
+
+    def __readContainers(self, projName, kind, tree=False):
+        ### Reads all of the containers of a kind for the project, returns
+        ### the list of (id, name) and a map of id -> entries. The entries
+        ### are RCStringValues, or if `tree` is True then they are the node
+        ### tuples that MenusFromCache understands.
+        pid = self.__projectID(projName)
+        if pid is None: raise KeyError(projName)
+        containers = self.__conn.execute("SELECT id, name FROM containers WHERE project=? "+
+                                         "AND kind=? ORDER BY pos", (pid, kind)).fetchall()
+        vals = {}
+        for entry, langcode, value in self.__conn.execute(
+                    "SELECT v.entry, v.langcode, v.value FROM vals v "+
+                    "JOIN entries e ON v.entry=e.id JOIN containers c ON e.container=c.id "+
+                    "WHERE c.project=? AND c.kind=? ORDER BY v.rowid", (pid, kind)):
+            vals.setdefault(entry, []).append( (langcode, value) )
+
+        entries, nodes = {}, {}
+        for eid, cid, parent, strid, type, idn, ord in self.__conn.execute(
+                    "SELECT e.id, e.container, e.parent, e.strid, e.type, e.idn, e.ord "+
+                    "FROM entries e JOIN containers c ON e.container=c.id "+
+                    "WHERE c.project=? AND c.kind=? ORDER BY e.container, e.pos", (pid, kind)):
+            if tree:
+                node = (type, strid, idn, ord, vals.get(eid, []), [])
+                nodes[eid] = node
+                if parent is None: entries.setdefault(cid, []).append( node )
+                else: nodes[parent][5].append( node )
+            else:
+                value = RCStringValue( strid )
+                for langcode, val in vals.get(eid, []): value.addValuePair(langcode, val)
+                entries.setdefault(cid, []).append( value )
+        return containers, entries
+
+    def __writeContainers(self, projName, kind, containers):
+        ### Replaces all the containers of a kind in the project. Containers
+        ### are a list of (name, entries) where entries are a list of
+        ### (parent index, strid, type, idn, ord, [(langcode, value)]).
+        with self.__conn:
+            pid = self.__projectID(projName, True)
+            self.__conn.execute("DELETE FROM containers WHERE project=? AND kind=?", (pid, kind))
+            nextid = self.__conn.execute("SELECT COALESCE(MAX(id),0)+1 FROM entries").fetchone()[0]
+            erows, vrows = [], []
+            for pos, (name, entries) in enumerate(containers):
+                cid = self.__conn.execute("INSERT INTO containers (project, kind, name, pos) "+
+                                          "VALUES (?,?,?,?)", (pid, kind, name, pos)).lastrowid
+                first = nextid
+                for epos, (parent, strid, type, idn, ord, vals) in enumerate(entries):
+                    eid = nextid ; nextid+=1
+                    erows.append( (eid, cid, None if parent is None else first+parent,
+                                   epos, strid, type, idn, ord) )
+                    for langcode, value in vals: vrows.append( (eid, langcode, value) )
+            self.__conn.executemany("INSERT INTO entries VALUES (?,?,?,?,?,?,?,?)", erows)
+            self.__conn.executemany("INSERT OR REPLACE INTO vals VALUES (?,?,?)", vrows)
+
+    def __menuEntries(self, menuElem):
+        ### Flattens the XML of a menu into entries (in order, parents first).
+        entries = []
+        def _flatten( elems, parent ):
+            for elem in elems:
+                if elem.tag == "TITLE": continue
+                titles = [ (t.attrib.get("langcode"), t.text or "") for t in elem.findall("TITLE")
+                            if t.attrib.get("langcode") is not None ]
+                entries.append( (parent, elem.attrib.get("id"), elem.tag, elem.attrib.get("idn"),
+                                 elem.attrib.get("order"), titles) )
+                _flatten( list(elem), len(entries)-1 )
+        _flatten( list(menuElem), None )
+        return entries
+
+    def __valueEntries(self, values):
+        ### Converts a list of RCStringValues into entries.
+        entries = []
+        for value in values:
+            vals = [ (lang, value.getValue(lang, '')) for lang in value.getLangCodes() ]
+            strid = None if value.getID() is None else str(value.getID())
+            entries.append( (None, strid, None, None, None, vals) )
+        return entries
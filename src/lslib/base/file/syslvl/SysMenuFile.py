@@ -36,16 +36,24 @@ provided via the BaseUtilityFileWrapper object. Any accessors can be pushed to
 a per-project level.
 """
 import os
+import re
+import html
+import mmap
 import time
 import copy
 import logging
 import xml.etree.ElementTree as ET
 
-from lslib.base.file.utility.MenuFile import RCMenuFile,InMemMenu
+from lslib.base.file.lscache import LSXMLCache, LSCacheKind
+from lslib.base.file.utility.MenuFile import RCMenuFile,InMemMenu,MenusFromCache
 from lslib.base.file.msrcobj.menu import RCMenu, RCMenuNode, RCMenuNodeType
 from lslib.base.file.syslvl.sysbase import BaseUtilityFileWrapper, \
+                                           LazyProjectMap, \
                                            isSystemLevelMenu
 
+PROJ_START = re.compile(rb'<PROJECT\s+name="([^"]*)"\s*(/?)>')
+PROJ_END   = b'</PROJECT>'
+
 
 class SysMenuFile( BaseUtilityFileWrapper ):
     """This is the object that allows you to pull individual projects' menu 
@@ -59,46 +67,112 @@ class SysMenuFile( BaseUtilityFileWrapper ):
         self._projs = {} #map: "projname"-> [list of RCMenus]
         self.__loaded = False
         
-    def load(self, newpath=None): 
+    def load(self, newpath=None, lazy=False): 
         if newpath is not None:
             if not isSystemLevelMenu( newpath ):
                 raise TypeError("Path given is not a system level menu file.")
             else: self._path = newpath
+        self._setSource()
+        cache = LSXMLCache.read(self._path, LSCacheKind.SYSMENUS)
+        if cache is not None:
+            # the binary copy is up to date, so no need to touch the xml.
+            load = lambda index: MenusFromCache( cache.getProject(index) )
+            self._projs = LazyProjectMap( load )
+            for index, name in enumerate(cache.getProjectNames()):
+                if lazy: self._projs.addToken(name, index)
+                else: self._projs.addLoaded(name, load(index))
+            self.__loaded = True
+            return True
+        if lazy:
+            self._projs = LazyProjectMap( self.__loadProject, self.__indexProjects() )
+            self.__loaded = True
+            return True
         root = ET.parse(self._path).getroot()
-        self._projs = {}
+        self._projs = LazyProjectMap( self.__loadProject )
         projects = root.findall("PROJECT")
         for project in projects:
-            try:
-                menus = project.findall("MENU")
-                lst = []
-                for menu in menus:
-                    m = RCMenu( menu.attrib["id"])
-                    self.__fillNode( menu, None, m, 0 )
-                    lst.append( m )
-                self._projs[ project.attrib["name"] ] = lst
+            try: self._projs.addLoaded( project.attrib["name"], self.__buildMenus( project ) )
             except Exception as e: logging.warning( e )
         self.__loaded = True
         return True
         
-    def save(self, newpath=None, timestamp=True):
+    def save(self, newpath=None, timestamp=False):
         # we don't care about checking if its syslvl, we are overwriting.
         if newpath is not None: self._path = newpath
         sysattrib={}
         if timestamp: sysattrib["save"] = str(time.time()) 
-        root = ET.Element("SYSTEM", attrib=sysattrib)
-        for name, menus in self._projs.items():
-            proj = ET.SubElement(root, "PROJECT", attrib={"name":name})
-            for menu in menus:
-                proj.append( menu.asXMLNode() )
         try:
             if self.__try_setup_path( self._path ):
-                tree = ET.ElementTree( root )
-                try:    tree.write( open(self._path, "wb") )
-                except: tree.write( open(self._path, "w")  )
+                if not self.__saveChanges( sysattrib ):
+                    self.__saveAll( sysattrib )
+                self._saved( self.__loadProject, self.__indexProjects )
                 return True
         except Exception as e: 
             logging.error("Could not save System Menu File: %s"%e)
         return False
+    
+    def __saveAll(self, sysattrib):
+        """Rewrites the whole file from what is in memory."""
+        root = ET.Element("SYSTEM", attrib=sysattrib)
+        for name, menus in self._projs.items():
+            root.append( self.__buildProject( name, menus ) )
+        tree = ET.ElementTree( root )
+        try:
+            with open(self._path, "wb") as f: tree.write( f )
+        except:
+            with open(self._path, "w") as f: tree.write( f )
+        LSXMLCache.write(self._path, LSCacheKind.SYSMENUS, 
+                         [(proj.attrib["name"], list(proj)) for proj in root])
+    
+    def __saveChanges(self, sysattrib):
+        """Rewrites only the projects that changed since the file was read,
+        the rest are copied straight out of the old file. Returns False if 
+        the whole file has to be rewritten instead.
+        """
+        srcpath = self._spliceSource()
+        if srcpath is None or len(self._projs) == 0: return False
+        index = dict( self.__indexProjects( srcpath ) )
+        # the unchanged projects come out of the old sidecar for the new one.
+        cache = LSXMLCache.read(srcpath, LSCacheKind.SYSMENUS)
+        cached = {} if cache is None else { name:index 
+                            for index, name in enumerate(cache.getProjectNames()) }
+        
+        # ElementTree writes an empty root as <SYSTEM />, so open it up.
+        start = ET.tostring( ET.Element("SYSTEM", attrib=sysattrib) )
+        parts = [ start[:-len(b" />")] + b">" ]
+        projects = []
+        for name in self._projs:
+            if not self._projs.isDirty(name):
+                if name not in index: return False
+                parts.append( index[name] )
+                projects.append( (name, self.__cachedProject( srcpath, index[name], 
+                                                              cache, cached.get(name) )) )
+            else: 
+                project = self.__buildProject( name, self._projs[name] )
+                parts.append( ET.tostring( project ) )
+                projects.append( (name, list(project)) )
+        parts.append( b"</SYSTEM>" )
+        if self._spliceFile( srcpath, parts ):
+            LSXMLCache.write(self._path, LSCacheKind.SYSMENUS, projects)
+        return True
+    
+    def __cachedProject(self, srcpath, location, cache, cacheindex):
+        """The MENU nodes of an unchanged project for the new sidecar, out of
+        the old sidecar if it had the project, or else out of the old file.
+        """
+        if cacheindex is not None:
+            return [ menu.asXMLNode() for menu in MenusFromCache( cache.getProject(cacheindex) ) ]
+        start, end = location
+        with open(srcpath, "rb") as f:
+            f.seek(start)
+            return list( ET.fromstring( f.read(end - start) ) )
+    
+    def __buildProject(self, name, menus):
+        """Converts a list of RCMenus into a PROJECT node."""
+        proj = ET.Element("PROJECT", attrib={"name":name})
+        for menu in menus:
+            proj.append( menu.asXMLNode() )
+        return proj
         
     def getProjectList(self):
         return list(self._projs.keys())
@@ -126,17 +200,76 @@ class SysMenuFile( BaseUtilityFileWrapper ):
     
     def updateFromTranslation(self, otherSysFile, autosave=False):
         for proj in self._projs.keys():
+            if proj not in otherSysFile._projs:
+                logging.debug("Other system file does not have project: %s"%proj)
+                continue
             omenus = otherSysFile._projs[proj]
-            for index in range(len(self._projs[proj])):
+            menus = self._projs[proj]
+            before = self.__snapshot( menus )
+            for index in range(len(menus)):
                 # for each menu in self, find it in the other file
                 # and update it with the values in that one.    
                 for omenu in omenus:
-                    if self._projs[proj][index].id == omenu.id:
-                        self._projs[proj][index].updateValues( omenu )
+                    if menus[index].id == omenu.id:
+                        menus[index].updateValues( omenu )
                         break
+            if self.__snapshot( menus ) != before:
+                self._projs[proj] = menus # keeps it if loaded lazily.
         if autosave: self.save()
     
     
+    def __indexProjects(self, path=None):
+        """Finds where each of the PROJECT nodes are in the file without 
+        parsing the XML. Returns a list of (name, (start, end)) byte offsets.
+        """
+        if path is None: path = self._sourcePath()
+        index = []
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0: return index
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = 0
+                while True:
+                    match = PROJ_START.search(data, pos)
+                    if match is None: break
+                    if match.group(2): end = match.end()
+                    else:
+                        end = data.find(PROJ_END, match.end())
+                        if end < 0: 
+                            logging.warning("Unclosed PROJECT node in %s"%path)
+                            break
+                        end += len(PROJ_END)
+                    name = html.unescape(match.group(1).decode("utf-8"))
+                    index.append( (name, (match.start(), end)) )
+                    pos = end
+            finally: data.close()
+        return index
+    
+    def __loadProject(self, location):
+        """Lazy loader for a single project, see LazyProjectMap."""
+        start, end = location
+        with open(self._sourcePath(), "rb") as f:
+            f.seek(start)
+            project = ET.fromstring( f.read(end - start) )
+        try: return self.__buildMenus( project )
+        except Exception as e: 
+            logging.warning( e )
+            raise KeyError("Project could not be read from the system file.")
+    
+    def __snapshot(self, menus):
+        """The values of the menus, to check if an update changed anything."""
+        return [ ET.tostring( menu.asXMLNode() ) for menu in menus ]
+    
+    def __buildMenus(self, project):
+        """Converts a PROJECT node into a list of RCMenus."""
+        lst = []
+        for menu in project.findall("MENU"):
+            m = RCMenu( menu.attrib["id"])
+            self.__fillNode( menu, None, m, 0 )
+            lst.append( m )
+        return lst
+    
+    
     def __fillNode(self, elems, node, menu, order):
         """Recursive function for filling the nodes in the RCMenus when reading from
         the MenuFile.
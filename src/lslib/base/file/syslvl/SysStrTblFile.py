@@ -18,14 +18,17 @@ functions are provided via the BaseUtilityFileWrapper object. Any
 accessors can be pushed to a per-project level.   
 """
 import re
+import csv
 import copy
 import logging
 
 from lslib.base.file.lscsv               import LSCSV
+from lslib.base.file.lscache             import LSCSVCache, LSCacheKind
 from lslib.base.file.msrcobj.stringtable import RCStrTbl
 from lslib.base.file.utility.StrTblFile  import RCStrTblFile, InMemTable
 from lslib.base.file.msrcobj.msobjbase   import RCStringValue
 from lslib.base.file.syslvl.sysbase      import BaseUtilityFileWrapper, \
+                                                LazyProjectMap, \
                                                 isSystemLevelStringTable
 
 SEC_NAME = re.compile("^\[(.*?)\]")
@@ -42,27 +45,45 @@ class SysStrTblFile( BaseUtilityFileWrapper, LSCSV ):
         self.setHasSections( True )
         self._projs = {} #map: "projName" -> RCStrTbl
         
-    def load(self, newpath=None):
+    def load(self, newpath=None, lazy=False):
+        if newpath is not None:
+            if not isSystemLevelStringTable( newpath ):
+                raise TypeError("Path given is not a system level string table file.")
+            else: self._path = newpath
         offset = RCStrTblFile.CONTROL_COLS
-        header = self.getHeader( RCStrTblFile.HEADER_ROW )
+        cache = LSCSVCache.read(self._path, LSCacheKind.SYSSTRTBLS)
+        if cache is not None: header = cache.header
+        else: header = self.getHeader( RCStrTblFile.HEADER_ROW )
         if len(header) < offset: 
             raise Exception("File does not have enough control columns.")
+        self.__header = header
+        self._setSource()
         
-        langcodes = len(header)-offset;
-        sections = self.readSection(RCStrTblFile.HEADER_ROW+1)
-        for secname, entries in sections:
-            name = self.__cleanName( secname )
-            self._projs[name] = RCStrTbl()
-            for entry in entries:
-                value = RCStringValue(entry[0])
-                for c in range(langcodes):
-                    value.addValuePair(header[offset+c], entry[offset+c])
-                self._projs[name].addStringValue( value )
+        if cache is not None:
+            # the binary copy is up to date, so no need to touch the csv.
+            names = [self.__cleanName( secname ) for secname in cache.getSectionNames()]
+            self._projs = LazyProjectMap( lambda index: self.__buildTable( cache.getSection(index) ) )
+            for index, name in enumerate(names): 
+                if lazy: self._projs.addToken(name, index)
+                else: self._projs.addLoaded(name, self.__buildTable( cache.getSection(index) ))
+        elif lazy:
+            self._projs = LazyProjectMap( self.__loadProject, self.__indexProjects() )
+        else:
+            self._projs = LazyProjectMap( self.__loadProject )
+            sections = self.readSection(RCStrTblFile.HEADER_ROW+1)
+            for secname, entries in sections:
+                self._projs.addLoaded(self.__cleanName( secname ), self.__buildTable( entries ))
         self.__loaded = True
         
     def save(self, newpath=None):
         # we don't care about checking if its syslvl, we are overwriting.
         if newpath is not None: self._path = newpath
+        if not self.__saveChanges():
+            self.__saveAll()
+        self._saved( self.__loadProject, self.__indexProjects )
+        
+    def __saveAll(self):
+        ### Rewrites the whole file from what is in memory.
         #create header:
         lst = {}
         for table in self._projs.values():
@@ -78,11 +99,54 @@ class SysStrTblFile( BaseUtilityFileWrapper, LSCSV ):
             sections[section] = self.__buildLines(table, langorder)
         #write sections
         try:
-            writer = self.writeLine( header )
-            self.writeSections(sections, writer)
+            with open(self._path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                self.writeLine( header, writer )
+                self.writeSections(sections, writer)
         except: 
             raise
-    
+        self.__header = header
+        LSCSVCache.write(self._path, LSCacheKind.SYSSTRTBLS, header, list(sections.items()))
+        
+    def __saveChanges(self):
+        ### Rewrites only the projects that changed since the file was read,
+        ### the rest are copied straight out of the old file. Returns False 
+        ### if the whole file has to be rewritten instead.
+        srcpath = self._spliceSource()
+        if srcpath is None: return False
+        langorder = self.__header[RCStrTblFile.CONTROL_COLS:]
+        for name in self._projs:
+            if not self._projs.isDirty(name): continue
+            table = self._projs[name]
+            if table is not None and not set(table.getPossibleLangs()) <= set(langorder):
+                return False # language columns changed.
+            
+        index = {}
+        for secname, start, data, end in self.indexSections(RCStrTblFile.HEADER_ROW+1, srcpath):
+            index[self.__cleanName( secname )] = (start, data, end)
+        # the unchanged projects come out of the old sidecar for the new one.
+        cache = LSCSVCache.read(srcpath, LSCacheKind.SYSSTRTBLS)
+        cached = {} if cache is None else { self.__cleanName( secname ):secnum 
+                                for secnum, secname in enumerate(cache.getSectionNames()) }
+        parts = [(0, min([start for start,_,_ in index.values()], default=self._source[1]))]
+        sections = []
+        for name in self._projs:
+            if not self._projs.isDirty(name):
+                if name not in index: return False
+                start, data, end = index[name]
+                parts.append( (start, end) )
+                if name in cached: lines = cache.getSection(cached[name])
+                else: lines = self.readSectionAt(data, end, srcpath)
+                sections.append( ("[%s]"%name, lines) )
+                continue
+            table = self._projs[name]
+            if table is None: table=RCStrTbl()
+            lines = self.__buildLines(table, langorder)
+            parts.append( self.encodeLines([["[[%s]]"%name]] + lines) )
+            sections.append( ("[%s]"%name, lines) )
+        if self._spliceFile(srcpath, parts):
+            LSCSVCache.write(self._path, LSCacheKind.SYSSTRTBLS, self.__header, sections)
+        return True
     
     def getProjectList(self):
         return list(self._projs.keys())
@@ -113,12 +177,43 @@ class SysStrTblFile( BaseUtilityFileWrapper, LSCSV ):
         for proj in self._projs.keys():
             if proj in otherSysFile._projs:
                 otbl = otherSysFile._projs[proj]
-                self._projs[proj].updateValues( otbl )
+                table = self._projs[proj]
+                before = self.__snapshot( table )
+                table.updateValues( otbl )
+                if self.__snapshot( table ) != before:
+                    self._projs[proj] = table # keeps it if loaded lazily.
             else:
                 logging.debug("Other system file does not have project: %s"%proj)
         if autosave: self.save()
     
     
+    def __indexProjects(self):
+        ### The location of each project in the file, see LazyProjectMap.
+        return [(self.__cleanName( secname ), (start, end)) for secname, _, start, end 
+                    in self.indexSections(RCStrTblFile.HEADER_ROW+1, self._sourcePath())]
+    
+    def __loadProject(self, location):
+        ### Lazy loader for a single project, see LazyProjectMap.
+        start, end = location
+        return self.__buildTable( self.readSectionAt(start, end, self._sourcePath()) )
+    
+    def __snapshot(self, table):
+        ### The values of a table, to check if an update changed anything.
+        if table is None: return []
+        return [(val.getID(), sorted(val.values.items())) for val in table._values]
+        
+    def __buildTable(self, entries):
+        ### Turns the lines of a section into a string table.
+        offset = RCStrTblFile.CONTROL_COLS
+        langcodes = len(self.__header)-offset
+        table = RCStrTbl()
+        for entry in entries:
+            value = RCStringValue(entry[0])
+            for c in range(langcodes):
+                value.addValuePair(self.__header[offset+c], entry[offset+c])
+            table.addStringValue( value )
+        return table
+    
     def __cleanName(self, secname):
         global SEC_NAME
         if SEC_NAME.search( secname ) is not None:
@@ -20,6 +20,11 @@ a file is a project level file or a system level file.
 
 import re
 import os
+import pickle
+import logging
+import tempfile
+from collections     import OrderedDict
+from collections.abc import MutableMapping
 from lslib.util.iohelp import ScanUntilMatch, ScanUntilNotMatch
 
 
@@ -81,19 +86,47 @@ def isSystemLevelStringTable( strFilePath ):
 class BaseUtilityFileWrapper():
     """The base functionality of a Utility wrapper. The three classes below 
     all implement this interface.
+    
+    When a System file is loaded it remembers what the file looked like at 
+    the time (see `_setSource`). If it hasn't changed by the time the file is
+    saved, only the projects that were changed in memory are rewritten and 
+    the rest are copied straight out of the old file (see `_spliceFile`).
     """
+    COPY_CHUNK = 1<<20
+    _source = None # (path, size, mtime) of the file the projects came from.
+    
     def size(self):
         """Gets the number of projects in the System file."""
         return len(self.getProjectList())
     
-    def load(self, newpath=None):
-        """Loads the file into memory."""
+    def load(self, newpath=None, lazy=False):
+        """Loads the file into memory. If `lazy` is True, only the location
+        of each project in the file is read, the project itself is parsed the
+        first time it is asked for (see LazyProjectMap below)."""
         raise NotImplementedError()
         
     def save(self, newpath=None): 
-        """Saves the file into disc."""
+        """Saves the file into disc. Projects that haven't changed since the
+        file was loaded are copied out of the old file rather than rebuilt."""
         raise NotImplementedError()
     
+    def setMemoryBudget(self, budget):
+        """Holds the projects in memory under a MemoryBudget (which can be 
+        shared with other System files), the least recently used ones are
+        spilled to disk when it's over and read back when they're needed."""
+        if not isinstance(self._projs, LazyProjectMap):
+            projs = LazyProjectMap( None )
+            for name, data in self._projs.items(): projs[name] = data
+            self._projs = projs
+        self._projs.setBudget( budget )
+    
+    def markDirty(self, projName):
+        """Flags a project as changed so that it is rewritten on the next 
+        save. Setting the project back into `_projs` does the same thing, 
+        this is only needed if a project was changed in place."""
+        if isinstance(self._projs, LazyProjectMap):
+            self._projs.markDirty( projName )
+    
     def hasProj(self, projName):  
         """Checks if a given project name is located in the sys file."""
         return projName in self.getProjectList()
@@ -125,4 +158,331 @@ class BaseUtilityFileWrapper():
         language code is missing in current file, it is able to add it. (ie, if
         current Sys file only has 1033 and 2058, adding 13322 is fine.)
         """
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+    
+    
+    def _sourcePath(self):
+        """The path of the file the projects are being read from, which is
+        not `_path` anymore if save() was given a new path."""
+        if self._source is None: return self._path
+        return self._source[0]
+    
+    def _setSource(self):
+        """Remembers the current state of `_path`, call this once the file 
+        on disc and the projects in memory match (after a load or save)."""
+        try:
+            stat = os.stat(self._path)
+            self._source = (os.path.abspath(self._path), stat.st_size, stat.st_mtime_ns)
+        except OSError: self._source = None
+    
+    def _spliceSource(self):
+        """Returns the path of the file that unchanged projects can be copied
+        out of, or None if they can't be (nothing is being tracked or the file
+        was changed by someone else since we read it)."""
+        if self._source is None or not isinstance(self._projs, LazyProjectMap):
+            return None
+        path, size, mtime = self._source
+        try: stat = os.stat(path)
+        except OSError: return None
+        if stat.st_size != size or stat.st_mtime_ns != mtime: return None
+        return path
+    
+    def _spliceFile(self, srcpath, parts):
+        """Writes `_path` from a list of parts, which are either bytes to be 
+        written as is or (start, end) byte ranges to copy out of `srcpath`. 
+        It's written to a temporary file first since `srcpath` is usually 
+        the file being saved over. Returns False if nothing had to be written
+        because the parts make up the old file exactly.
+        """
+        merged = []
+        for part in parts:
+            if type(part) is tuple and len(merged) > 0 and \
+               type(merged[-1]) is tuple and merged[-1][1] == part[0]:
+                merged[-1] = (merged[-1][0], part[1])
+            elif type(part) is not tuple or part[0] < part[1]: 
+                merged.append( part )
+        if os.path.abspath(self._path) == srcpath and \
+           merged == [(0, self._source[1])]: return False
+        
+        dirs = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.exists(dirs): os.makedirs(dirs)
+        tmppath = self._path+".tmp"
+        try:
+            with open(srcpath, "rb") as src, open(tmppath, "wb") as f:
+                for part in merged:
+                    if type(part) is not tuple:
+                        f.write( part )
+                        continue
+                    start, end = part
+                    src.seek(start)
+                    while start < end:
+                        chunk = src.read(min(end-start, BaseUtilityFileWrapper.COPY_CHUNK))
+                        if len(chunk) == 0: raise IOError("%s was cut short."%srcpath)
+                        f.write( chunk )
+                        start += len(chunk)
+            os.replace(tmppath, self._path)
+        except:
+            try: os.remove(tmppath)
+            except OSError: pass
+            raise
+        return True
+    
+    def _saved(self, loader, index):
+        """Call once `_projs` has been written out to `_path`. Everything in
+        memory is now clean and anything that wasn't parsed yet is now read 
+        out of the new file with `loader`. `index` is called to get the 
+        (name, token) pairs for the new file only if that is needed.
+        """
+        self._setSource()
+        if not isinstance(self._projs, LazyProjectMap):
+            projs = LazyProjectMap( loader )
+            for name, data in self._projs.items(): projs.addLoaded(name, data)
+            self._projs = projs
+        elif self._projs.hasUnloaded():
+            self._projs.rebase( loader, index() )
+        self._projs.markClean()
+    
+    
+    
+class LazyProjectMap( MutableMapping ):
+    """A mapping of project name to project data that acts just like the 
+    `_projs` dictionary in the System files, except that a project does not
+    have to be parsed until someone asks for it. When a system file is loaded
+    lazily it only records where each project is located in the file (the 
+    `token`), the `loader` is then called with that token on first access.
+    
+    Only a small number of parsed projects are kept around (least recently
+    used are dropped first), since they can always be parsed again. Anything
+    that is explicitly set on the map is kept until it is removed, so if you
+    change a project in place make sure to set it back into the map.
+    
+    The map also keeps track of which projects have been set (or marked) since
+    the file was read so that only those have to be written back out. Files 
+    that are loaded up front use addLoaded(), which keeps the project in 
+    memory without counting it as a change.
+    
+    If the map is given a MemoryBudget, the projects kept in memory are 
+    spilled to disk when it's over, and read back like any other project.
+    """
+    CACHE_SIZE = 8
+    
+    def __init__(self, loader, index=None, cachesize=None):
+        self.__loader = loader
+        self.__size   = LazyProjectMap.CACHE_SIZE if cachesize is None else cachesize
+        self.__index  = {}            # projname -> token
+        self.__pinned = {}            # projname -> project data
+        self.__cache  = OrderedDict() # projname -> project data (LRU)
+        self.__order  = OrderedDict() # projname -> None, keeps file order.
+        self.__dirty  = set()         # projnames changed since the last save.
+        self.__spilled= {}            # projname -> token in the budget's spill file
+        self.__budget = None
+        if index is not None:
+            for name, token in index: self.addToken(name, token)
+            
+    def setBudget(self, budget):
+        """Counts the projects kept in memory against a MemoryBudget."""
+        self.__budget = budget
+        for name in list(self.__pinned):
+            if name in self.__pinned: budget.track(self, name, self.__pinned[name])
+            
+    def addToken(self, name, token):
+        """Adds the location of a project that hasn't been parsed yet."""
+        self.__forget(name)
+        self.__index[name] = token
+        self.__order[name] = None
+        
+    def addLoaded(self, name, data):
+        """Adds a project that has already been parsed out of the file, it is
+        kept in memory but is not seen as a change."""
+        self.__forget(name)
+        self.__pinned[name] = data
+        self.__order[name] = None
+        if self.__budget is not None: self.__budget.track(self, name, data)
+        
+    def spill(self, name):
+        """Writes a project kept in memory out to the budget's spill file and
+        lets go of it, it's read back in the next time it's asked for. This 
+        is called by the MemoryBudget when it's over."""
+        data = self.__pinned.pop(name)
+        self.__spilled[name] = self.__budget.spill(data)
+        
+    def isSpilled(self, name):
+        """Checks if the project was spilled to disk."""
+        return name in self.__spilled
+        
+    def getToken(self, name, default=None):
+        """Returns the location of the project in the file it was loaded from,
+        or `default` if it was never in the file."""
+        return self.__index.get(name, default)
+        
+    def isLoaded(self, name):
+        """Checks if the project is currently in memory."""
+        return name in self.__pinned or name in self.__cache
+    
+    def hasUnloaded(self):
+        """Checks if any of the projects still depend on their token (or were
+        spilled)."""
+        return len(self.__pinned) < len(self.__order)
+        
+    def isDirty(self, name):
+        """Checks if the project was set or marked since the last save."""
+        return name in self.__dirty
+    
+    def markDirty(self, name):
+        """Flags a project as changed, it is kept in memory from now on."""
+        self.__setitem__(name, self.__getitem__(name))
+        
+    def markClean(self):
+        """Forgets about all changes, call after the projects are saved."""
+        self.__dirty.clear()
+        
+    def rebase(self, loader, index):
+        """Points the map at a new copy of the file. Everything that isn't
+        kept in memory is looked up with `loader` and the new (name, token)
+        pairs in `index` from now on."""
+        index = dict(index)
+        self.__loader = loader
+        self.__index = dict( (name, index[name]) for name in self.__order 
+                                                    if name in index )
+        # the spilled projects are in the new file now.
+        for name in list(self.__spilled):
+            if name in self.__index: del self.__spilled[name]
+        
+    def __getitem__(self, name):
+        if name in self.__pinned: 
+            if self.__budget is not None: self.__budget.touch(self, name)
+            return self.__pinned[name]
+        if name in self.__cache:
+            self.__cache.move_to_end(name)
+            return self.__cache[name]
+        if name in self.__spilled: data = self.__budget.load(self.__spilled[name])
+        elif name in self.__index: data = self.__loader(self.__index[name])
+        else: raise KeyError(name)
+        self.__cache[name] = data
+        while len(self.__cache) > self.__size:
+            self.__cache.popitem(last=False)
+        return data
+    
+    def __setitem__(self, name, data):
+        self.__forget(name)
+        self.__pinned[name] = data
+        self.__order[name] = None
+        self.__dirty.add(name)
+        if self.__budget is not None: self.__budget.track(self, name, data)
+        
+    def __delitem__(self, name):
+        if name not in self.__order: raise KeyError(name)
+        del self.__order[name]
+        self.__forget(name)
+        self.__index.pop(name, None)
+        self.__dirty.discard(name)
+        
+    def __forget(self, name):
+        ### Lets go of whatever is held in memory (or spilled) for a project.
+        self.__cache.pop(name, None)
+        self.__spilled.pop(name, None)
+        if self.__pinned.pop(name, None) is not None and self.__budget is not None: 
+            self.__budget.forget(self, name)
+        
+    def __contains__(self, name):
+        return name in self.__order
+        
+    def __iter__(self):
+        return iter(list(self.__order.keys()))
+    
+    def __len__(self):
+        return len(self.__order)
+
+
+class MemoryBudget():
+    """A limit on how much memory the projects kept by LazyProjectMaps can 
+    take up, shared by all of the maps it's given to (see setBudget). The 
+    size of a project is estimated from what's in it (see estimate()), it
+    isn't measured. When the projects go over the limit, the least recently 
+    used ones are pickled into a temporary spill file and let go, the last 
+    one added always stays. The spill file is removed when the budget is 
+    closed (or thrown away).
+    """
+    ITEM_SIZE = 700 # rough bytes for each menu node, dialog, value, etc.
+    
+    def __init__(self, limit, spilldir=None):
+        """`limit` is in bytes, and the spill file is put in `spilldir` (or
+        the system's temporary directory)."""
+        self.limit = limit
+        self.used  = 0
+        self.spills = 0 # how many projects were spilled, for reporting.
+        self.__spilldir = spilldir
+        self.__spill = None
+        self.__held = OrderedDict() # (id(map), name) -> (map, size), LRU.
+        
+    def track(self, projmap, name, data):
+        """Counts a project that a map is keeping in memory, spilling the
+        least recently used ones if that puts it over."""
+        key = (id(projmap), name)
+        if key in self.__held: self.used -= self.__held.pop(key)[1]
+        size = MemoryBudget.estimate( data )
+        self.__held[key] = (projmap, size)
+        self.used += size
+        while self.used > self.limit and len(self.__held) > 1:
+            (_, oldname), (oldmap, oldsize) = self.__held.popitem(last=False)
+            self.used -= oldsize
+            oldmap.spill( oldname )
+            self.spills += 1
+            
+    @staticmethod
+    def estimate(data):
+        """A rough size in bytes of a project's menus, dialogs or string table:
+        ITEM_SIZE for each of the objects in it, plus the length of every 
+        language code and value. Only walking through it is a lot cheaper 
+        than pickling it to find out."""
+        size, stack = 0, [data]
+        while len(stack) > 0:
+            obj = stack.pop()
+            if isinstance(obj, (list, tuple)):
+                stack.extend( obj )
+                continue
+            size += MemoryBudget.ITEM_SIZE
+            values = getattr(obj, 'values', None)
+            if isinstance(values, dict): # a string value
+                size += sum( len(lang)+len(val or '') for lang, val in values.items() )
+                continue
+            for attr in ('_nodes', '_children', '_values'):
+                stack.extend( getattr(obj, attr, None) or () )
+            value = getattr(obj, 'value', None)
+            if value is not None: stack.append( value )
+        return size
+            
+    def touch(self, projmap, name):
+        """Marks a project as just used, so it's the last to be spilled."""
+        key = (id(projmap), name)
+        if key in self.__held: self.__held.move_to_end(key)
+        
+    def forget(self, projmap, name):
+        """Stops counting a project, the map let go of it."""
+        held = self.__held.pop((id(projmap), name), None)
+        if held is not None: self.used -= held[1]
+        
+    def spill(self, data):
+        """Writes a project to the spill file and returns where it is."""
+        if self.__spill is None:
+            self.__spill = tempfile.TemporaryFile(prefix="livss", suffix=".spill", dir=self.__spilldir)
+            logging.debug("Spilling projects to disk, over the budget of %d bytes."%self.limit)
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        self.__spill.seek(0, os.SEEK_END)
+        start = self.__spill.tell()
+        self.__spill.write( blob )
+        return (start, len(blob))
+        
+    def load(self, token):
+        """Reads a project back out of the spill file."""
+        start, length = token
+        self.__spill.seek(start)
+        return pickle.loads( self.__spill.read(length) )
+        
+    def close(self):
+        """Removes the spill file. Anything still spilled can't be read after
+        this, so only close it once the System files are saved or done with.
+        """
+        if self.__spill is not None: 
+            self.__spill.close()
+            self.__spill = None
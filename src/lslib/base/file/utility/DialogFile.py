@@ -57,7 +57,9 @@ An example of this would be:
     cols = 'id,type,xloc,yloc,width,height,settings,1033-enUS,2058-esMX'
 """
 
+import csv
 from lslib.base.file.lscsv import LSCSV
+from lslib.base.file.lscache import LSCSVCache, LSCacheKind
 from lslib.base.file.msrcobj.dialogex import RCDialog
 from lslib.base.file.msrcobj.msobjbase import RCStringValue
 
@@ -157,18 +159,24 @@ class RCDialogFile( LSCSV ):
             ## event of changing the number of columns in the file.
             ##
             sections[dialog.id] = self.__buildLines( dialog, langorder ) 
-        writer = self.writeLine(header)
-        self.writeSections(sections, writer)
+        with open(self._path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            self.writeLine(header, writer)
+            self.writeSections(sections, writer)
+        LSCSVCache.write(self._path, LSCacheKind.DIALOGS, header, list(sections.items()))
     
     def load(self):
         """Load the dialogs into memory."""
         offset = RCDialogFile.CONTROL_COLS
-        header = self.getHeader( RCDialogFile.HEADER_ROW )
+        cache = LSCSVCache.read(self._path, LSCacheKind.DIALOGS)
+        if cache is not None: header = cache.header
+        else: header = self.getHeader( RCDialogFile.HEADER_ROW )
         if len(header) < offset: 
             raise Exception("File does not have enough control columns.")
         
         langcodes = len(header)-offset;
-        sections = self.readSection(0)
+        if cache is not None: sections = cache.readSection()
+        else: sections = self.readSection(0)
         for name, entries in sections: #For each section make a dialog
             dialog = RCDialog( name )
             #For each entry add it as a string value to the dialog
@@ -29,7 +29,8 @@
              </RCMENUS>
              
 Menus - This is the root node, it has one attribute 'save' which specifies the
-        time that this document was last saved.
+        time that this document was last saved. It is only written when 
+        asked for, so that saving the same menus gives the same file.
         
 Menu -  A Menu is tree structure with three possible sub-nodes: 'Popup', 
         'MenuItem', and 'Separator'. It has one attribute 'id' which is the 
@@ -59,6 +60,7 @@ Separator - A separator is just for reference and to keep everything logically
 import os, time, logging
 import xml.etree.ElementTree as ET
 from lslib.base.file.msrcobj.menu import RCMenu, RCMenuNode, RCMenuNodeType 
+from lslib.base.file.lscache      import LSXMLCache, LSCacheKind
 
 
 def ScanMenuFile( menuFile, headerLst ):
@@ -85,6 +87,28 @@ def InMemMenu( path, menus ):
     f._menus = menus
     return f
 
+def MenusFromCache( menus ):
+    """Builds the RCMenus from a project read out of an LSXMLCache. This gives
+    back exactly what loading the XML would have."""
+    def _fillNode( nodes, parent, menu, order ):
+        for tag, id, idn, norder, titles, children in nodes:
+            subnode = RCMenuNode(menu, id=id, type=RCMenuNodeType.getType(tag),
+                                 idn=idn, order=order if norder is None else norder)
+            order+=1
+            if subnode.type!=RCMenuNodeType.SEPARATOR:
+                for langcode, text in titles:
+                    if langcode is not None: subnode.value.addValuePair(langcode, text)
+            if subnode.type==RCMenuNodeType.POPUP:
+                _fillNode( children, subnode, menu, order )
+            if parent is None: menu._nodes.append( subnode )
+            else: parent.addChild( subnode )
+    lst = []
+    for id, nodes in menus:
+        m = RCMenu(id)
+        _fillNode( nodes, None, m, 0 )
+        lst.append( m )
+    return lst
+
 class RCMenuFile:
     """ A Menu File is essentially an XML file that is used to house all of
     the menu information for any MSVS project in such a way as to be able
@@ -136,18 +160,23 @@ class RCMenuFile:
                     self._menus[index].updateValues( omenu )
                     break
     
-    def save(self, newpath=None):
-        """Save the current RCMenuFile to its path."""
+    def save(self, newpath=None, timestamp=False):
+        """Save the current RCMenuFile to its path. The time it was saved is
+        only put in the file if `timestamp` is True.
+        """
         if len(self._menus) == 0: return False
         if newpath is not None: self._path = newpath
-        root = ET.Element("RCMENUS", attrib={"save":str(time.time())})
+        root = ET.Element("RCMENUS", attrib={"save":str(time.time())} if timestamp else {})
         for menu in self._menus:
             root.append(menu.asXMLNode())
         try:
             if self.__try_setup_path(self._path):
                 tree = ET.ElementTree( root )
-                try:    tree.write(open(self._path, "wb"))
-                except: tree.write(open(self._path, "w"))
+                try:
+                    with open(self._path, "wb") as f: tree.write(f)
+                except:
+                    with open(self._path, "w") as f: tree.write(f)
+                LSXMLCache.write(self._path, LSCacheKind.MENUS, [(None, list(root))])
                 return True
         except: pass
         return False
@@ -155,6 +184,12 @@ class RCMenuFile:
     def load(self, newpath=None):
         """Load the entire RCMenuFile into memory."""
         if newpath is not None: self._path = newpath            
+        cache = LSXMLCache.read(self._path, LSCacheKind.MENUS)
+        if cache is not None:
+            self._menus = []
+            for index in range(len(cache.getProjectNames())):
+                self._menus.extend( MenusFromCache( cache.getProject(index) ) )
+            return True
         root = ET.parse(self._path).getroot()
         self._menus = [] #TODO: are we updating or should this really be deleted.
         menus = root.findall("MENU")
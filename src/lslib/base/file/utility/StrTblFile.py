@@ -35,7 +35,9 @@ langcode# - this is substituted with the actual language code. To make the
         represent will never change.)
 """
 
+import csv
 from lslib.base.file.lscsv import LSCSV
+from lslib.base.file.lscache import LSCSVCache, LSCacheKind
 from lslib.base.file.msrcobj.stringtable import RCStrTbl
 from lslib.base.file.msrcobj.msobjbase   import RCStringValue
 
@@ -126,18 +128,26 @@ class RCStrTblFile(LSCSV):
         lines = self.__buildLines( self._table, langorder )
              
         # write lines
-        writer = self.writeLine(header)
-        self.writeLines(lines, writer)
+        with open(self._path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            self.writeLine(header, writer)
+            self.writeLines(lines, writer)
+        LSCSVCache.write(self._path, LSCacheKind.STRTBLS, header, [(None, lines)])
     
     def load(self):
         """Load the string tables into memory."""
         offset = RCStrTblFile.CONTROL_COLS
-        header = self.getHeader( RCStrTblFile.HEADER_ROW )
+        cache = LSCSVCache.read(self._path, LSCacheKind.STRTBLS)
+        if cache is not None: header = cache.header
+        else: header = self.getHeader( RCStrTblFile.HEADER_ROW )
         if len(header) < offset: 
             raise Exception("File does not have enough control columns.")
         
         langcodes = len(header)-offset;
-        lines = self.readLine(RCStrTblFile.HEADER_ROW+1)
+        if cache is not None: 
+            lines = []
+            for _, rows in cache.readSection(): lines.extend(rows)
+        else: lines = self.readLine(RCStrTblFile.HEADER_ROW+1)
         self._table = RCStrTbl()
         for line in lines: #For each line add it to the string table
             value = RCStringValue(line[0]) #id
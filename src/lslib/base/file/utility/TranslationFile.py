@@ -29,18 +29,24 @@ LiVSs. (However both have had their development halted as of 3/1/2011.)
 [3] - http://packages.python.org/xlwt3/
 """
 import re
-import uuid
 import copy
+import uuid
 import logging
+import os.path as opath
 
 import xlutils.xlwt3 as xlwt #writing excel files
 import xlutils.xlrd3 as xlrd #reading excel files
 
 from lslib.util.lcid import ToLanguageString, ToLocalID
+from lslib.util.parallel import orderedMap, sharedData
 from lslib.base.pruning import Pruner
+from lslib.base.file.lscsv  import LSCSV
+from lslib.base.file.lsxlsx import XLSXWorkbook, XLSXReader, XLSXStyle, \
+                                  XLSX_EXT, isXLSXFile
 
 from lslib.base.file.msrcobj.msobjbase     import RCStringValue
 from lslib.base.file.msrcobj.dialogex      import RCDialog
+from lslib.base.file.msrcobj.menu          import RCMenuNodeType
 from lslib.base.file.msrcobj.stringtable   import RCStrTbl
 
 from lslib.base.file.syslvl.SysMenuFile    import SysMenuFile
@@ -55,12 +61,22 @@ IDMatcher         = re.compile("^(([0-9A-Za-z_\-\.]+),?)+$")#id,id,...
 MenuIdMatcher     = re.compile("^m\.(.+?)\.(.+)$")          #m.id.xpath
 DialogIdMatcher   = re.compile("^d\.([0-9]+)\.(.+?)\.(.+)$")#d.projkey.dialogid.strid
 ConstantIdMatcher = re.compile("^c\.([0-9]+)\.(.+)$")       #c.projkey.constantid
+MergeIdNamespace  = uuid.UUID("0b7e3f52-9c4d-4a61-8e2f-3d5a7c9b1e64")
+GeneratedIdn      = re.compile("^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
 
 ## Excel stylings
 HEADER_STYLE = xlwt.easyxf('font: bold on; align: wrap on, vert centre, horiz center')
 NORMAL_STYLE = xlwt.style.default_style
 CONFLICT_STYLE = xlwt.easyxf('pattern: pattern solid, fore-colour red')
 
+## Reading cells back in, by cell type (anything else is just str'd)
+def _NumberString( value ):
+    try: return str(int(float(value)))
+    except: return '2' #the number cell type, like it has always been.
+CELL_STRINGS = { 0: lambda value: '', #blank string
+                 6: lambda value: '', #blank string
+                 2: _NumberString }   #number
+
 
 def MakeTranslationFile( newpath, menu, dialog, strings, preloaded=True, 
                                                          autosave=False, 
@@ -68,12 +84,17 @@ def MakeTranslationFile( newpath, menu, dialog, strings, preloaded=True,
                                                          order=False, 
                                                          trim=True,
                                                          prunepath=None,
-                                                         markconflicts=False ):
+                                                         markconflicts=False,
+                                                         prunecache=None,
+                                                         conflictreport=None ):
     """One hit KO method of getting a translation file from system utility
     files. If you set `preloaded` to False, then it will re-load the three
     utility files, otherwise it will assume they've been loaded into memory.
     Setting `autosave` to True will make this function save the translation 
-    file before returning it.
+    file before returning it. If `prunecache` is given, it is the path to a 
+    file where the pruning answers are kept between runs. If `conflictreport`
+    is given, a CSV of the strings with more than one translation is saved
+    there.
     """
     if type(menu) is not SysMenuFile or \
        type(dialog) is not SysDialogFile or \
@@ -83,14 +104,152 @@ def MakeTranslationFile( newpath, menu, dialog, strings, preloaded=True,
     if not preloaded: menu.load() ; dialog.load() ; strings.load()
     
     prime = None if langcodes is None or len(langcodes)==0 else langcodes[0]
-    trans = TranslationFile( newpath, prime, prunepath, markconflicts )
+    trans = TranslationFile( newpath, prime, prunepath, markconflicts, prunecache )
     csvmenu = ConvertMenuXML2CSV( 'tmp.cm', menu )
     trans.setSysFiles( csvmenu, dialog, strings )
     
     if autosave: trans.save(langcodes=langcodes, order=order, trim=trim)
+    if conflictreport is not None: trans.writeConflictReport(conflictreport, langcodes)
     return trans
 
 
+def MakeTranslationFileFromDB( newpath, db, projects=None, autosave=False,
+                                                          langcodes=None,
+                                                          order=False,
+                                                          trim=True,
+                                                          prunepath=None,
+                                                          markconflicts=False,
+                                                          prunecache=None,
+                                                          conflictreport=None ):
+    """Same as MakeTranslationFile, but the strings are pulled out of a 
+    SysMasterDB. If `projects` is given, only those projects are put in the
+    translation file, and only those are read out of the database.
+    """
+    menu   = db.getSysMenuFile('', projects)
+    dialog = db.getSysDialogFile('', projects)
+    strings= db.getSysStrTblFile('', projects)
+    return MakeTranslationFile( newpath, menu, dialog, strings, True, autosave, 
+                                langcodes, order, trim, prunepath, markconflicts,
+                                prunecache, conflictreport )
+
+
+def _saveLanguage( work ):
+    """Saves a copy of a translation file with just the language codes given,
+    see TranslationFile.saveByLanguage(). The translation file is the one
+    shared with every worker. This is handed to orderedMap so it has to stay
+    at the module level.
+    """
+    path, langcodes, order, trim = work
+    sharedData().save(langcodes=langcodes, order=order, newpath=path, trim=trim)
+    return path
+
+
+class _MergeIndex():
+    """Finds the first value in a dictionary of merged values (mid -> 
+    RCStringValue, in the order they were added) that a new value would be 
+    merged into; the same answer as checking every one of them with 
+    compare(ignoreID=True), but without having to.
+    
+    Each value goes into a bucket for one of its (langcode, value) pairs, 
+    the primary language if it has it. Since compare() needs all of those
+    pairs to be in the new value too, only the buckets of the new value's 
+    pairs can hold a match. Values with nothing but blanks are always checked.
+    Merging only ever adds language codes, so a bucket stays right after it.
+    """
+    def __init__(self, primaryLangCode):
+        self.__primary = primaryLangCode
+        self.__buckets = {} # (langcode, value) -> [(order, mid)]
+        self.__blanks  = [] # [(order, mid)]
+        self.__count   = 0
+        
+    def add(self, mid, value):
+        """Adds a new merged value that was put in the dictionary."""
+        entry = (self.__count, mid)
+        self.__count+=1
+        pairs = self.__pairs( value )
+        if len(pairs) == 0: 
+            self.__blanks.append( entry )
+            return
+        anchor = pairs[0]
+        for pair in pairs:
+            if pair[0] == self.__primary: 
+                anchor = pair
+                break
+        if anchor not in self.__buckets: self.__buckets[anchor] = []
+        self.__buckets[anchor].append( entry )
+        
+    def find(self, values, value):
+        """Returns the mid of the first value in `values` that `value` can 
+        be merged into, or None if there isn't one."""
+        buckets = [self.__blanks]
+        for pair in self.__pairs( value ):
+            if pair in self.__buckets: buckets.append( self.__buckets[pair] )
+        best = None
+        for bucket in buckets:
+            for order, mid in bucket:
+                if best is not None and order > best[0]: break
+                if values[mid].compare( value, ignoreID=True ):
+                    best = (order, mid)
+                    break
+        if best is None: return None
+        return best[1]
+    
+    def __pairs(self, value):
+        return [ (lang, val) for lang, val in value.values.items() if val != '' ]
+
+
+class TranslationLookup():
+    """Everything one project needs out of a translation file to update its
+    resource files, see TranslationFile.getLookups() and
+    RCSFile.updateFromLookup(). The values are kept by (kind, container, id)
+    just like the ids in the translation file: ('m', menuid, xpath),
+    ('d', dialogid, strid) and ('c', '', constantid). Popups don't have
+    anything in a resource file to find them by, so each menu also has its
+    layout, a list of (xpath, type, depth) in the order they are in the menu.
+    A partial lookup comes from a translation file that only has some of the
+    strings (see TranslationFile.setPartial()).
+    """
+    def __init__(self, name, partial=False):
+        self._name = name
+        self.__partial = partial
+        self.__values  = {}    # (kind, container, id) -> RCStringValue
+        self.__containers = set() # (kind, container)
+        self.__layouts = {}    # menuid -> [(xpath, type, depth)]
+
+    def addValue(self, kind, container, id, value):
+        """Adds the value for a key, if there is already one it is kept."""
+        self.__values.setdefault( (kind, container, id), value )
+        self.__containers.add( (kind, container) )
+
+    def getValue(self, kind, container, id, langcode, default=None):
+        """Gets the value of one language code for a key."""
+        val = self.__values.get( (kind, container, id) )
+        if val is None: return default
+        return val.getValue(langcode, default)
+
+    def hasContainer(self, kind, container):
+        """Checks if there are any values for a menu, dialog, or the string
+        tables (whose container is '')."""
+        return (kind, container) in self.__containers
+    
+    def isEmpty(self):
+        """Checks if there are no values at all (there may still be layouts,
+        the separators are always there)."""
+        return len(self.__values) == 0
+    
+    def isPartial(self):
+        """Checks if the lookup only has some of the project's strings."""
+        return self.__partial
+
+    def setMenuLayout(self, menuid, layout):
+        """Sets the layout of a menu, see the class description."""
+        self.__layouts[menuid] = layout
+
+    def getMenuLayout(self, menuid):
+        """Gets the layout of a menu, or None if there isn't one."""
+        return self.__layouts.get(menuid)
+
+
 class TranslationFile(): 
     """A Translation File is an Excel Workbook with two work-sheets. The
     first worksheet is for Menus, Dialogs, and StringTables all merged together 
@@ -112,67 +271,185 @@ class TranslationFile():
     UTIL_SHEET_WARNING = \
     """***DO NOT EDIT! THIS IS USED FOR PARSING THIS TRANSLATION FILE AFTERWARD.***"""
     
-    def __init__(self, path, primaryLangCode, prunepath=None, markconflicts=False):
+    def __init__(self, path, primaryLangCode, prunepath=None, markconflicts=False, prunecache=None):
         """Create a translation file at the specified path. If `mergeKey` is 
         not None, then the Translation file will do its comparisons based on
         the language code (LCID) given; examples are '1033' or '2058'. This 
         means it will compare and combine on that language code. So if '1033' 
         was given all similar '1033' values for ALL STRINGS IN THE SYSTEM will
-        be pushed into one line.
+        be pushed into one line. If `prunecache` is given, the Pruner keeps 
+        what it learns in that file between runs (written when this is saved).
         """
         self.__path = path
         self.__primaryLangCode = primaryLangCode
         self.__markconflicts = markconflicts
         self.__mergelist = {} #mid -> [id]
         self.__strings = {} # mid -> RCStringValue => sheet1
-        self.__conflicts=[] # [mid]                => sheet1 (if markConflicts is True)
+        self.__conflicts=set() # {mid}             => sheet1 (if markConflicts is True)
         self.__utils   = {} # idn -> (order,type)  => sheet2
         self.__projs   = {} # projname -> number   => sheet2
         self.__seps    = [] # [ xpath-id ]         => sheet2
         self.__pruned  = {} # mid -> RCStringValue => sheet2
-        self.__pruner  = Pruner( prunepath )
+        self.__pruner  = Pruner( prunepath, prunecache )
+        self.__stringIndex = _MergeIndex( primaryLangCode ) # for __strings
+        self.__prunedIndex = _MergeIndex( primaryLangCode ) # for __pruned
+        self.__idIndex   = None # kind -> see __getIdIndex()
+        self.__projNames = {}   # str(number) -> projname
+        self.__partial   = False # see setPartial()
         
     def getPath(self):
         """Gets the path of the Translation File."""
         return self.__path
     
-    def load(self, newpath=None):
+    def load(self, newpath=None, validate=False):
         """Loads the translation file into memory for use. If `newpath` is
-        set, then the file is changed.
+        set, then the file is changed. If `validate` is True, every id in the
+        strings sheet is checked and any that look broken or are listed more 
+        than once are logged. Both xls and xlsx files can be loaded, which 
+        one it is is decided by looking at the file itself.
         """
         if newpath is not None: self.__path = newpath
-        # Load the utils first:
-        self.__loadUtilLines()
-        # Then load the strings:
-        self.__loadStringLines()
+        # Only open the workbook once for both sheets.
+        if isXLSXFile( self.__path ): workbook = XLSXReader( self.__path )
+        else: workbook = xlrd.open_workbook(filename=self.__path, on_demand=True)
+        try:
+            # Load the utils first:
+            self.__loadUtilLines( workbook )
+            # Then load the strings:
+            self.__loadStringLines( workbook, validate )
+        finally: 
+            if type(workbook) is XLSXReader: workbook.close()
+            else: workbook.release_resources()
         return True
             
     def save(self, langcodes=None, order=False, newpath=None, trim=False):
         """Saves the Translation file to the specified path, or the path
-        given to it upon instantiation.
+        given to it upon instantiation. If the path ends in '.xlsx' the newer
+        Excel format is written (which doesn't have a row limit), otherwise
+        it's the old '.xls' format.
         """
         if newpath is not None: self.__path = newpath
-        workbook = xlwt.Workbook()
-        
-        strings = workbook.add_sheet( self.STRINGS_SHEET )
-        util    = workbook.add_sheet( self.UTIL_SHEET )        
         langcodes = self._makeLangList() if langcodes is None else langcodes
         head      = self._makeHeader(langcodes)
         
-        lines, conflicts = self.__getStrLines( langcodes, order, trim )
-        self.__writeLines( strings, 
-                           lines, 
-                           header=head,
-                           conflictIndexs=conflicts,
-                           headermagic=True)
-        self.__writeLines( util, 
-                           self.__getUtilLines(head, langcodes, order, trim), 
-                           header=[self.UTIL_SHEET_WARNING],
-                           hideUtilCol=False)
-        
-        workbook.save(self.__path)
+        if self.__path.lower().endswith( XLSX_EXT ):
+            self.__saveXLSX( head, langcodes, order, trim )
+        else: self.__saveXLS( head, langcodes, order, trim )
+        self.__pruner.save()
 
 
+    @staticmethod
+    def languagePath(path, langcode):
+        """The path of the file for one language code that saveByLanguage()
+        would write for `path`, the language code is put on the end of the 
+        name (eg, MasterTranslationFile_2058.xls).
+        """
+        base, ext = opath.splitext(path)
+        return "%s_%s%s"%(base, langcode, ext)
+    
+    def saveByLanguage(self, langcodes=None, order=False, trim=False, jobs=None):
+        """Saves one translation file for every language code after the first
+        (the primary one), each with just the primary and that language in 
+        it. They all have the whole util sheet, so any of them can be used to
+        update on its own, or all together (see combine()). The files are 
+        written next to this one, see languagePath(), by `jobs` workers. 
+        Returns the paths that were written.
+        """
+        langcodes = self._makeLangList() if langcodes is None else langcodes
+        if len(langcodes) < 2:
+            logging.warning("There are no languages to split the translation file into.")
+            return []
+        self.__pruner.save()
+        path, primary = self.__path, langcodes[0]
+        work = [ (TranslationFile.languagePath(path, lang), [primary, lang], order, trim) 
+                 for lang in langcodes[1:] ]
+        # the workers get the strings once each, not once for every language.
+        paths = list( orderedMap(_saveLanguage, work, jobs, shared=self.__forSaving()) )
+        logging.debug("Saved translation files: %s"%paths)
+        return paths
+    
+    def __forSaving(self):
+        ### A copy with only what saving needs, for saveByLanguage(). The 
+        ### indexes and what the Pruner learned (already saved) are left out,
+        ### and its path can move without moving this one's.
+        trans = copy.copy( self )
+        trans.__stringIndex = trans.__prunedIndex = trans.__idIndex = None
+        trans.__pruner = Pruner()
+        return trans
+    
+    def isPartial(self):
+        """Checks if the translation file only has some of the strings."""
+        return self.__partial
+    
+    def setPartial(self, partial=True):
+        """Marks the translation file as only having some of the strings of 
+        the system (only some projects, or only what changed, see 
+        limitToChanges()). It's kept in the util sheet, so whatever it's 
+        pushed into knows not to expect everything to be in it.
+        """
+        self.__partial = partial
+    
+    def combine(self, other):
+        """Adds the languages in `other` to this translation file. Both have
+        to be of the same strings (like the ones written by saveByLanguage()),
+        the values are matched up by their ids; the primary language is left
+        as is. Rows that were merged together in only one of the files are 
+        split back up where their values are different.
+        """
+        found = {} # id -> RCStringValue in other
+        for mid, ids in other.__mergelist.items():
+            try:    val = other.__strings[mid]
+            except: val = other.__pruned[mid]
+            for idn in ids: found[idn] = val
+        
+        missing = 0
+        for mid, ids in list(self.__mergelist.items()):
+            section = self.__strings if mid in self.__strings else self.__pruned
+            groups = {} # id(other value) -> (other value, [id])
+            for idn in ids:
+                oval = found.get(idn)
+                if oval is None: missing+=1
+                if id(oval) in groups: groups[id(oval)][1].append(idn)
+                else: groups[id(oval)] = (oval, [idn])
+            
+            for num, (oval, gids) in enumerate(groups.values()):
+                if num == 0: 
+                    newmid, val = mid, section[mid]
+                    self.__mergelist[mid] = gids
+                else:
+                    val = self.__copyValue( mid, section[mid].getID(), None )
+                    newmid = self.__newMid( val, section is self.__pruned )
+                    self.__mergelist[newmid], section[newmid] = gids, val
+                if oval is None: continue
+                for lang in oval.getLangCodes():
+                    if lang != self.__primaryLangCode: 
+                        val.addValuePair(lang, oval.getValue(lang, ''))
+        if missing > 0: logging.warning("Ids not in %s: %d"%(other.getPath(), missing))
+        
+        self.__idIndex = None
+        self.__stringIndex = _MergeIndex( self.__primaryLangCode )
+        self.__prunedIndex = _MergeIndex( self.__primaryLangCode )
+        for mid, val in self.__strings.items(): self.__stringIndex.add(mid, val)
+        for mid, val in self.__pruned.items():  self.__prunedIndex.add(mid, val)
+    
+    def merge(self, other):
+        """Adds everything in `other`, a translation file of other projects
+        (like one shard of a bigger system), to this one. The projects in it
+        are numbered after the ones already here and its strings are merged
+        in the same way they would have been if they were added here, but 
+        they stay in the section (strings or pruned) they were in.
+        """
+        renum = { str(num):str(self.getProjKey(name)) for name, num in other.__projs.items() }
+        def fix(id):
+            num, rest = id.split(".",1)
+            return "%s.%s"%(renum.get(num, num), rest)
+        self.__utils.update( (fix(idn), val) for idn, val in other.__utils.items() )
+        self.__seps.extend( fix(xpath) for xpath in other.__seps )
+        for mid, ids in other.__mergelist.items():
+            pruned = mid not in other.__strings
+            val = other.__pruned[mid] if pruned else other.__strings[mid]
+            self.__addStringLine([ "%s.%s"%(idn[0], fix(idn[2:])) for idn in ids ], val, pruned)
+    
     def getSysMenuFile(self, path, save=False, langcodes=None):
         """ Generates a System Menu File from the internals of the translation
         file. This does not save the file, instead is merely returned. This can
@@ -186,15 +463,11 @@ class TranslationFile():
         file. This does not save the file, instead is merely returned. This can
         be changed, by setting `save` to True.
         """
-        global MenuIdMatcher
         csvfile = SysMenuFileCSV(path)
         data ={}
-        for mid, ids in self.__mergelist.items():
-            for idn in ids:
-                if MenuIdMatcher.search(idn) is not None:
-                    newid = idn.split(".",1)[1]
-                    try:    data[newid] = self.__strings[mid].limitByCodes(langcodes)
-                    except: data[newid] = self.__pruned[mid].limitByCodes(langcodes)
+        for newid, mid in self.__getIdIndex()['m']:
+            try:    data[newid] = self.__strings[mid].limitByCodes(langcodes)
+            except: data[newid] = self.__pruned[mid].limitByCodes(langcodes)
         csvfile._setInternals(data, self.__projs, self.__utils, self.__seps)
         if save: csvfile.save()
         return csvfile
@@ -204,27 +477,18 @@ class TranslationFile():
         translation file. This does not save the file, instead is merely 
         returned. This can be changed, by setting `save` to True.
         """
-        global DialogIdMatcher
         dlog = SysDialogFile(path)
         projdialogs = {} # projkey -> { dialogid -> dialog }
-        for mid, ids in self.__mergelist.items():
-            for idn in ids:
-                if DialogIdMatcher.search(idn) is not None:
-                    projkey, did, strid = DialogIdMatcher.search(idn).groups()
-                    try:    val = copy.deepcopy( self.__strings[mid] )
-                    except: val = copy.deepcopy( self.__pruned[mid] )
-                    val.setID( strid )
-                    val = val.limitByCodes( langcodes )
-                    
-                    if projdialogs.get(projkey) is None:
-                        projdialogs[projkey] = {}
-                    
-                    if projdialogs[projkey].get(did, None) is None:
-                        dialog = RCDialog(did)
-                        dialog._values.append(val)
-                        projdialogs[projkey][did] = dialog
-                    else:
-                        projdialogs[projkey][did]._values.append(val)
+        for projkey, entries in self.__getIdIndex()['d'].items():
+            dialogs = projdialogs[projkey] = {}
+            for (did, strid), mid in entries:
+                val = self.__copyValue( mid, strid, langcodes )
+                if dialogs.get(did, None) is None:
+                    dialog = RCDialog(did)
+                    dialog._values.append(val)
+                    dialogs[did] = dialog
+                else:
+                    dialogs[did]._values.append(val)
         
         for projkey, dlogs in projdialogs.items():
             dlog._projs[self.getProjName(projkey)] = dlogs.values()
@@ -238,32 +502,62 @@ class TranslationFile():
         """
         strtblfile = SysStrTblFile( path )
         projtables = {} # projkey -> RCStrTbl
-        for mid, ids in self.__mergelist.items():
-            for idn in ids:
-                if ConstantIdMatcher.search(idn) is not None:
-                    projkey, consid = ConstantIdMatcher.search(idn).groups()
-                    try:    val = copy.deepcopy( self.__strings[mid] )
-                    except: val = copy.deepcopy( self.__pruned[mid] )
-                    val.setID( consid )
-                    if projtables.get(projkey, None) is None:
-                        projtables[projkey] = RCStrTbl()
-                    projtables[projkey].addStringValue( val.limitByCodes(langcodes) )
+        for projkey, entries in self.__getIdIndex()['c'].items():
+            strtbl = projtables[projkey] = RCStrTbl()
+            for (consid,), mid in entries:
+                strtbl.addStringValue( self.__copyValue( mid, consid, langcodes ) )
         for proj, strtbl in projtables.items():
             strtblfile._projs[ self.getProjName(proj) ] = strtbl
         if save: strtblfile.save()
         return strtblfile
 
-    
+    def getLookups(self):
+        """Compiles the translation file into a TranslationLookup for every
+        project in it (projname -> TranslationLookup), which is all that's
+        needed to push it into resource files (see RCSFile.updateFromLookup).
+        None of the system or project level files are made to do this, and
+        the values aren't copied.
+        """
+        index = self.__getIdIndex()
+        lookups = {} # projname -> TranslationLookup
+        def lookup(projkey):
+            name = self.getProjName(projkey)
+            if name not in lookups: lookups[name] = TranslationLookup(name, self.__partial)
+            return lookups[name]
+
+        for projkey, entries in index['d'].items():
+            found = lookup(projkey)
+            for (did, strid), mid in entries:
+                found.addValue('d', did, strid, self.__getValue(mid))
+        for projkey, entries in index['c'].items():
+            found = lookup(projkey)
+            for (consid,), mid in entries:
+                found.addValue('c', '', consid, self.__getValue(mid))
+
+        menus = {} # (projkey, menuid) -> [xpath], values first then separators
+        for newid, mid in index['m']:
+            projkey, menuid, xpath = newid.split('.', 2)
+            lookup(projkey).addValue('m', menuid, xpath, self.__getValue(mid))
+            menus.setdefault( (projkey, menuid), [] ).append( xpath )
+        for sep in self.__seps:
+            projkey, menuid, xpath = sep.split('.', 2)
+            menus.setdefault( (projkey, menuid), [] ).append( xpath )
+        for (projkey, menuid), xpaths in menus.items():
+            layout = self.__menuLayout( projkey, menuid, xpaths )
+            lookup(projkey).setMenuLayout( menuid, layout )
+        return lookups
+
+
     def updateWithMenuFile(self, menuFile, preloaded=True, saveAfter=False):
         """Updates the translation file with the values of a system level
         menu file. It will not save the translation file unless `saveAfter` is
         True. The `preloaded` parameter is to know whether the file has been 
         loaded into memory already.
+        Only the menus are replaced, the dialogs and string tables are left as they are.
         """
         csvmenu = ConvertMenuXML2CSV('tmp.cmenus', menuFile, preloaded)
-        dialogs = self.getSysDialogFile('tmp.dialogs')
-        strings = self.getSysStrTblFile('tmp.strtbls')
-        self.setSysFiles(csvmenu, dialogs, strings)
+        self.__removeKind('m')
+        self.__addMenuCSV( csvmenu )
         if saveAfter: self.save()
     
     def updateWithDialogFile(self, dialogFile, preloaded=True, saveAfter=False):
@@ -271,11 +565,11 @@ class TranslationFile():
         dialog file. It will not save the translation file unless `saveAfter`
         is True. The `preloaded` parameter is to know whether the file has been 
         loaded into memory already.
+        Only the dialogs are replaced, the menus and string tables are left as they are.
         """
         if not preloaded: dialogFile.load()
-        csvmenu = self.getSysMenuFileCSV('tmp.cmenus')
-        strings = self.getSysStrTblFile('tmp.strtbls')
-        self.setSysFiles(csvmenu, dialogFile, strings)
+        self.__removeKind('d')
+        self.__addDialogs( dialogFile )
         if saveAfter: self.save()
     
     def updateWithStrTblFile(self, strFile, preloaded=True, saveAfter=False):
@@ -283,12 +577,21 @@ class TranslationFile():
         string table file. It will not save the translation file unless 
         `saveAfter` is True. The `preloaded` parameter is to know whether the 
         file has been loaded into memory already.
+        Only the string tables are replaced, the menus and dialogs are left as they are.
         """
         if not preloaded: strFile.load()
-        csvmenu = self.getSysMenuFileCSV('tmp.cmenus')
-        dialogs = self.getSysDialogFile('tmp.dialogs')
-        self.setSysFiles(csvmenu, dialogs, strFile)
+        self.__removeKind('c')
+        self.__addStrTbls( strFile )
         if saveAfter: self.save()
+    
+    def updateMasterDB(self, db, langcodes=None):
+        """Pushes the values in the translation file into a SysMasterDB. Just
+        like pushing into the System files, only values already in the 
+        database are updated.
+        """
+        db.updateFromTranslation( self.getSysMenuFile('', langcodes=langcodes),
+                                  self.getSysDialogFile('', langcodes=langcodes),
+                                  self.getSysStrTblFile('', langcodes=langcodes) )
       
       
     def setSysFiles(self, csvmenu, dialogs, strings):
@@ -296,47 +599,130 @@ class TranslationFile():
         current data. It will not do any updating.
         """
         self.__strings, self.__utils, self.__projs, self.__seps, self.__pruned = {}, {}, {}, [], {}
+        self.__mergelist, self.__idIndex, self.__projNames = {}, None, {}
+        self.__stringIndex = _MergeIndex( self.__primaryLangCode )
+        self.__prunedIndex = _MergeIndex( self.__primaryLangCode )
         self.__projs, self.__utils, self.__seps = csvmenu._getXMLUtilSections()
         data = csvmenu._getXMLDataSection()
         for id, val in data.items(): #the csv makes it easy
             newid = "m.%s"%id
-            self.__addStringLine(newid, val)   
+            self.__addStringLine([newid], val)   
         
-        for project, table in strings._projs.items():
-            try:
-                if table is None: continue
-                for val in table._values:
-                    newid = "c.%d.%s"%(self.getProjKey(project), str(val.getID()))
-                    self.__addStringLine(newid, val)
-            except KeyError:
-                logging.error("Project %s doesn't exist in given string table file."%project)
+        self.__addStrTbls( strings )
+        self.__addDialogs( dialogs )
         
-        for project, dlogs in dialogs._projs.items():
-            try:
-                for dlog in dlogs:
-                    newid = "d.%d.%s"%( self.getProjKey(project), str(dlog.id))
-                    for val in dlog._values:
-                        vid = "%s.%s"%( newid, str(val.getID()))
-                        self.__addStringLine(vid, val)
-            except KeyError:
-                logging.error("Project %s doesn't exist in given dialog file."%project)
+    def writeConflictReport(self, path, langcodes=None):
+        """Writes a CSV file listing every string that has more than one 
+        translation, grouped by the primary language value they share. Each
+        row is the group number, the ids and the values of the language 
+        codes. Returns the number of groups found.
+        """
+        langcodes = self._makeLangList() if langcodes is None else langcodes
+        primary = langcodes[0] if len(langcodes) > 0 else None
+        groups = self.__findConflicts( self.__primaryLangCode or primary )
+        lines = [ ['group'] + self._makeHeader(langcodes) ]
+        for num, group in enumerate(groups, 1):
+            for mid in group:
+                val = self.__strings[mid]
+                lines.append( [str(num), ",".join(self.__mergelist[mid])] + 
+                              [ val.getValue(lang, '') for lang in langcodes ] )
+        LSCSV( path ).writeLines( lines )
+        logging.debug("Conflict groups: %d, written to: %s"%(len(groups), path))
+        return len(groups)
+    
+    def limitToChanges(self, baseline):
+        """Takes out every string that is the same in the `baseline` 
+        TranslationFile, leaving only the ones that are new or have a 
+        different primary language value. Strings are matched on their kind,
+        project, container (menu or dialog) and id, since the project 
+        numbers and merged rows are different in every translation file. 
+        Menus need their popups to be put back together, so any that are 
+        left out are kept in the pruned section instead. Returns the number 
+        of ids left.
+        """
+        primary = self.__primaryLangCode
+        seen = {} # (kind, project, container, id) -> set([primary value])
+        for mid, ids in baseline.__mergelist.items():
+            try:    val = baseline.__strings[mid]
+            except: val = baseline.__pruned[mid]
+            prime = val.getValue(primary, '')
+            for idn in ids:
+                key = baseline.__changeKey( idn )
+                if key is None: continue
+                if key in seen: seen[key].add(prime)
+                else: seen[key] = set([prime])
+        
+        kept, menuids = {}, {} # mid -> [id], menu id -> mid
+        for mid, ids in self.__mergelist.items():
+            try:    val = self.__strings[mid]
+            except: val = self.__pruned[mid]
+            prime = val.getValue(primary, '')
+            for idn in ids:
+                if idn.startswith("m."): menuids[idn] = mid
+                if prime in seen.get( self.__changeKey( idn ), () ): continue
+                if mid in kept: kept[mid].append(idn)
+                else: kept[mid] = [idn]
+        
+        # the popups above every menu item that's left have to be there too.
+        needed = {} # mid -> [id]
+        have = set( idn for ids in kept.values() for idn in ids )
+        for ids in list(kept.values()):
+            for idn in ids:
+                if not idn.startswith("m."): continue
+                parts = idn.split(".")
+                for end in range(4, len(parts)):
+                    parent = ".".join(parts[:end])
+                    if parent in have or parent not in menuids: continue
+                    have.add(parent)
+                    pmid = menuids[parent]
+                    if pmid in needed: needed[pmid].append(parent)
+                    else: needed[pmid] = [parent]
+        
+        strings, pruned = {}, {}
+        for mid, ids in kept.items():
+            if mid in self.__strings: strings[mid] = self.__strings[mid]
+            else: pruned[mid] = self.__pruned[mid]
+        parents = {}
+        for mid, ids in needed.items():
+            try:    parents[mid] = self.__strings[mid]
+            except: parents[mid] = self.__pruned[mid]
         
+        self.__strings, self.__pruned, self.__mergelist = strings, pruned, kept
+        self.__partial = True
+        for mid, ids in needed.items():
+            newmid = self.__newMid( parents[mid], True )
+            self.__pruned[newmid] = parents[mid]
+            self.__mergelist[newmid] = ids
+        self.__idIndex = None
+        self.__stringIndex = _MergeIndex( self.__primaryLangCode )
+        self.__prunedIndex = _MergeIndex( self.__primaryLangCode )
+        for mid, val in self.__strings.items(): self.__stringIndex.add(mid, val)
+        for mid, val in self.__pruned.items():  self.__prunedIndex.add(mid, val)
+        count = sum( len(ids) for ids in kept.values() )
+        logging.debug("Ids changed since the baseline: %d (+%d menu parents)"%(count, len(have)-count))
+        return count
+    
     def getProjKey(self, name):
         """Get the project number mapping for a project name."""
         try:
             return self.__projs[name]
         except:
-            maxval = max(self.__projs.values())
+            # numbers are strings when they were loaded from the util sheet.
+            maxval = max([int(v) for v in self.__projs.values()] or [-1])
             self.__projs[name] = maxval+1
             return maxval+1
             
     
     def getProjName(self, num):
-        #logging.error("num = %s, projs= %s"% (num, self.__projs))
-        for k,v in self.__projs.items():
-            #logging.error("getting projname: %s ?= %s"%(v,num))
-            if v == num: return k
-        raise Exception("Couldnt find name!!")
+        """Get the project name for a project number (or its string)."""
+        name = self.__projNames.get( str(num) )
+        if name is None:
+            # the project map is shared with the menu csv, so it could have
+            # grown since we last looked.
+            self.__projNames = { str(v):k for k,v in self.__projs.items() }
+            name = self.__projNames.get( str(num) )
+        if name is None: raise Exception("Couldnt find name!!")
+        return name
     
     
     def getProjNames(self):
@@ -359,36 +745,187 @@ class TranslationFile():
             else: langs.append( lang )
         return TranslationFile.HEADER_COLS+langs
         
-    def __addStringLine(self, idn, value):
-        found = False
-        if not self.__pruner.isPrunable( value, self.__primaryLangCode ): #then add to strings dict
-            err = False
-            for mid, val in self.__strings.items():
-                comp,err = val.compare( value, ignoreID=True, retErr=True )
-                if err and self.__markconflicts: 
-                    self.__conflicts.append(mid) 
-                if comp:
-                    self.__mergelist[mid].append(idn)
-                    self.__strings[mid].combine(value, True,True)
-                    found = True
-                    break
-            if not found:
-                mid = uuid.uuid4()
-                self.__mergelist[mid] = [idn]
-                if err and self.__markconflicts: 
-                    self.__conflicts.append(mid)
+    def __addMenuCSV(self, csvmenu):
+        ### Adds the menus of a SysMenuFileCSV to what's already here. The 
+        ### projects are numbered the way they already are (the dialogs and 
+        ### string tables use them), and the menu util sections are replaced.
+        projs, utils, seps = csvmenu._getXMLUtilSections()
+        renum = { str(num):str(self.getProjKey(name)) for name, num in projs.items() }
+        def fix(id):
+            num, rest = id.split(".",1)
+            return "%s.%s"%(renum.get(num, num), rest)
+        self.__utils = { fix(idn):val for idn, val in utils.items() }
+        self.__seps  = [ fix(xpath) for xpath in seps ]
+        for id, val in csvmenu._getXMLDataSection().items():
+            self.__addStringLine(["m.%s"%fix(id)], val)
+    
+    def __addStrTbls(self, strings):
+        ### Adds the values of every project in a SysStrTblFile.
+        for project, table in strings._projs.items():
+            try:
+                if table is None: continue
+                for val in table._values:
+                    newid = "c.%s.%s"%(self.getProjKey(project), str(val.getID()))
+                    self.__addStringLine([newid], val)
+            except KeyError:
+                logging.error("Project %s doesn't exist in given string table file."%project)
+    
+    def __addDialogs(self, dialogs):
+        ### Adds the values of every dialog of every project in a 
+        ### SysDialogFile.
+        for project, dlogs in dialogs._projs.items():
+            try:
+                for dlog in dlogs:
+                    newid = "d.%s.%s"%( self.getProjKey(project), str(dlog.id))
+                    for val in dlog._values:
+                        vid = "%s.%s"%( newid, str(val.getID()))
+                        self.__addStringLine([vid], val)
+            except KeyError:
+                logging.error("Project %s doesn't exist in given dialog file."%project)
+    
+    def __changeKey(self, idn):
+        ### What an id is matched on between translation files, see 
+        ### limitToChanges(). Menu popups without an id have a made up one
+        ### which is left out.
+        global MenuIdMatcher, DialogIdMatcher, ConstantIdMatcher, GeneratedIdn
+        try:
+            if idn.startswith("m."):
+                projkey, xpath = MenuIdMatcher.search(idn).groups()
+                menuid, *path = xpath.split(".")
+                path = [ '' if GeneratedIdn.search(part) else part for part in path ]
+                return ('m', self.getProjName(projkey), menuid, ".".join(path))
+            elif idn.startswith("d."):
+                projkey, did, strid = DialogIdMatcher.search(idn).groups()
+                return ('d', self.getProjName(projkey), did, strid)
+            elif idn.startswith("c."):
+                projkey, consid = ConstantIdMatcher.search(idn).groups()
+                return ('c', self.getProjName(projkey), '', consid)
+        except Exception: pass # broken id or unknown project.
+        return None
+    
+    def __removeKind(self, kind):
+        ### Takes every id of one kind ('m', 'd' or 'c') out of the merge 
+        ### list, strings left without any ids are removed altogether. The 
+        ### other kinds are left alone.
+        prefix = kind+"."
+        removed = False
+        for mid in list(self.__mergelist.keys()):
+            ids = self.__mergelist[mid]
+            keep = [ idn for idn in ids if not idn.startswith(prefix) ]
+            if len(keep) == len(ids): continue
+            elif len(keep) > 0: 
+                self.__mergelist[mid] = keep
+                continue
+            del self.__mergelist[mid]
+            self.__strings.pop(mid, None)
+            self.__pruned.pop(mid, None)
+            removed = True
+        self.__idIndex = None
+        if removed: # the merge indexes can't forget, so start them over.
+            self.__stringIndex = _MergeIndex( self.__primaryLangCode )
+            self.__prunedIndex = _MergeIndex( self.__primaryLangCode )
+            for mid, val in self.__strings.items(): self.__stringIndex.add(mid, val)
+            for mid, val in self.__pruned.items():  self.__prunedIndex.add(mid, val)
+    
+    def __getIdIndex(self):
+        ### Splits the ids in the merge list up by the system file they go
+        ### to, in the same order as the merge list. 'm' is a list of 
+        ### (projkey.xpath, mid), 'd' is projkey -> [((dialogid, strid), mid)]
+        ### and 'c' is projkey -> [((constantid,), mid)]. It's built the 
+        ### first time it's needed and thrown away when the strings change.
+        global MenuIdMatcher, DialogIdMatcher, ConstantIdMatcher
+        if self.__idIndex is not None: return self.__idIndex
+        index = { 'm':[], 'd':{}, 'c':{} }
+        matchers = { 'd':DialogIdMatcher, 'c':ConstantIdMatcher }
+        for mid, ids in self.__mergelist.items():
+            for idn in ids:
+                kind = idn[:1]
+                if kind == 'm':
+                    if MenuIdMatcher.search(idn) is not None:
+                        index['m'].append( (idn.split(".",1)[1], mid) )
+                    continue
+                match = matchers[kind].search(idn) if kind in matchers else None
+                if match is None: continue
+                projkey, *parts = match.groups()
+                if projkey not in index[kind]: index[kind][projkey] = []
+                index[kind][projkey].append( (tuple(parts), mid) )
+        self.__idIndex = index
+        return index
+    
+    def __copyValue(self, mid, newid, langcodes):
+        ### Makes a new value with the new id for one of the ids merged into 
+        ### `mid`, limited to the language codes if there are any.
+        try:    val = self.__strings[mid]
+        except: val = self.__pruned[mid]
+        newval = RCStringValue( newid )
+        for lang in (langcodes if langcodes else val.getLangCodes()):
+            tmp = val.getValue(lang)
+            if tmp is not None: newval.addValuePair(lang, tmp)
+        return newval
+    
+    def __getValue(self, mid):
+        try:    return self.__strings[mid]
+        except: return self.__pruned[mid]
+
+    def __menuLayout(self, projkey, menuid, xpaths):
+        ### Puts the nodes of a menu in the order they are in the menu, the
+        ### same way the menus are rebuilt in _ReconstructMenus(): siblings
+        ### by their order and anything without a parent is left out.
+        children = {} # parent xpath -> [(order, num, xpath, type)]
+        for num, xpath in enumerate(xpaths):
+            try:
+                order, typeid = self.__utils["%s.%s.%s"%(projkey, menuid, xpath)]
+                typeid = RCMenuNodeType.getType(typeid)
+            except (KeyError, TypeError): continue
+            parent = xpath.rsplit('.', 1)[0] if '.' in xpath else ''
+            children.setdefault( parent, [] ).append( (int(order), num, xpath, typeid) )
+
+        layout = []
+        def walk(parent, depth):
+            for _, _, xpath, typeid in sorted(children.get(parent, [])):
+                layout.append( (xpath, typeid, depth) )
+                if typeid == RCMenuNodeType.POPUP: walk(xpath, depth+1)
+        walk('', 1)
+        return layout
+
+    def __newMid(self, value, pruned=False):
+        ### Merged values are keyed on what they were first made with, so 
+        ### the same files always give the same keys. Anything that ends up
+        ### with the same one (the same value pruned and not) is bumped.
+        global MergeIdNamespace
+        base = "%s:%s"%("p" if pruned else "s", sorted(value.values.items()))
+        mid, count = uuid.uuid5(MergeIdNamespace, base), 0
+        while mid in self.__mergelist:
+            count += 1
+            mid = uuid.uuid5(MergeIdNamespace, "%s#%d"%(base, count))
+        return mid
+    
+    def __addStringLine(self, idns, value, pruned=None):
+        ### Merges the value into the strings (or pruned strings) under
+        ### the list of ids given. The Pruner decides which unless `pruned`
+        ### is given.
+        self.__idIndex = None
+        if pruned is None: pruned = self.__pruner.isPrunable( value, self.__primaryLangCode )
+        if not pruned: #then add to strings dict
+            mid = self.__stringIndex.find( self.__strings, value )
+            if mid is not None:
+                self.__mergelist[mid].extend(idns)
+                self.__strings[mid].combine(value, True,True)
+            else:
+                mid = self.__newMid( value )
+                self.__mergelist[mid] = list(idns)
                 self.__strings[mid] = value
+                self.__stringIndex.add(mid, value)
         else: #since we can prune it, lets add it to the prune list.
-            for mid, val in self.__pruned.items():
-                if val.compare( value, ignoreID=True ) :
-                    self.__mergelist[mid].append(idn)
-                    self.__pruned[mid].combine(value, True,True)
-                    found = True
-                    break
-            if not found:
-                mid = uuid.uuid4()
-                self.__mergelist[mid] = [idn]
+            mid = self.__prunedIndex.find( self.__pruned, value )
+            if mid is not None:
+                self.__mergelist[mid].extend(idns)
+                self.__pruned[mid].combine(value, True,True)
+            else:
+                mid = self.__newMid( value, True )
+                self.__mergelist[mid] = list(idns)
                 self.__pruned[mid] = value
+                self.__prunedIndex.add(mid, value)
         
     def __translateCodes(self, langstrs):
         codes = []
@@ -400,27 +937,46 @@ class TranslationFile():
             codes.append(str(code))
         return codes
         
-    def __loadStringLines(self):
+    def __loadStringLines(self, workbook, validate=False):
         global IDMatcher
-        rows = self.__readSheet( TranslationFile.STRINGS_SHEET, 0 )
+        rows = self.__readSheet( workbook, TranslationFile.STRINGS_SHEET, 0 )
         langcodes = []
         headeroffset = len(TranslationFile.HEADER_COLS)
         for head in rows:
             langcodes = head[headeroffset:]
             break
         langcodes = self.__translateCodes( langcodes )
-        for row in rows:
+        seen = {} # id -> row, only when validating.
+        last = None # (mid, value) of the row before.
+        self.__idIndex = None
+        for rownum, row in enumerate(rows, 2):
             midlist=row[0].split(",")
             col = 1
             val = RCStringValue()
             for lang in langcodes:
                 val.addValuePair(lang, row[col])
                 col+=1
-            #add value 
-            for idn in midlist: self.__addStringLine(idn, val) #OMG SO SLOW, but it works
+            if validate:
+                for idn in midlist:
+                    if IDMatcher.search(idn) is None:
+                        logging.warning("Bad id '%s' on row %d of the strings sheet."%(idn, rownum))
+                    elif idn in seen:
+                        logging.warning("Id '%s' is on rows %d and %d of the strings sheet."%(idn, seen[idn], rownum))
+                    else: seen[idn] = rownum
+            # the sheet was merged and pruned when it was saved, so the rows
+            # go straight in. A row that was split up (see __splitIds) comes 
+            # right after the rest of it, and is joined back together.
+            if last is not None and last[1].values == val.values:
+                self.__mergelist[last[0]].extend(midlist)
+                continue
+            mid = self.__newMid( val )
+            self.__mergelist[mid] = midlist
+            self.__strings[mid] = val
+            self.__stringIndex.add(mid, val)
+            last = (mid, val)
     
-    def __loadUtilLines(self):
-        rows = self.__readSheet( TranslationFile.UTIL_SHEET, 1 )
+    def __loadUtilLines(self, workbook):
+        rows = self.__readSheet( workbook, TranslationFile.UTIL_SHEET, 1 )
         langcodes = []
         headeroffset = len(TranslationFile.HEADER_COLS)
         for head in rows:
@@ -430,7 +986,10 @@ class TranslationFile():
         projOrUtil = 0 # 0=proj,1=util,2=seps,3=pruned
         
         for row in rows: 
-            if row[0] == "PROJMAP":
+            if row[0] == "PARTIAL":
+                self.__partial = True
+                continue
+            elif row[0] == "PROJMAP":
                 projOrUtil = 0
                 continue
             elif row[0] == "XMLUTIL":
@@ -455,9 +1014,11 @@ class TranslationFile():
                     for lang in langcodes:
                         val.addValuePair(lang, row[col])
                         col+=1
-                    mid = uuid.uuid4()
+                    mid = self.__newMid( val, True )
                     self.__mergelist[mid]=midlist
+                    self.__idIndex = None
                     self.__pruned[mid]=val
+                    self.__prunedIndex.add(mid, val)
                 else:
                     #sometimes a project name might match an ID, in 
                     # these instances we have to be careful.
@@ -478,111 +1039,147 @@ class TranslationFile():
             if row[x] != val: return False
         return True
     
-    def __breakUpList(self, lst, maxsize=30000, fakeLimit=300, newlst=None):
-        if len(",".join(lst)) > maxsize:
-            size = int(len(lst)/2)
-            #break the list into equal parts
-            a,b = lst[:size], lst[size:]
-            #recurse on each part
-            alst = self.__breakUpList(a,newlst=newlst)
-            blst = self.__breakUpList(b,newlst=newlst)
-            #upon return, concat the two lists and return
-            return alst+blst
-        else:
-            if newlst is None: return [",".join(lst)]
-            else:
-                newlst.append([",".join(lst)])
-                return newlst
+    def __splitIds(self, ids, maxsize=30000):
+        ### Joins the ids for a cell, splitting them up into as many cells
+        ### as it takes to stay under the max cell size.
+        if len(ids) > 1 and sum(map(len, ids))+len(ids)-1 > maxsize:
+            size = int(len(ids)/2)
+            yield from self.__splitIds(ids[:size], maxsize)
+            yield from self.__splitIds(ids[size:], maxsize)
+        else: yield ",".join(ids)
+    
+    def __sortedMids(self, values, langcode, order=False):
+        ### The mids of the values in the order they are written, sorted by
+        ### the value in `langcode` if `order` is True. Only (value, mid)
+        ### pairs are sorted, not the values themselves.
+        if not order: return iter(values)
+        pairs = [ (val.getValue(langcode, ''), mid) for mid, val in values.items() ]
+        pairs.sort(key=lambda pair: pair[0])
+        return ( mid for _, mid in pairs )
     
     def __getUtilLines(self, header, langorder, order=False, trim=False):
-        lines = [header]
-        lines.append(['PROJMAP'])
+        yield header
+        if self.__partial: yield ['PARTIAL']
+        yield ['PROJMAP']
         for proj,num in self.__projs.items():
-            lines.append([proj, str(num)])
-        lines.append(['XMLUTIL'])
-        for idn, val in self.__utils.items():
-            order, typeid = val
-            lines.append([idn, order, typeid])
-        lines.append(["SEPS"])
+            yield [proj, str(num)]
+        yield ['XMLUTIL']
+        for idn, (norder, typeid) in self.__utils.items():
+            yield [idn, norder, typeid]
+        yield ["SEPS"]
         for xpath in self.__seps:
-            lines.append([xpath])
-        lines.append(["PRUNED"])
-        key = None if not order else (lambda x: x[1].getValue(langorder[0],''))
-        for mid, val in sorted(self.__pruned.items(), key=key):
-            midlist = ",".join(self.__mergelist[mid])
-            if len(midlist) > 30000: #max cell size
-                midlines = self.__breakUpList(self.__mergelist[mid])
-                for line in midlines:
-                    for lang in langorder: 
-                        line.append(val.getValue(lang,''))
-                    if trim and self.__rest(1, line, ''): continue
-                    lines.append(line)
-            else:
+            yield [xpath]
+        yield ["PRUNED"]
+        # without an order they stay in the order they were added.
+        langcode = langorder[0] if len(langorder) > 0 else None
+        for mid in self.__sortedMids( self.__pruned, langcode, order ):
+            val = self.__pruned[mid]
+            for midlist in self.__splitIds( self.__mergelist[mid] ):
                 line = [midlist]
                 for lang in langorder: 
                     line.append(val.getValue(lang,''))
                 if trim and self.__rest(1, line, ''): continue
-                lines.append(line)
-        return lines
+                yield line
+    
+    def __findConflicts(self, primary=None):
+        ### Groups the strings by their primary language value, any group
+        ### with more than one string in it is a conflict (since they would
+        ### have been merged if the rest of their languages were the same).
+        ### Returns the groups of mids, in the order they were added.
+        if primary is None: primary = self.__primaryLangCode
+        if primary is None: return []
+        groups = {} # primary value -> [mid]
+        for mid, val in self.__strings.items():
+            prime = val.getValue(primary, '')
+            if prime == '': continue
+            if prime in groups: groups[prime].append(mid)
+            else: groups[prime] = [mid]
+        return [ group for group in groups.values() if len(group) > 1 ]
     
     def __getStrLines(self, langorder, order=False, trim=False):
-        lines = []
-        conflictIndexs = []
+        ### Yields each line for the strings sheet along with whether it 
+        ### should be marked as a conflict.
+        if self.__markconflicts:
+            primary = langorder[0] if len(langorder) > 0 else None
+            groups = self.__findConflicts( self.__primaryLangCode or primary )
+            self.__conflicts = set( mid for group in groups for mid in group )
         remove = len(langorder) <= 1
-        key = None if not order or len(langorder)==0 else (lambda x: x[1].getValue(langorder[0], ''))
-        for mid, val in sorted(self.__strings.items(), key=key):
-            midlist = ",".join(self.__mergelist[mid])
-            if len(midlist) > 30000: #max cell size
-                midlines = self.__breakUpList(self.__mergelist[mid])
-                for line in midlines:
-                    for lang in langorder: 
-                        tmp = val.getValue(lang,'')
-                        if remove and tmp == '': continue 
-                        line.append(tmp)
-                    if trim and self.__rest(1, line, ''): continue
-                    if self.__markconflicts and mid in self.__conflicts:
-                        conflictIndexs.append(len(lines))
-                    lines.append(line)
-            else:    
+        langcode = langorder[0] if len(langorder) > 0 else None
+        count, conflicts = 0, 0
+        for mid in self.__sortedMids( self.__strings, langcode, order ):
+            val = self.__strings[mid]
+            conflict = self.__markconflicts and mid in self.__conflicts
+            for midlist in self.__splitIds( self.__mergelist[mid] ):
                 line = [midlist]
                 for lang in langorder:
                     tmp = val.getValue(lang,'')
                     if remove and tmp == '': continue 
                     line.append(tmp)
                 if trim and self.__rest(1, line, ''): continue
-            
-                if self.__markconflicts and mid in self.__conflicts:
-                    conflictIndexs.append(len(lines))
-                    
-                lines.append(line)
-        logging.debug("Unique Strings:%d, Possible Conflicts:%d"%(len(lines),len(conflictIndexs)))
-        return lines, conflictIndexs
+                count+=1
+                if conflict: conflicts+=1
+                yield line, conflict
+        logging.debug("Unique Strings:%d, Possible Conflicts:%d"%(count,conflicts))
       
-    def __readSheet(self, name, rowstart=0):
+    def __readSheet(self, workbook, name, rowstart=0):
         """Reads through a sheet, row by row. Starting at the specified row.
         The return will be a list of strings, similarly to the CSV package. 
+        The sheet is unloaded from the workbook once it has been read.
         """
-        workbook = xlrd.open_workbook(filename=self.__path, on_demand=True)
+        global CELL_STRINGS
+        if type(workbook) is XLSXReader:
+            # numbers come back as floats, just like xlrd's.
+            for row in workbook.readSheet(name, rowstart):
+                yield [ _NumberString(val) if type(val) is float else val for val in row ]
+            return
         sheet = workbook.sheet_by_name(name)
-        for rownum in range(rowstart, sheet.nrows):
-            vals=[]
-            for cell in sheet.row(rownum):
-                if cell.ctype in [0,6]: #blank string
-                    vals.append('')
-                elif cell.ctype == 2: #number
-                    try: 
-                        val = float(cell.value)
-                        vals.append(str(int(val)))
-                    except:  vals.append(str(cell.ctype))
-                else: #text,date,bool,error
-                    vals.append(str(cell.value))
-            yield vals
+        try:
+            for rownum in range(rowstart, sheet.nrows):
+                yield list(map(lambda ctype, value: CELL_STRINGS.get(ctype, str)(value),
+                               sheet.row_types(rownum), sheet.row_values(rownum)))
+        finally: workbook.unload_sheet(name)
    
-    def __writeLines(self, worksheet, lines, header=None, headermagic=False, hideUtilCol=True, conflictIndexs=None):
+    def __saveXLS(self, head, langcodes, order, trim):
+        ### Writes the strings and util sheets out with xlwt.
+        workbook = xlwt.Workbook()
+        strings = workbook.add_sheet( self.STRINGS_SHEET )
+        util    = workbook.add_sheet( self.UTIL_SHEET )        
+        self.__writeLines( strings, 
+                           self.__getStrLines(langcodes, order, trim), 
+                           header=head,
+                           headermagic=True)
+        self.__writeLines( util, 
+                           ( (line, False) for line in self.__getUtilLines(head, langcodes, order, trim) ), 
+                           header=[self.UTIL_SHEET_WARNING],
+                           hideUtilCol=False)
+        workbook.save(self.__path)
+    
+    def __saveXLSX(self, head, langcodes, order, trim):
+        ### Same as __saveXLS(), but the rows are streamed out into an xlsx
+        ### file instead.
+        workbook = XLSXWorkbook( self.__path )
+        try:
+            self.__writeXLSXLines( workbook.addSheet( self.STRINGS_SHEET, 1, [0] ),
+                                   self.__getStrLines(langcodes, order, trim),
+                                   header=head,
+                                   headermagic=True )
+            self.__writeXLSXLines( workbook.addSheet( self.UTIL_SHEET ),
+                                   ( (line, False) for line in self.__getUtilLines(head, langcodes, order, trim) ),
+                                   header=[self.UTIL_SHEET_WARNING] )
+        finally: workbook.close()
+    
+    def __writeXLSXLines(self, sheet, rows, header=None, headermagic=False):
+        ### Like __writeLines(), except freezing the header and hiding the
+        ### util column is set when the sheet is added.
+        if header is not None:
+            sheet.writeRow( header, XLSXStyle.HEADER if headermagic else XLSXStyle.NORMAL )
+        for line, conflict in rows:
+            sheet.writeRow( line, XLSXStyle.CONFLICT if conflict else XLSXStyle.NORMAL )
+    
+    def __writeLines(self, worksheet, rows, header=None, headermagic=False, hideUtilCol=True):
+        ### The rows are (line, conflict) pairs, conflicts are shown in red.
         global CONFLICT_STYLE, NORMAL_STYLE, HEADER_STYLE
         
-        badex = [] if conflictIndexs is None else conflictIndexs
-        
         if header is not None:
             col = 0
             format = HEADER_STYLE if headermagic else NORMAL_STYLE
@@ -595,17 +1192,13 @@ class TranslationFile():
                 worksheet.set_remove_splits(True) # if user does unfreeze, don't leave a split there
             
         row = 0 if header is None else 1
-        curindex = 0
-        for line in lines:
-            if curindex in badex:
-                format = CONFLICT_STYLE
-            else: format = NORMAL_STYLE
+        for line, conflict in rows:
+            format = CONFLICT_STYLE if conflict else NORMAL_STYLE
             col = 0
             for val in line:
                 worksheet.write(row, col, val, format)
                 col+=1
             row+=1
-            curindex+=1
             
         if hideUtilCol: worksheet.col(0).width = 0x0
 
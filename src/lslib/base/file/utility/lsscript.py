@@ -53,15 +53,34 @@ _default_ = """def run():
     export_util_mem     = False
     export_translator_levels = ''
     export_translator_mem    = False
+    export_db = False
+    export_jobs = 1
+    export_projects = []
+    export_langs    = []
+    export_pipeline = False
+    export_langjobs = 1
+    export_projjobs = 1
+    export_inflight = 8
+    export_membudget = None
 
     ## update commands ##
     update_translator = None
     update_dialogs    = None
     update_menus      = None
     update_strings    = None
+    update_database   = None
     update_resource   = None
     update_level      = None
     update_who        = None
+    update_projects   = []
+    update_langs      = []
+
+    ## watch commands ##
+    watch_interval = 2.0
+    watch_debounce = 1.0
+    watch_db       = False
+    watch_jobs     = 1
+    watch_projects = []
 
     #### Remember to return all the variables at the end of your function #####
     return locals()
@@ -88,6 +88,8 @@ class LSRunner:
                 self.__export()
             elif self.__config('subparser_name') == prsr_UPDATE:
                 self.__update()
+            elif self.__config('subparser_name') == prsr_WATCH:
+                self.__watch()
             
             # Otherwise we are using a script, so we need to determine what we 
             # are doing the hard way.
@@ -108,11 +110,12 @@ class LSRunner:
     
     def __script(self):
         logging.debug("Starting script...")
-        export, update = [ False for _ in range(2) ]
+        export, update, watch = [ False for _ in range(3) ]
         for var in self.__cfgs.keys():
             if var.startswith("export"): export = True
             elif var.startswith("update"): update = True
-        lst = list(filter(lambda x: x, [export, update]))    
+            elif var.startswith("watch"): watch = True
+        lst = list(filter(lambda x: x, [export, update, watch]))    
         
         # There are more than one function being asked to run. We
         # can't accurately determine which function should run first.
@@ -122,6 +125,7 @@ class LSRunner:
         # For each possibility 
         elif export: self.__export()
         elif update: self.__update()
+        elif watch: self.__watch()
         
         # There is no valid function described. It can't be run, so raise
         # an exception for the user to read.
@@ -131,6 +135,7 @@ class LSRunner:
     def __update(self):
         logging.debug("Starting Update...")
         from lslib.pushing.push import Pusher, PusherInputs, PusherOutputs
+        from lslib.base.file.syslvl.SysMasterDB import MASTER_DB_EXT
         
         logging.debug("Checking I/O.")
         if not self.__update_verifyOutput(): 
@@ -138,22 +143,24 @@ class LSRunner:
         
         outtype = self.__config('update_to', 'rcs')
         makenew = self.__config('update_new', False)
+        dryrun  = self.__config('update_dryrun', False)
         isMenu  = self.__config('update_menus', False)
         isDlog  = self.__config('update_dialogs', False)
         isStrs  = self.__config('update_strings', False)
         isTrans = self.__config('update_translator', False)
+        isDB    = self.__config('update_database', False)
         
         langcodes = self.__config('update_langcodes', None) 
         if langcodes == []: langcodes=None
         
-        inPath  = list(filter(None,[isMenu, isDlog, isStrs, isTrans]))[0]
+        inPath  = list(filter(None,[isMenu, isDlog, isStrs, isTrans, isDB]))[0]
         outPath = self.__config('output') 
         
         pushInput = list(  # I was missing my Functional Programming...
                          map( (lambda x: x[0]), 
                               filter( (lambda x: x[1]), 
                                       zip( PusherInputs.LIST, 
-                                           [isMenu, isDlog, isStrs, isTrans]))))[0]
+                                           [isMenu, isDlog, isStrs, isTrans, isDB]))))[0]
         if outtype == 'sys':
             if opath.isdir(outPath):
                 pushOutput = PusherOutputs.ALL_SYS_FILES
@@ -163,6 +170,8 @@ class LSRunner:
                 pushOutput = PusherOutputs.SYS_MENU
             elif opath.splitext(outPath)[1] == 'dialogs':
                 pushOutput = PusherOutputs.SYS_DIALOG
+            elif opath.splitext(outPath)[1] == MASTER_DB_EXT:
+                pushOutput = PusherOutputs.ALL_SYS_FILES
             else: raise IOError("Invalid file given for selected `outtype`!")          
         elif outtype == 'proj':
             if opath.isdir(outPath):
@@ -183,9 +192,14 @@ class LSRunner:
         
         pusher = Pusher( inPath, pushInput, 
                          outPath, pushOutput, 
-                         langcodes, makenew )
+                         langcodes, makenew, dryrun,
+                         self.__config('update_projects', None),
+                         self.__config('update_langs', None) )
         try:
             pusher.push() #TODO: get backup dir from cmd line?
+            if dryrun:
+                for path, changed in pusher.getChanges():
+                    print("%d lines would change in %s"%(changed, path))
         except IOError as e:
             print("There was an IO error when pushing back the files. Make sure the resources are not Read-only.")
             logging.exception(e)
@@ -198,7 +212,7 @@ class LSRunner:
     
     def __export(self):
         logging.debug("Starting exporting...")
-        from lslib.exporting.join import Joiner, JoinLevel
+        from lslib.exporting.join import Joiner, JoinLevel, JoinPipeline
         util  = ( self.__config('subsubparsr_name','')=='util' or \
                   self.__cfgmatch('export_util') )
         trans = ( self.__config('subsubparsr_name','')=='translator' or \
@@ -212,11 +226,19 @@ class LSRunner:
         # Create the joiner which will be making our utilities or translators
         output = self.__config('output', None)
         if output == LSRunner.NONE_DIR: output = None
-        joiner = Joiner(self.__config('input'), output)
+        pipeline = None
+        if self.__config('export_pipeline', False):
+            pipeline = JoinPipeline( self.__config('export_langjobs', None),
+                                     self.__config('export_projjobs', None),
+                                     self.__config('export_inflight', None) )
+        joiner = Joiner(self.__config('input'), output, self.__config('export_jobs', None),
+                        self.__config('export_projects', None), self.__config('export_langs', None),
+                        pipeline, self.__config('export_membudget', None))
         
         # Set the parser level details
         mem = self.__config('export_mem', False)
         useExists = self.__config('export_existing', False)
+        database = self.__config('export_db', False)
         defaultLevel = 'lang' if util else 'sys'
         level = JoinLevel.determineLevel( self.__config('export_level', defaultLevel) )
         
@@ -244,7 +266,7 @@ class LSRunner:
                 elif level == JoinLevel.SYS:
                     logging.debug("Starting System level join.")
                     joiner.makeSysLevelUtil(existing=useExists, keepInMem=mem, doMenus=menu, 
-                                            doDialogs=dialog, doStrings=strs)
+                                            doDialogs=dialog, doStrings=strs, database=database)
                 else: raise Exception("Invalid level selection for exporting.")
             except: raise 
             
@@ -253,13 +275,46 @@ class LSRunner:
             langcodes = self.__config('export_translator_langcodes', None)
             ordr = self.__config('export_translator_order', False)
             ppath = self.__config('export_translator_prunepath', None)
+            pcache = self.__config('export_translator_prunecache', None)
+            tformat = self.__config('export_translator_format', None)
+            report = self.__config('export_translator_conflictreport', None)
+            since = self.__config('export_translator_since', None)
+            split = self.__config('export_translator_splitlang', False)
+            shards = self.__config('export_translator_shards', None)
+            shard = self.__config('export_translator_shard', None)
+            mergeshards = self.__config('export_translator_mergeshards', False)
+            handoff = self.__config('export_translator_handoff', None)
             conflicts = self.__config('export_translator_markconflicts', False)
             joiner.makeTranslator( langcodes, existing=useExists, keepInMem=mem, 
-                                   order=ordr, prunepath=ppath, markconflicts=conflicts)
+                                   order=ordr, prunepath=ppath, markconflicts=conflicts,
+                                   database=database, prunecache=pcache,
+                                   transformat=tformat, conflictreport=report,
+                                   since=since, splitlang=split, shards=shards,
+                                   shard=shard, mergeshards=mergeshards, handoff=handoff)
             
         logging.debug("Finished exporting...")
 
 
+    def __watch(self):
+        logging.debug("Starting watch...")
+        from lslib.exporting.watch import Watcher, WatchStage
+        if not self.__export_verifyInput(): raise Exception("Input directory is invalid")
+        
+        watcher = Watcher( self.__config('input'), 
+                           self.__config('watch_interval', None),
+                           self.__config('watch_debounce', None),
+                           self.__config('watch_db', False),
+                           self.__config('watch_jobs', None),
+                           self.__config('watch_projects', None) )
+        def report( done ):
+            for project, stage in done:
+                print("Rebuilt %s from the %s level."%(project, WatchStage.NAMES[stage]))
+        print("Watching %s for changes, press Ctrl+C to stop."%self.__config('input'))
+        try: watcher.watch( report )
+        except KeyboardInterrupt: print("Stopped watching.")
+        logging.debug("Finished watch...")
+
+
     def __export_verifyInput(self):
         """ input must be a directory. """
         return opath.isdir( self.__config('input') )
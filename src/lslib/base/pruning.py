@@ -12,19 +12,35 @@ LiVSs automatically prunes out lines that have now actual characters that are
 translatable (e.g. whitespace buffers, numbers, pure formatting strings, etc.
 """
 import re
+import os
+import json
+import hashlib
+import logging
 import fileinput
 
 class Pruner:
-    def __init__(self, prunepath=None):
+    """Checks whether strings should be pruned out of the translation file.
+    The answer for a primary string is remembered, so duplicates are only 
+    ever checked once. If `cachepath` is given those answers are also kept 
+    in that file between runs (see save()), as long as the prune list and 
+    the checks haven't changed.
+    """
+    CACHE_VERSION = 1
+    
+    def __init__(self, prunepath=None, cachepath=None):
         self.__prunelist = []
         if prunepath is not None:
             file = fileinput.FileInput(prunepath, mode='r')
             for line in file:
                 self.__prunelist.append(line.splitlines()[0])
             file.close()
-            import logging
             logging.debug("prunelist: %s"%self.__prunelist)
-        
+        self.__listed = self.__compileList( self.__prunelist )
+        self.__memo   = {} # primary string -> prunable?
+        self.__static = {} # string -> passes a static check?
+        self.__cachepath = cachepath
+        self.__cached = 0 # how many answers came out of the cache file.
+        if cachepath is not None: self.__loadCache()
         
     def isPrunable(self, value, primary=None, only=None):
         """Checks if an RCStringValue is a candidate for pruning."""
@@ -32,11 +48,10 @@ class Pruner:
             # we only check the primary language to see
             # if its listed.
             prime = value.getValue(primary, '')
-            if self.isListed( prime ):
-                return True    
-            elif self.__isprunable([prime]):
-                return True
-            else: return False
+            try: return self.__memo[prime]
+            except KeyError:
+                ret = self.__memo[prime] = self.__checkPrimary( prime )
+                return ret
         else:
             strs = []
             if only is not None:
@@ -46,39 +61,133 @@ class Pruner:
             
             return self.__isprunable(strs)
             
-            
-    def __isprunable(self, strs):
-        global STATIC_CHECKS
+    def save(self):
+        """Writes what has been learned to the cache file, if there is one. 
+        Nothing is written if there is nothing new to remember."""
+        if self.__cachepath is None: return False
+        if len(self.__memo) == self.__cached: return False
+        data = { "version" : Pruner.CACHE_VERSION,
+                 "prunelist": self.__listDigest(),
+                 "pruned" : [ s for s,p in self.__memo.items() if p ],
+                 "kept"   : [ s for s,p in self.__memo.items() if not p ] }
+        tmppath = self.__cachepath+".tmp"
+        try:
+            with open(tmppath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmppath, self.__cachepath)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning("Could not write prune cache %s: %s"%(self.__cachepath, e))
+            try: os.remove(tmppath)
+            except OSError: pass
+            return False
+        self.__cached = len(self.__memo)
+        return True
+              
+    def isListed(self, s ):
+        for regex in self.__listed:
+            if regex.search( s ) is not None:
+                return True
+        return False
+    
+    def __checkPrimary(self, prime):
+        ### Whether the primary string is in the prune list or could be 
+        ### pruned anyway.
+        return self.isListed( prime ) or self.__isprunable([prime])
         
+    def __isprunable(self, strs):
         fails = 0
         for s in strs:
             try:
-                for check in STATIC_CHECKS:
-                    if check( s ):
-                        fails+=1
-                        break
+                try: check = self.__static[s]
+                except KeyError:
+                    check = self.__static[s] = isStatic( s )
+                if check: fails+=1
             except: continue
         #if all strings are prunable then its prunable
         return fails == len(strs)
-              
-    def isListed(self, s ):
-        for regex in self.__prunelist:
-            if re.search( regex, s ) is not None:
-                return True
-        return False
+    
+    def __compileList(self, prunelist):
+        ### The prune list as few regexes as possible. Everything is put in
+        ### one alternation, except for ones with groups (their back 
+        ### references would point at the wrong group) and ones that can't
+        ### be put together (like global flags).
+        single, alone = [], []
+        for regex in prunelist:
+            try: compiled = re.compile( regex )
+            except re.error as e:
+                logging.error("Bad regex in prune list '%s': %s"%(regex, e))
+                continue
+            if compiled.groups > 0: alone.append( compiled )
+            else: single.append( regex )
+        if len(single) == 1: return [re.compile(single[0])] + alone
+        elif len(single) > 1:
+            try: return [re.compile("|".join("(?:%s)"%r for r in single))] + alone
+            except re.error: return [re.compile(r) for r in single] + alone
+        return alone
+    
+    def __listDigest(self):
+        ### Answers in the cache file only hold for the list they came from.
+        return hashlib.sha1( "\n".join(self.__prunelist).encode('utf-8', 'surrogatepass') ).hexdigest()
+    
+    def __loadCache(self):
+        ### Fills in the memo from the cache file, if it's still usable.
+        try:
+            with open(self.__cachepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except OSError: return
+        except ValueError as e:
+            logging.warning("Ignoring unreadable prune cache %s: %s"%(self.__cachepath, e))
+            return
+        try:
+            if data.get("version") != Pruner.CACHE_VERSION or \
+               data.get("prunelist") != self.__listDigest(): 
+                logging.debug("Prune cache %s is out of date."%self.__cachepath)
+                return
+            for s in data["pruned"]: self.__memo[s] = True
+            for s in data["kept"]:   self.__memo[s] = False
+        except (AttributeError, KeyError, TypeError) as e:
+            logging.warning("Ignoring unreadable prune cache %s: %s"%(self.__cachepath, e))
+            self.__memo = {}
+        self.__cached = len(self.__memo)
+        
+## The patterns used by the checks below, compiled once.
+JustSymbolMatcher    = re.compile("^[,\.:;><_\-\"'\?%]+$")
+NumTagMatcher        = re.compile("^\s*[0-9]+[a-z]?\.\s*$")
+PercentageMatcher    = re.compile("^[0-9]+%$")
+PureFormatMatcher    = re.compile("^((%([A-Za-z]{1,4}|[0-9]+))|[\s,\.\/\-:;><_\"'])+$")
+# isJustSymbol, isPercentage and isNumTag all in one, for stripped strings.
+StrippedMatcher      = re.compile("^(?:[,\.:;><_\-\"'\?%]+|[0-9]+%|[0-9]+[a-z]?\.)$")
+# This is horrible. But it has to be done like this to avoid
+# problems with regex and escaping characters. Apparently Python3
+# has issues with unicode/raw/ascii encodings and regex escape
+# strings. Otherwise Python2.* can handle an regex of: '^\{+\\+rtf'
+RTF_STARTS = ("{\rtf","{\\rtf","{\\\rtf","{\\\\rtf",
+              "{{\rtf","{{\\rtf","{{\\\rtf","{{\\\\rtf",
+              "{{{\rtf","{{{\\rtf","{{{\\\rtf","{{{\\\\rtf")
+
+def isStatic( s ):
+    """Same as running all of the STATIC_CHECKS, only faster. True if any 
+    one of them is."""
+    stripped = s.strip()
+    return len(stripped) <= 1 or \
+           s.isdigit() or \
+           StrippedMatcher.search(stripped) is not None or \
+           isFloat(s) or \
+           PureFormatMatcher.search(s) is not None or \
+           s.startswith(RTF_STARTS)
 
 def isDigit( s ):
     return s.isdigit()
 def isWhitespace( s ):
     return len(s.strip())==0
 def isJustSymbol( s ):
-    return re.search("^[,\.:;><_\-\"'\?%]+$", s.strip()) is not None
+    return JustSymbolMatcher.search(s.strip()) is not None
 def isNumTag( s ):
-    return re.search("^\s*[0-9]+[a-z]?\.\s*$", s) is not None
+    return NumTagMatcher.search(s) is not None
 def isSingleChar( s ):
-    return re.search("^.$", s.strip()) is not None
+    return len(s.strip())==1
 def isPercentage( s ):
-    return re.search("^[0-9]+%$", s.strip()) is not None
+    return PercentageMatcher.search(s.strip()) is not None
 def isFloat( s ):
     try:
         float(s)
@@ -86,19 +195,9 @@ def isFloat( s ):
     except ValueError:
         return False
 def isPureFormatting( s ):
-    formater="^((%([A-Za-z]{1,4}|[0-9]+))|[\s,\.\/\-:;><_\"'])+$"
-    return re.search(formater,s) is not None  
+    return PureFormatMatcher.search(s) is not None  
 def isRTFString( s ):
-    # This is horrible. But it has to be done like this to avoid
-    # problems with regex and escaping characters. Apparently Python3
-    # has issues with unicode/raw/ascii encodings and regex escape
-    # strings. Otherwise Python2.* can handle an regex of: '^\{+\\+rtf'
-    starts = ["{\rtf","{\\rtf","{\\\rtf","{\\\\rtf",
-              "{{\rtf","{{\\rtf","{{\\\rtf","{{\\\\rtf",
-              "{{{\rtf","{{{\\rtf","{{{\\\rtf","{{{\\\\rtf"]
-    for start in starts:
-        if s.startswith(start): return True
-    return False
+    return s.startswith(RTF_STARTS)
 
 STATIC_CHECKS = \
     [
@@ -111,4 +210,4 @@ STATIC_CHECKS = \
      isSingleChar,
      isPureFormatting,
      isRTFString
-    ]
\ No newline at end of file
+    ]
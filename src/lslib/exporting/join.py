@@ -68,7 +68,9 @@ steps.
 For each intermediate step, it can write the files to disk, or just store it 
 in memory. This, however, is not recommended when running trying to create
 a System level Translation file. (example: on our system at the time of this
-writing would need to store over 3000 files in memory to pull this off!) 
+writing would need to store over 3000 files in memory to pull this off!) If
+the Joiner is given a memory budget, the projects held for the System level 
+are spilled to a temporary file once they go over it (see MemoryBudget).
 
 A few warnings:
 - It is assumed you want the Lang-lvl and Project-lvl utility files in the 
@@ -96,9 +98,11 @@ search in.
       For these reasons LiVSs defaults to this case resolution.
 """
 
+import os
 import logging
 import os.path as opath
 import lslib.util.iohelp as iohelp
+from lslib.util.parallel import orderedMap, Jobs
 
 from lslib.exporting.merges import ScanAndMergeMenus,   \
                                    ScanAndMergeDialogs, \
@@ -108,11 +112,146 @@ from lslib.base.file.rcsfile import scanRCFile
 from lslib.base.file.utility.MenuFile import RCMenuFile, InMemMenu
 from lslib.base.file.utility.DialogFile import RCDialogFile, InMemDialog
 from lslib.base.file.utility.StrTblFile import RCStrTblFile, InMemTable
-from lslib.base.file.utility.TranslationFile import MakeTranslationFile 
+from lslib.base.file.utility.TranslationFile import TranslationFile,     \
+                                                    MakeTranslationFile, \
+                                                    MakeTranslationFileFromDB
+from lslib.base.file.lsxlsx import isXLSXFile, XLSX_EXT
 
 from lslib.base.file.syslvl.SysMenuFile   import SysMenuFile
 from lslib.base.file.syslvl.SysDialogFile import SysDialogFile 
 from lslib.base.file.syslvl.SysStrTblFile import SysStrTblFile
+from lslib.base.file.syslvl.SysMasterDB   import SysMasterDB, MASTER_DB_EXT, \
+                                                 isMasterDB
+from lslib.base.file.syslvl.sysbase       import MemoryBudget
+
+def _loadUtilityFiles( paths ):
+    """Loads each of the utility files given (menus, dialogs, or string tables
+    based on the extension) and returns them in the same order. If one can't
+    be loaded None is put in its place. This is handed to orderedMap so it has
+    to stay at the module level.
+    """
+    files = []
+    for path in paths:
+        ext = opath.splitext(path)[1][1:]
+        try:
+            if ext in iohelp.RCFilters.MenuFilter: file = RCMenuFile( path )
+            elif ext in iohelp.RCFilters.DialogFilter: file = RCDialogFile( path )
+            elif ext in iohelp.RCFilters.StrTblFilter: file = RCStrTblFile( path )
+            else: raise TypeError("Not a utility file: %s"%path)
+            if not file.load(): file = None
+        except Exception as e:
+            logging.exception(e)
+            file = None
+        files.append( file )
+    return files
+
+def _buildShard( work ):
+    """Builds the translator for one shard of the projects and saves it in
+    the hand-off directory, see Joiner.makeTranslator(). The `source` is the
+    master database or the base name of the System files. This is handed to
+    orderedMap so it has to stay at the module level.
+    """
+    source, database, names, path, langcodes, prunepath = work
+    names = set(names)
+    if database:
+        db = SysMasterDB( source )
+        try: trans = MakeTranslationFileFromDB(path, db, names, False, langcodes, False, False, prunepath)
+        finally: db.close()
+    else:
+        files = [ SysMenuFile(source+".menus"), SysDialogFile(source+".dialogs"), SysStrTblFile(source+".strtbls") ]
+        for file in files:
+            # lazily, so only the projects in this shard are ever read.
+            file.load( lazy=True )
+            for name in list(file._projs):
+                if name not in names: del file._projs[name]
+        trans = MakeTranslationFile(path, *files, preloaded=True, langcodes=langcodes, 
+                                    trim=False, prunepath=prunepath)
+    trans.save(langcodes=langcodes)
+    logging.debug("Saved translator shard (%d projects): %s"%(len(names), path))
+    return path
+
+def _pullLangLevel( rcs, doMenus, doDialogs, doStrings ):
+    """Pulls the menus, dialogs and string tables out of a scanned resource.
+    Returns (menus, dialogs, strings), the strings are None if it has none.
+    """
+    totalMenus, totalDialogs, totalStrings = [],[],None
+    if doMenus:   totalMenus = list( rcs.pullMenu() )
+    if doDialogs: totalDialogs = list( rcs.pullDialog() )
+    if doStrings:
+        for table in rcs.pullStringTable():
+            if totalStrings is None: totalStrings=table
+            else: totalStrings.addStringTable( table )
+    return totalMenus, totalDialogs, totalStrings
+
+def _loadLangLevel( rcs, existbase, doMenus, doDialogs, doStrings ):
+    """The language level of a resource whose language was filtered out. The
+    language level files already saved at `existbase` (without the extension)
+    are loaded if they are all there, otherwise the resource is pulled apart
+    anyway. Either way nothing is saved, but the project and system levels 
+    keep the language. Returns (menus, dialogs, strings) like _pullLangLevel.
+    """
+    wanted = [ ext for ext, do in (("menus",doMenus), ("dialogs",doDialogs), ("strtbls",doStrings)) if do ]
+    paths = [ existbase+"."+ext for ext in wanted ]
+    if all( opath.isfile(path) for path in paths ):
+        files = _loadUtilityFiles( paths )
+        if None not in files:
+            logging.debug("~ LangLevel: keeping language %s from '%s'"%(rcs._langcode, existbase))
+            loaded = dict( zip(wanted, files) )
+            return ( loaded["menus"]._menus if doMenus else [],
+                     loaded["dialogs"]._dialogs if doDialogs else [],
+                     loaded["strtbls"]._table if doStrings else None )
+    logging.debug("~ LangLevel: keeping language %s from '%s'"%(rcs._langcode, rcs._path))
+    return _pullLangLevel( rcs, doMenus, doDialogs, doStrings )
+
+def _pullResource( work ):
+    """Scans a resource and pulls its menus, dialogs and string tables out, 
+    the first level of the pipeline (see JoinPipeline). If `savebase` is 
+    given the language level files are saved there (without the extension).
+    A resource that isn't one of the languages wanted is taken from its 
+    language level files at `existbase` instead (see _loadLangLevel). Returns
+    None if the resource couldn't be scanned. This is handed to orderedMap so
+    it has to stay at the module level.
+    """
+    cpath, savebase, existbase, langs, doMenus, doDialogs, doStrings = work
+    rcs = scanRCFile( cpath )
+    if rcs is None: return None
+    if not iohelp.namematch( rcs._langcode, langs ):
+        return (cpath,) + _loadLangLevel( rcs, existbase, doMenus, doDialogs, doStrings )
+    totalMenus, totalDialogs, totalStrings = _pullLangLevel( rcs, doMenus, doDialogs, doStrings )
+    if savebase is not None:
+        if doMenus:   InMemMenu('', totalMenus).save(savebase+".menus")
+        if doDialogs: InMemDialog('', totalDialogs).save(savebase+".dialogs")
+        if doStrings: InMemTable('', totalStrings).save(savebase+".strtbls")
+    return (cpath, totalMenus, totalDialogs, totalStrings)
+
+def _mergeProject( work ):
+    """Merges the resources pulled out of one project into its project level
+    files, the second level of the pipeline (see JoinPipeline). If `savebase`
+    is given they are saved there (without the extension). Returns None if 
+    they couldn't be merged. This is handed to orderedMap so it has to stay 
+    at the module level.
+    """
+    project, basename, pulled, savebase, doMenus, doDialogs, doStrings = work
+    projMenus, projDialogs, projStrings = None,None,None
+    try:
+        if doMenus:   
+            projMenus = ScanAndMergeMenus( basename+".menus", 
+                            [ InMemMenu(opath.splitext(cpath)[0]+".menus", ms) for cpath,ms,_,_ in pulled ] )
+        if doDialogs: 
+            projDialogs = ScanAndMergeDialogs( basename+".dialogs", 
+                            [ InMemDialog(opath.splitext(cpath)[0]+".dialogs", ds) for cpath,_,ds,_ in pulled ] )
+        if doStrings: 
+            projStrings = ScanAndMergeStrings( basename+".strtbls", 
+                            [ InMemTable(opath.splitext(cpath)[0]+".strtbls", ss) for cpath,_,_,ss in pulled ] )
+        if savebase is not None:
+            if doMenus:   projMenus.save(savebase+".menus")
+            if doDialogs: projDialogs.save(savebase+".dialogs")
+            if doStrings: projStrings.save(savebase+".strtbls")
+    except Exception as e: 
+        logging.exception(e)
+        return None
+    return (project, projMenus, projDialogs, projStrings)
+
 
 class JoinLevel():
     """Defines the level at which the joins should take place. There are only
@@ -130,6 +269,27 @@ class JoinLevel():
             elif s=='sys': return JoinLevel.SYS
         elif type(s) is int: return s
         return JoinLevel.DERIVED  
+
+
+class JoinPipeline():
+    """Runs the language, project and system levels at the same time when 
+    they are built from the resources, instead of one after the other. The
+    resources are scanned by `langJobs` workers, and as soon as all of a 
+    project's resources are in, `projJobs` workers merge them while the next
+    ones are being scanned. The System files take the projects as they come
+    out. No more than `inflight` resources (or projects) are handed to a 
+    level ahead of what the next level has taken, so if one falls behind the
+    ones before it wait instead of piling everything up in memory. The 
+    output is the same as without the pipeline.
+    """
+    DEFAULT_INFLIGHT = 8
+    
+    def __init__(self, langJobs=None, projJobs=None, inflight=None):
+        self.langJobs = Jobs.DEFAULT if langJobs is None else langJobs
+        self.projJobs = Jobs.DEFAULT if projJobs is None else projJobs
+        if inflight is None: 
+            inflight = max(JoinPipeline.DEFAULT_INFLIGHT, 2*self.langJobs)
+        self.inflight = inflight
             
     
 class Joiner():
@@ -141,8 +301,24 @@ class Joiner():
     
     MASTER_FILENAME = "System_Strings.master"
     TRANS_FILENAME  = "MasterTranslationFile.xls"
+    TRANS_FORMATS   = ["xls", "xlsx"] # the first is the default.
+    SHARD_DIRNAME   = "TranslatorShards"  # default hand-off directory.
     
-    def __init__(self, sysDir, output=None): 
+    def __init__(self, sysDir, output=None, jobs=None, projects=None, langs=None, pipeline=None, membudget=None): 
+        """If `projects` or `langs` are given (lists of glob patterns, see
+        iohelp.namematch) only the projects and language codes that match are
+        read and exported, everything else is skipped as early as it can be.
+        The languages that don't match are still kept in the project and
+        System levels from their existing language level files.
+        If `pipeline` is a JoinPipeline, the levels built from the resources
+        are run at the same time. If `membudget` (in megabytes) is given, the
+        projects held for the System level are spilled to disk past it.
+        """
+        self.__jobs = jobs # number of workers for loading existing files.
+        self.__pipeline = pipeline
+        self.__membudget = membudget
+        self.__projects = projects
+        self.__langs = langs
         if opath.isdir(sysDir):
             self.__sysdir = opath.dirname(sysDir)
         else: raise TypeError("Given path is not a valid directory.")
@@ -153,6 +329,20 @@ class Joiner():
             else: raise TypeError("Given path is not a valid directory.")
             
 
+    @staticmethod
+    def transFilename( transformat=None ):
+        """The file name of the translator for one of the TRANS_FORMATS."""
+        if transformat is None: transformat = Joiner.TRANS_FORMATS[0]
+        if transformat not in Joiner.TRANS_FORMATS:
+            raise TypeError("Unknown translator format: %s"%transformat)
+        return opath.splitext(Joiner.TRANS_FILENAME)[0]+"."+transformat
+    
+    @staticmethod
+    def shardFilename( shard, shards ):
+        """The file name of one shard of the translator in the hand-off 
+        directory, eg: shard_2_of_8.xlsx"""
+        return "shard_%d_of_%d%s"%(shard, shards, XLSX_EXT)
+    
     @staticmethod
     def makeSysDialog( projDialogFiles, sysDialogPath, autosave=True ): 
         """Passing in a list of paths to dialog files, and a path for the new
@@ -215,27 +405,73 @@ class Joiner():
             for _ in self.__genProjLevelUtil(False, keepInMem, False, True, doMenus, doDialogs, doStrings): pass
         except: raise
     
-    def makeSysLevelUtil(self, existing=False, keepInMem=False, doMenus=True, doDialogs=True, doStrings=True):
+    def makeSysLevelUtil(self, existing=False, keepInMem=False, doMenus=True, doDialogs=True, doStrings=True, database=False, existingLang=False):
         """Since the underbelly of Joiner is itterative, generators are used. This 
         function hides all of the mess and lets you just call the function directly.
+        If `database` is True, the master database is updated with the new files.
+        If `existingLang` is True the project level files are rebuilt out of the
+        language level files already there, instead of from the resources.
         """
-        try: _ = self.__genSysLevelUtil(existing, existing, keepInMem, True, doMenus, doDialogs, doStrings)
+        try: 
+            files = self.__genSysLevelUtil(existing, existing or existingLang, keepInMem, True, doMenus, doDialogs, doStrings)
+            if database: self.__saveMasterDB(*files)
         except: raise
     
-    def makeTranslator(self, langcodes, existing=False, keepInMem=False, order=False, prunepath=None, markconflicts=False):
+    def makeTranslator(self, langcodes, existing=False, keepInMem=False, order=False, prunepath=None, markconflicts=False, database=False, prunecache=None, transformat=None, conflictreport=None, since=None, splitlang=False, shards=None, shard=None, mergeshards=False, handoff=None):
         """Since the underbelly of Joiner is itterative, generators are used. This
         function hides all of the mess and lets you just call the function directly.
+        If `database` is True, the master database is used (when `existing`) or
+        updated (when not) instead of the System files. `prunecache` is the
+        path of a file to keep the pruning answers in between runs, and 
+        `transformat` is one of TRANS_FORMATS (the extension of the file).
+        If `conflictreport` is a path, a CSV of the conflicting strings is 
+        written there. If `since` is the path of an older translation file, 
+        master database, or set of System files, only the strings that were
+        added or changed since then are put in the translator. If `splitlang`
+        is True a translator is written for each language code after the 
+        first instead of one with all of them.
+        
+        If `shards` is more than 0, the projects are split up into that many 
+        shards which are each built by their own worker and saved in the 
+        `handoff` directory, then merged together into the translator. If 
+        `shard` is given only that one (0 based) is built and saved, so the 
+        shards can be built on different machines; afterwards `mergeshards` 
+        only does the merging of what is in the hand-off directory. A single
+        `shard` needs `existing` System files, they are never rebuilt for it.
         """
-        _ = self.__genTranslator(langcodes, existing, keepInMem, True, False, order, prunepath, markconflicts)
+        _ = self.__genTranslator(langcodes, existing, keepInMem, True, False, order, prunepath, markconflicts, database, prunecache, transformat, conflictreport, since, splitlang, shards, shard, mergeshards, handoff)
+        
+    def __masterDBPath(self):
+        """The master database lives next to the System files."""
+        if self.__changeoutputs:
+            return opath.join(self.__outdir, Joiner.MASTER_FILENAME+MASTER_DB_EXT)
+        return opath.join(self.__sysdir, Joiner.MASTER_FILENAME+MASTER_DB_EXT)
+    
+    def __saveMasterDB(self, menuFile, dialogFile, stringFile):
+        """Copies every project in the System files into the master database,
+        or just the ones that match the project filter."""
+        projects = None
+        if self.__projects:
+            projects = [ name for name in menuFile.getProjectList() + dialogFile.getProjectList() + 
+                         stringFile.getProjectList() if iohelp.namematch(name, self.__projects) ]
+        db = SysMasterDB( self.__masterDBPath() )
+        try: db.importFiles( menuFile, dialogFile, stringFile, projects )
+        finally: db.close()
         
 
     def __genLangLevelUtil( self, ret=False, save=True, doMenus=True, doDialogs=True, doStrings=True): 
         """Generate the Language Level utility files for the entire system."""
-        for cpath,name in iohelp.dirwalk(self.__sysdir, filter=iohelp.RCFilters.RCFilter, ignore=iohelp.RCFilters.BinaryDirs):
+        for cpath,name in iohelp.dirwalk(self.__sysdir, filter=iohelp.RCFilters.RCFilter, 
+                                         ignore=iohelp.RCFilters.BinaryDirs, projects=self.__projects):
             logging.debug("~ LangLevel: found filter match '%s'! "%cpath)
             rcs = scanRCFile( cpath )
             if rcs is None: continue
             blank,_ = opath.splitext(cpath)
+            if not iohelp.namematch( rcs._langcode, self.__langs ):
+                # it isn't exported, but the project level still needs it.
+                if ret: yield (cpath,) + _loadLangLevel( rcs, self.__langLevelBase(cpath, name), 
+                                                         doMenus, doDialogs, doStrings )
+                continue
             totalMenus, totalDialogs, totalStrings = [],[],None
             if doMenus:
                 menus = rcs.pullMenu()
@@ -273,7 +509,10 @@ class Joiner():
         """
         menuFiles, dialogFiles, stringFiles = [],[],[] #our lang files
         projMenus, projDialogs, projStrings = None,None,None
-        if not useExisting:
+        if not useExisting and self.__pipeline is not None:
+            for project, projMenus, projDialogs, projStrings in self.__pipeProjLevelUtil(keepInMem, save, doMenus, doDialogs, doStrings):
+                if ret: yield project, projMenus, projDialogs, projStrings
+        elif not useExisting:
             project = ''
             basename=''
             for cpath, ms, ds, ss in self.__genLangLevelUtil(True, (not keepInMem), doMenus, doDialogs, doStrings):
@@ -337,31 +576,17 @@ class Joiner():
                         else: projStrings.save(opath.join(self.__outdir, project+".strtbls"))
                 if ret: yield project, projMenus, projDialogs, projStrings
         else: #itterate through existing.
-            #Loop through all the projects, and grab the utiliy files currently in
-            #the directories.
-            for utils in iohelp.dirwalkl(self.__sysdir,
-                                          exclude=iohelp.RCFilters.SysLevelFilter, 
-                                          filter=iohelp.RCFilters.UtilityFilter,
-                                          ignore=iohelp.RCFilters.BinaryDirs):
-                #for each utility file found, determine if its a dialog, menu, or stringtable
-                #depending on which one we must add it to the correct list.
-                for cpath, name in utils:
-                    if iohelp.fileok(name, filter=["menus"]):
-                        if not doMenus: continue
-                        tmp = RCMenuFile(blank+".menus")
-                        tmp.load()
-                        menuFiles.append( tmp )
-                    elif iohelp.fileok(name, filter=["dialogs"]):
-                        if not doDialogs: continue
-                        tmp = RCDialogFile(blank+".dialogs")
-                        tmp.load()
-                        dialogFiles.append( tmp  )
-                    elif iohelp.fileok(name, filter=["strtbls"]):
-                        if not doStrings: continue
-                        tmp = RCStrTblFile(blank+".strtbls")
-                        tmp.load()
-                        stringFiles.append( tmp )
-                    else: logging.error("Matched utility filter when there was no need! %s"%cpath)
+            #Loop through all the projects, and grab the lang-level utility files 
+            #currently in the directories.
+            for project, dirpath, files in self.__loadExisting(False, doMenus, doDialogs, doStrings):
+                menuFiles, dialogFiles, stringFiles = [],[],[]
+                for cpath, file in files:
+                    if file is None: 
+                        logging.error("Could not load utility file: %s"%cpath)
+                    elif iohelp.fileok(cpath, filter=iohelp.RCFilters.MenuFilter): menuFiles.append( file )
+                    elif iohelp.fileok(cpath, filter=iohelp.RCFilters.DialogFilter): dialogFiles.append( file )
+                    else: stringFiles.append( file )
+                basename = opath.join( dirpath, project )
                 if len(menuFiles)>0 or len(dialogFiles)>0 or len(stringFiles)>0:
                     if doMenus:   projMenus   = ScanAndMergeMenus( basename+".menus", menuFiles )
                     if doDialogs: projDialogs = ScanAndMergeDialogs( basename+".dialogs", dialogFiles )
@@ -377,8 +602,94 @@ class Joiner():
                             if not self.__changeoutputs: projStrings.save()
                             else: projStrings.save(opath.join(self.__outdir, project+".strtbls"))
                     if ret: yield project, projMenus, projDialogs, projStrings
-                menuFiles, dialogFiles, stringFiles = [],[],[]
-                basename = opath.join( opath.dirname(cpath), project )
+    
+    def __pipeProjLevelUtil( self, keepInMem, save, doMenus, doDialogs, doStrings ):
+        """Generates the Project Level Utility files from the resources like
+        __genProjLevelUtil, but with the levels run at the same time, see
+        JoinPipeline. Yields (project, menus, dialogs, strings) in the same 
+        order as the projects were walked.
+        """
+        pipe = self.__pipeline
+        pulled = orderedMap(_pullResource, self.__pipeResources(keepInMem, doMenus, doDialogs, doStrings), 
+                            pipe.langJobs, inflight=pipe.inflight)
+        merged = orderedMap(_mergeProject, self.__pipeProjects(pulled, save, doMenus, doDialogs, doStrings), 
+                            pipe.projJobs, inflight=pipe.inflight)
+        for result in merged:
+            if result is not None: yield result
+    
+    def __pipeResources( self, keepInMem, doMenus, doDialogs, doStrings ):
+        ### The work for the language level of the pipeline, one resource at
+        ### a time as they are walked.
+        for cpath,name in iohelp.dirwalk(self.__sysdir, filter=iohelp.RCFilters.RCFilter, 
+                                         ignore=iohelp.RCFilters.BinaryDirs, projects=self.__projects):
+            logging.debug("~ LangLevel: found filter match '%s'! "%cpath)
+            existbase = self.__langLevelBase(cpath, name)
+            savebase = None if keepInMem else existbase
+            yield (cpath, savebase, existbase, self.__langs, doMenus, doDialogs, doStrings)
+    
+    def __langLevelBase( self, cpath, name ):
+        ### Where the language level files of a resource are saved (without
+        ### the extension).
+        if not self.__changeoutputs: return opath.splitext(cpath)[0]
+        return opath.join(self.__outdir, name)
+    
+    def __pipeProjects( self, pulled, save, doMenus, doDialogs, doStrings ):
+        ### The work for the project level of the pipeline. The resources 
+        ### of a project are walked one after the other, so a project is 
+        ### handed out as soon as the first resource of the next one is in.
+        group, project = [], None
+        for result in pulled:
+            if result is None: continue
+            if group and iohelp.lastdirname(result[0]) != project:
+                yield self.__pipeProject(project, group, save, doMenus, doDialogs, doStrings)
+                group = []
+            project = iohelp.lastdirname(result[0])
+            group.append( result )
+        if group: yield self.__pipeProject(project, group, save, doMenus, doDialogs, doStrings)
+    
+    def __pipeProject( self, project, group, save, doMenus, doDialogs, doStrings ):
+        ### The work for merging a single project.
+        basename = opath.join( opath.dirname(group[0][0]), project )
+        if not save: savebase = None
+        elif not self.__changeoutputs: savebase = basename
+        else: savebase = opath.join(self.__outdir, project)
+        return (project, basename, group, savebase, doMenus, doDialogs, doStrings)
+    
+    def __loadExisting( self, projLevel, doMenus=True, doDialogs=True, doStrings=True ):
+        """Finds the utility files already in each project directory and loads 
+        them, spread over the number of jobs the Joiner was given. If `projLevel`
+        is True only the project level files are loaded, otherwise only the 
+        lang-level ones. Yields (project, directory, [(path, file)]) in the order
+        the directories were walked, so the results are the same however many
+        jobs there were. A file that couldn't be loaded is None.
+        """
+        wanted, groups = [], []
+        if doMenus:   wanted += iohelp.RCFilters.MenuFilter
+        if doDialogs: wanted += iohelp.RCFilters.DialogFilter
+        if doStrings: wanted += iohelp.RCFilters.StrTblFilter
+        for utils in iohelp.dirwalkl(self.__sysdir,
+                                      exclude=iohelp.RCFilters.SysLevelFilter, 
+                                      filter=iohelp.RCFilters.UtilityFilter,
+                                      ignore=iohelp.RCFilters.BinaryDirs,
+                                      projects=self.__projects):
+            project = iohelp.lastdirname( utils[0][0] )
+            paths, found = [], set()
+            for cpath, name in utils:
+                if any(name.endswith("."+ext) for ext in iohelp.RCFilters.SysLevelFilter): continue
+                # project level files are named after their directory.
+                if (opath.splitext(name)[0] == project) != projLevel:
+                    logging.debug("skipping %s level file: %s,%s"%("lang" if projLevel else "project", 
+                                                                 project, opath.splitext(name)[0]))
+                    continue
+                found.add( opath.splitext(name)[1][1:] )
+                if iohelp.fileok(name, filter=wanted): paths.append( cpath )
+            if projLevel and not found >= set(iohelp.RCFilters.UtilityFilter):
+                logging.warning("Was unable to find all of %s's utility files."%project)
+            groups.append( (project, opath.dirname(utils[0][0]), paths) )
+        
+        loaded = orderedMap(_loadUtilityFiles, [paths for _,_,paths in groups], self.__jobs)
+        for (project, dirpath, paths), files in zip(groups, loaded):
+            yield project, dirpath, list(zip(paths, files))
                   
     def __genSysLevelUtil( self, useExisting=False, useExistingLangLevel=False, keepInMem=False, save=True, doMenus=True, doDialogs=True, doStrings=True ): 
         """Generate the System Level Utility files for an entire system. If 
@@ -396,6 +707,16 @@ class Joiner():
         sysMenus   = SysMenuFile(basename+".menus")
         sysDialogs = SysDialogFile(basename+".dialogs")
         sysStrings = SysStrTblFile(basename+".strtbls")
+        if save and self.__projects:
+            # Only the projects that match are rebuilt, the others are left
+            # in the System files as they are (and never parsed).
+            for file in (sysMenus, sysDialogs, sysStrings):
+                if opath.isfile(file._path): file.load( lazy=True )
+        budget = None
+        if self.__membudget is not None:
+            # one budget for all three, whichever project was used last stays.
+            budget = MemoryBudget( int(self.__membudget*1024*1024) )
+            for file in (sysMenus, sysDialogs, sysStrings): file.setMemoryBudget( budget )
         if not useExisting:
             for project, menuFile, dialogFile, stringFile in self.__genProjLevelUtil(useExistingLangLevel,
                                                                           keepInMem, True, useExisting,
@@ -406,65 +727,185 @@ class Joiner():
         else: # iterate through 
             # Since we can't generate new ones, we have to go look for them in subdirs.
             # Also since we are looking through the subdirs, we run the risk of pulling out
-            # lang-level utility files. So we need to prune those too.
-            for utils in iohelp.dirwalkl(self.__sysdir, 
-                                          exclude=iohelp.RCFilters.SysLevelFilter, 
-                                          filter=iohelp.RCFilters.UtilityFilter, 
-                                          ignore=iohelp.RCFilters.BinaryDirs):
-                strFound, menuFound, dialogFound = False, False, False
-                # we have all the util files for the project.
-                for cpath,name in utils:
-                    project = iohelp.lastdirname( cpath )
-                    # if file is lang-lvl, then skip it.
-                    if opath.splitext(name)[0] != project: 
-                        logging.debug("thought was lang-lvl: %s,%s"%(project, opath.splitext(name)[0]))
-                        continue #TODO: not very elegant! plus is it true??
-                    
-                    logging.debug("filter time: %s"%name)
-                    
-                    if iohelp.fileok(name, filter=iohelp.RCFilters.MenuFilter):
-                        menuFound = True
-                        if not doMenus: continue
-                        sysMenus.addProjLevelFile( project, cpath )
-                    elif iohelp.fileok(name, filter=iohelp.RCFilters.DialogFilter):
-                        dialogFound = True
-                        if not doDialogs: continue
-                        sysDialogs.addProjLevelFile( project, cpath )
-                    elif  iohelp.fileok(name, filter=iohelp.RCFilters.StrTblFilter):
-                        strFound = True
-                        if not doStrings: continue
-                        sysStrings.addProjLevelFile(project, cpath )
-                    else: logging.error("Matched utility filter when there was no need! %s"%cpath)
-                
-                if not (strFound and menuFound and dialogFound):
-                    logging.warning("Was unable to find all of %s's utility files."%project)
+            # lang-level utility files. So only the project level ones are loaded.
+            for project, _, files in self.__loadExisting(True, doMenus, doDialogs, doStrings):
+                for cpath, file in files:
+                    # if it couldn't be loaded, adding it by path gives the reason.
+                    if iohelp.fileok(cpath, filter=iohelp.RCFilters.MenuFilter):
+                        sysMenus.addProjLevelFile( project, cpath, obj=file )
+                    elif iohelp.fileok(cpath, filter=iohelp.RCFilters.DialogFilter):
+                        sysDialogs.addProjLevelFile( project, cpath, obj=file )
+                    else: sysStrings.addProjLevelFile( project, cpath, obj=file )
                     
         if save:
             if doMenus:   sysMenus.save()
             if doDialogs: sysDialogs.save()
             if doStrings: sysStrings.save()
+        if budget is not None and budget.spills > 0:
+            logging.info("Spilled %d projects to disk to stay under %sMB."%(budget.spills, self.__membudget))
         return sysMenus, sysDialogs, sysStrings 
         
     
-    def __genTranslator( self, langcodes, useExisting=False, keepInMem=False, save=True, ret=False, order=False, prunepath=None, markconflicts=False ): 
+    def __genTranslator( self, langcodes, useExisting=False, keepInMem=False, save=True, ret=False, order=False, prunepath=None, markconflicts=False, database=False, prunecache=None, transformat=None, conflictreport=None, since=None, splitlang=False, shards=None, shard=None, mergeshards=False, handoff=None ): 
         """Generate the translator file for the entire system."""
+        filename = Joiner.transFilename( transformat )
         if self.__changeoutputs:
-            newpath = opath.join(self.__outdir, Joiner.TRANS_FILENAME)
-        else: newpath = opath.join(self.__sysdir, Joiner.TRANS_FILENAME)
+            newpath = opath.join(self.__outdir, filename)
+        else: newpath = opath.join(self.__sysdir, filename)
+        
+        if shards or since is not None or splitlang or ((self.__langs or self.__projects) and save): 
+            # the whole thing has to be built before it can be cut down.
+            if not shards:
+                trans = self.__genTranslator(langcodes, useExisting, keepInMem, False, True, order, prunepath, markconflicts, database, prunecache, transformat, None)
+            else:
+                trans = self.__genShards(newpath, langcodes, useExisting, keepInMem, prunepath, markconflicts, database, prunecache, shards, shard, mergeshards, handoff)
+                if trans is None: return # just built a shard.
+            if self.__projects: trans.setPartial()
+            if langcodes is None:
+                # worked out before anything is cut, the strings left might not
+                # have every language (eg, new ones nobody has translated yet).
+                langcodes = trans._makeLangList()
+                if self.__langs:
+                    # every language was read, so the first is the same one the
+                    # whole translator would have. It's kept whether it matches
+                    # or not, since the others are translated from it.
+                    primary = langcodes[:1]
+                    langcodes = primary + [ code for code in langcodes[1:] if iohelp.namematch(code, self.__langs) ]
+            if since is not None:
+                baseline = self.__loadBaseline(since, langcodes)
+                count = trans.limitToChanges( baseline )
+                logging.info("Translator has %d strings that changed since: %s"%(count, since))
+            if save and splitlang: trans.saveByLanguage(langcodes, order, False, self.__jobs)
+            elif save: trans.save(langcodes=langcodes, order=order, trim=False)
+            if conflictreport is not None: trans.writeConflictReport(conflictreport, langcodes)
+            if ret: return trans
+            return
+        
+        if useExisting and database:
+            db = SysMasterDB( opath.join(self.__sysdir, Joiner.MASTER_FILENAME+MASTER_DB_EXT) )
+            try:
+                trans = MakeTranslationFileFromDB(newpath, db, self.__dbProjects(db), save, langcodes, order, False, prunepath, markconflicts, prunecache, conflictreport)
+            finally: db.close()
+            if ret: return trans
+            return
         
         if not useExisting:
             menuFile, dialogFile, stringFile = self.__genSysLevelUtil(useExisting=False, 
                                                                       useExistingLangLevel=False, 
                                                                       keepInMem=keepInMem, 
                                                                       save=False)
+            if database: self.__saveMasterDB(menuFile, dialogFile, stringFile)
         else: #we must load by hand.
             basename = opath.join( self.__sysdir, Joiner.MASTER_FILENAME )
             menuFile   = SysMenuFile(basename+".menus")
             dialogFile = SysDialogFile(basename+".dialogs")
             stringFile = SysStrTblFile(basename+".strtbls")
-            menuFile.load() ; dialogFile.load() ; stringFile.load()
+            for file in (menuFile, dialogFile, stringFile): 
+                file.load( lazy=bool(self.__projects) )
+                self.__limitProjects( file )
 
-        trans = MakeTranslationFile(newpath, menuFile, dialogFile, stringFile, True, save, langcodes, order, False, prunepath, markconflicts)
+        trans = MakeTranslationFile(newpath, menuFile, dialogFile, stringFile, True, save, langcodes, order, False, prunepath, markconflicts, prunecache, conflictreport)
         if ret: return trans
         
+    def __genShards( self, newpath, langcodes, useExisting, keepInMem, prunepath, markconflicts, database, prunecache, shards, shard=None, mergeshards=False, handoff=None ):
+        """Builds the shards of the translator in the hand-off directory and 
+        merges them together, see makeTranslator(). The projects are sorted 
+        by name and dealt out to the shards, so every machine splits them up 
+        the same way. Returns None if only one shard was built.
+        """
+        if shards < 1: raise ValueError("There has to be at least one shard.")
+        if handoff is None: handoff = opath.join(opath.dirname(newpath), Joiner.SHARD_DIRNAME)
+        paths = [ opath.join(handoff, Joiner.shardFilename(num, shards)) for num in range(shards) ]
+        prime = None if langcodes is None or len(langcodes)==0 else langcodes[0]
+        
+        if not mergeshards:
+            # the other machines could be reading the System files, so a 
+            # single shard can't be the one to rebuild them.
+            if shard is not None and not useExisting:
+                raise ValueError("A single shard has to be built from the existing System files, generate them first and use --keep.")
+            if not opath.isdir(handoff): os.makedirs(handoff)
+            if useExisting and database:
+                source = opath.join(self.__sysdir, Joiner.MASTER_FILENAME+MASTER_DB_EXT)
+            elif useExisting: 
+                source = opath.join(self.__sysdir, Joiner.MASTER_FILENAME)
+            else: # the workers need them on disk.
+                files = self.__genSysLevelUtil(useExisting=False, useExistingLangLevel=False, 
+                                               keepInMem=keepInMem, save=True)
+                if database: 
+                    self.__saveMasterDB(*files)
+                    source = self.__masterDBPath()
+                elif self.__changeoutputs: source = opath.join(self.__outdir, Joiner.MASTER_FILENAME)
+                else: source = opath.join(self.__sysdir, Joiner.MASTER_FILENAME)
+                del files
+            
+            names = self.__shardProjects( source, database )
+            todo = range(shards) if shard is None else [shard]
+            work = [ (source, database, names[num::shards], paths[num], langcodes, prunepath) for num in todo ]
+            for path in orderedMap(_buildShard, work, self.__jobs or len(work)): pass
+            if shard is not None: return None
+        
+        missing = [ path for path in paths if not opath.isfile(path) ]
+        if len(missing) > 0: raise IOError("Translator shards are missing: %s"%missing)
+        trans = TranslationFile(newpath, prime, prunepath, markconflicts, prunecache)
+        for path in paths:
+            part = TranslationFile(path, prime, prunepath)
+            part.load()
+            trans.merge( part )
+            logging.debug("Merged translator shard: %s"%path)
+        return trans
+    
+    def __shardProjects( self, source, database ):
+        """All of the project names in the System files (or master database)
+        that the shards are built from, sorted."""
+        if database:
+            db = SysMasterDB( source )
+            try: names = set( db.getProjectList() )
+            finally: db.close()
+        else:
+            names = set()
+            for file in [ SysMenuFile(source+".menus"), SysDialogFile(source+".dialogs"), SysStrTblFile(source+".strtbls") ]:
+                file.load( lazy=True )
+                names.update( file._projs )
+        return sorted( name for name in names if iohelp.namematch(name, self.__projects) )
+    
+    def __limitProjects( self, sysFile ):
+        """Takes the projects that don't match the project filter out of a 
+        System file, if it was loaded lazily they are never parsed."""
+        if not self.__projects: return sysFile
+        for name in list(sysFile._projs):
+            if not iohelp.namematch(name, self.__projects): del sysFile._projs[name]
+        return sysFile
+    
+    def __dbProjects( self, db ):
+        """The projects in the master database that match the project filter,
+        or None for all of them."""
+        if not self.__projects: return None
+        return [ name for name in db.getProjectList() if iohelp.namematch(name, self.__projects) ]
+    
+    def __loadBaseline( self, since, langcodes ):
+        """Loads what a translator is compared against for `since`, which can
+        be a translation file, a master database, the directory the System 
+        files are in, or the path to the System files (with or without one 
+        of their extensions).
+        """
+        prime = None if langcodes is None or len(langcodes)==0 else langcodes[0]
+        ext = opath.splitext(since)[1][1:].lower()
+        if opath.isfile(since) and (ext in Joiner.TRANS_FORMATS or isXLSXFile(since)):
+            baseline = TranslationFile(since, prime)
+            baseline.load()
+            return baseline
+        if opath.isfile(since) and isMasterDB(since):
+            db = SysMasterDB( since )
+            try: return MakeTranslationFileFromDB('', db, None, False, langcodes)
+            finally: db.close()
+        
+        if opath.isdir(since): basename = opath.join(since, Joiner.MASTER_FILENAME)
+        elif ext in ("menus", "dialogs", "strtbls"): basename = opath.splitext(since)[0]
+        else: basename = since
+        menuFile   = SysMenuFile(basename+".menus")
+        dialogFile = SysDialogFile(basename+".dialogs")
+        stringFile = SysStrTblFile(basename+".strtbls")
+        menuFile.load() ; dialogFile.load() ; stringFile.load()
+        return MakeTranslationFile('', menuFile, dialogFile, stringFile, True, False, langcodes)
+        
         
\ No newline at end of file
@@ -0,0 +1,169 @@
+#
+# Author: Alexander Dean <dstar@csh.rit.edu>
+# Copyright (c) 2011, RailComm LLC
+# All rights reserved. Redistribution and use in source and binary forms, with
+# or without modification are permitted provided that the conditions are met
+# under the Modified BSD License.
+#
+"""Watching a system directory keeps its master files up to date while the
+resources are being worked on, without running the whole export again after
+every change. Only the projects that changed are rebuilt, and only from the
+first stage that was affected:
+
+    - A resource (*.rc) or its header (resource*.h):  lang -> proj -> sys
+    - A language level utility file:                          proj -> sys
+    - A project level utility file:                                   sys
+
+The directory is polled, which only needs the standard library and works the
+same on a local disk or a share. Each time, the modified time and size of
+every file that's watched is compared with what it was the last time. A burst
+of saves (like Visual Studio writing a resource and its header) is waited out
+until nothing has changed for a little while, then every project that changed
+is rebuilt once. The System files are updated in place, so only the projects
+that were rebuilt are written (see SysMenuFile.save()).
+
+The master files have to be there to begin with, run a full export first.
+"""
+import os
+import re
+import time
+import fnmatch
+import logging
+import os.path as opath
+import lslib.util.iohelp as iohelp
+from lslib.exporting.join import Joiner
+
+class WatchStage:
+    """The stage a project has to be rebuilt from. The lower it is the more
+    has to be redone, so when a project changes twice the lower one wins.
+    """
+    LANG, PROJ, SYS = range(3)
+    NAMES = ['lang', 'proj', 'sys']
+
+
+class Watcher:
+    """Polls a system directory for changes and rebuilds the projects they
+    are in, see watch().
+    """
+    HEADER_PATTERN   = "resource*.h"
+    DEFAULT_INTERVAL = 2.0  # seconds between each look at the directory.
+    DEFAULT_DEBOUNCE = 1.0  # seconds without a change before rebuilding.
+
+    def __init__(self, sysDir, interval=None, debounce=None, database=False, jobs=None, projects=None):
+        """If `database` is True the master database is updated along with
+        the System files. `jobs` is handed to the Joiner, and `projects` is
+        a list of glob patterns to only watch some of the projects.
+        """
+        if not opath.isdir(sysDir): raise TypeError("Given path is not a valid directory.")
+        self.__sysdir = opath.normpath(sysDir)
+        self.__interval = Watcher.DEFAULT_INTERVAL if interval is None else interval
+        self.__debounce = Watcher.DEFAULT_DEBOUNCE if debounce is None else debounce
+        self.__database = database
+        self.__jobs = jobs
+        self.__projects = projects
+        self.__files = self.__scan() # path -> (project, stage, modified, size)
+
+    def poll(self):
+        """Looks through the directory once and returns {project: stage} for
+        every project that has something new, changed, or removed since the
+        last time it was looked at.
+        """
+        files = self.__scan()
+        changes = {}
+        for path in set(files) | set(self.__files):
+            now, before = files.get(path), self.__files.get(path)
+            if now == before: continue
+            project, stage, _, _ = now or before
+            logging.debug("Watch: %s changed (%s stage)"%(path, WatchStage.NAMES[stage]))
+            changes[project] = min(stage, changes.get(project, stage))
+        self.__files = files
+        return changes
+
+    def rebuild(self, changes):
+        """Rebuilds the projects in `changes` ({project: stage}, like from
+        poll()) and updates the master files. Projects that start from the
+        same stage are done together so the System files are only loaded and
+        saved once for each stage. Returns the [(project, stage)] that were
+        rebuilt.
+        """
+        done = []
+        for stage in (WatchStage.LANG, WatchStage.PROJ, WatchStage.SYS):
+            projects = sorted( name for name, st in changes.items() if st == stage )
+            if len(projects) == 0: continue
+            logging.info("Watch: rebuilding %s from the %s stage"%(projects, WatchStage.NAMES[stage]))
+            joiner = Joiner(opath.join(self.__sysdir, ''), None, self.__jobs,
+                            [ Watcher.__escape(name) for name in projects ])
+            try:
+                joiner.makeSysLevelUtil(existing=(stage == WatchStage.SYS),
+                                        existingLang=(stage == WatchStage.PROJ),
+                                        database=self.__database)
+            except Exception as e:
+                # a resource caught half way through being saved shouldn't
+                # stop the watch, it will be picked up on its next change.
+                logging.exception(e)
+                continue
+            done.extend( (name, stage) for name in projects )
+        self.__forgetOwnChanges( [name for name, _ in done] )
+        return done
+
+    def watch(self, callback=None, until=None):
+        """Polls the directory every few seconds and rebuilds what changed
+        once the changes have settled down. `callback` is called with what
+        rebuild() returns each time. This runs until `until` (a function)
+        returns True, or forever if it's None (use Ctrl+C).
+        """
+        pending, last = {}, None
+        while until is None or not until():
+            changes = self.poll()
+            if len(changes) > 0:
+                for project, stage in changes.items():
+                    pending[project] = min(stage, pending.get(project, stage))
+                last = time.time()
+            elif len(pending) > 0 and time.time()-last >= self.__debounce:
+                done = self.rebuild( pending )
+                pending = {}
+                if callback is not None: callback( done )
+            time.sleep( self.__interval )
+
+    def __scan(self, projects=None):
+        ### The files being watched: path -> (project, stage, modified, size).
+        ### If `projects` is given, only the files in those are looked at.
+        files = {}
+        filter = iohelp.RCFilters.RCFilter+iohelp.RCFilters.HeaderFilter+iohelp.RCFilters.UtilityFilter
+        for cpath, name in iohelp.dirwalk(self.__sysdir, filter=filter,
+                                          ignore=iohelp.RCFilters.BinaryDirs,
+                                          projects=self.__projects):
+            # the System files are next to the projects, not in one.
+            if opath.dirname(cpath) == self.__sysdir: continue
+            project = iohelp.lastdirname( cpath )
+            if projects is not None and project not in projects: continue
+            stage = self.__stage( project, name )
+            if stage is None: continue
+            try: stat = os.stat( cpath )
+            except OSError: continue # removed while walking.
+            files[cpath] = (project, stage, stat.st_mtime, stat.st_size)
+        return files
+
+    def __stage(self, project, name):
+        ### Which stage a change to the file sets off, or None if it doesn't.
+        base, ext = opath.splitext( name )
+        ext = ext[1:].lower()
+        if ext in iohelp.RCFilters.RCFilter: return WatchStage.LANG
+        if ext in iohelp.RCFilters.HeaderFilter:
+            if fnmatch.fnmatch(name.lower(), Watcher.HEADER_PATTERN): return WatchStage.LANG
+            return None
+        # project level files are named after their directory.
+        if base == project: return WatchStage.SYS
+        return WatchStage.PROJ
+
+    def __forgetOwnChanges(self, projects):
+        ### The utility files the rebuild wrote shouldn't look like new
+        ### changes, so they are looked at again now. The resources aren't,
+        ### anything new in them still has to be picked up.
+        for path, (project, stage, modified, size) in self.__scan( set(projects) ).items():
+            if stage != WatchStage.LANG: self.__files[path] = (project, stage, modified, size)
+
+    @staticmethod
+    def __escape( name ):
+        ### Project names are handed to the Joiner as glob patterns.
+        return re.sub(r'([\*\?\[])', r'[\1]', name)
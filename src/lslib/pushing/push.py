@@ -20,17 +20,19 @@ LATER:
 import logging
 import os.path as opath
 
-from lslib.util.iohelp import dirwalk, RCFilters
+from lslib.util.iohelp import dirwalk, namematch, RCFilters
 from lslib.base.file.rcsfile import scanRCFile
 
-from lslib.base.file.utility.MenuFile   import RCMenuFile
-from lslib.base.file.utility.DialogFile import RCDialogFile
-from lslib.base.file.utility.StrTblFile import RCStrTblFile
+from lslib.base.file.utility.MenuFile   import RCMenuFile, InMemMenu
+from lslib.base.file.utility.DialogFile import RCDialogFile, InMemDialog
+from lslib.base.file.utility.StrTblFile import RCStrTblFile, InMemTable
 from lslib.base.file.utility.TranslationFile import TranslationFile
 
 from lslib.base.file.syslvl.SysMenuFile   import SysMenuFile                        
 from lslib.base.file.syslvl.SysDialogFile import SysDialogFile                                           
 from lslib.base.file.syslvl.SysStrTblFile import SysStrTblFile
+from lslib.base.file.syslvl.SysMasterDB   import SysMasterDB, isMasterDB, \
+                                                 MASTER_DB_EXT
 
 from lslib.base.file.syslvl.sysbase import isSystemLevelMenu,     \
                                            isSystemLevelDialog,   \
@@ -41,8 +43,8 @@ class PusherInputs:
     Notice that resources aren't on here because we can't resources into 
     anything, thats an export.
     """
-    MENU, DIALOG, STRTBL, TRANS = range(4)
-    LIST = [MENU, DIALOG, STRTBL, TRANS]
+    MENU, DIALOG, STRTBL, TRANS, MASTERDB = range(5)
+    LIST = [MENU, DIALOG, STRTBL, TRANS, MASTERDB]
     
 class PusherOutputs:
     """These are the types of outputs that can be pushed to from one of
@@ -122,7 +124,13 @@ class MissingLangCodeError( Exception ):
 class Pusher:
     """Class to make file updating easier. """
     
-    def __init__(self, inputPath, inputType, outputPath, outputType, langcodes=None, makenew=False):
+    def __init__(self, inputPath, inputType, outputPath, outputType, langcodes=None, makenew=False, dryrun=False, projects=None, langs=None):
+        """If `dryrun` is True none of the resource files are written, the
+        lines that would have changed in each are only counted (see 
+        getChanges()). `projects` and `langs` are lists of glob patterns 
+        (eg, ['User*'] or ['20??']) that limit which projects and languages
+        are pushed into, everything else is left alone.
+        """
         self.__input = inputPath
         self.__inputType = inputType
         self.__outputType = outputType
@@ -130,15 +138,24 @@ class Pusher:
         self.__output = []
         self.__langcodes = langcodes
         self.__outputPath = outputPath
+        self.__dryrun = dryrun
+        self.__changes = [] # [(path, changed lines)]
+        self.__projects = projects
+        self.__langs = langs
         if makenew or PusherOutputs.isSingleFile( outputType ):
             self.__output.append( (outputPath, opath.split(outputPath)[1]))
         else:
             self.__output = \
                 [ x for x in dirwalk( outputPath, 
                                       filter=PusherOutputs.Filter(outputType), 
-                                      ignore=RCFilters.BinaryDirs ) ]
+                                      ignore=RCFilters.BinaryDirs,
+                                      projects=projects if PusherOutputs.isResource(outputType) else None ) ]
 
     def push(self, backupDir=None):
+        self.__changes = []
+        if self.__dryrun and not PusherOutputs.isResource(self.__outputType):
+            logging.warning("A dry run can only be done on resource files, nothing was updated.")
+            return
         if PusherOutputs.isResource(self.__outputType):
             if self.__makenew: 
                 logging.warning("LiVSs cannot create brand new resource files for you. Yet!")
@@ -147,9 +164,11 @@ class Pusher:
             elif self.__inputType == PusherInputs.DIALOG: self.__d2r()
             elif self.__inputType == PusherInputs.STRTBL: self.__s2r()
             elif self.__inputType == PusherInputs.TRANS:  self.__t2r()
+            elif self.__inputType == PusherInputs.MASTERDB: self.__db2r()
             else: raise InvalidPushError()
         elif PusherOutputs.isSysFile(self.__outputType):
             if self.__inputType == PusherInputs.TRANS : self.__trans2sys()
+            elif self.__inputType == PusherInputs.MASTERDB: self.__db2sys()
             else: raise InvalidPushError()
         elif PusherOutputs.isProjFile(self.__outputType):
             raise NotImplementedError("Project File push-back has not been written yet. " + \
@@ -157,11 +176,28 @@ class Pusher:
                                       "files for back up.")
         logging.debug("Pushing Complete!")
     
+    def getChanges(self):
+        """Returns a list of (path, changed lines) for every resource file 
+        that was updated by the last push(). Files with no changed lines 
+        weren't written.
+        """
+        return list(self.__changes)
+    
     def __validLangcode(self, code):
+        if not namematch(code, self.__langs):
+            return False
         if self.__langcodes is None:
             return True
         else: return code in self.__langcodes
     
+    def __limitProjects(self, sysFile):
+        ### Takes the projects that don't match the project filter out of a
+        ### System file (pulled from the translator) so they aren't pushed.
+        if not self.__projects: return sysFile
+        for name in list(sysFile._projs):
+            if not namematch(name, self.__projects): del sysFile._projs[name]
+        return sysFile
+    
     def __defaultLangCode(self):
         try:
             if len(self.__langcodes) > 0:
@@ -169,12 +205,33 @@ class Pusher:
             else: return '1033'
         except: return '1033'
     
+    def __save(self, resource, buff):
+        ### Writes an updated resource (only if something in it changed), 
+        ### or on a dry run just counts the lines that would have.
+        if self.__dryrun: changed = resource.changedLines( buff )
+        else: changed = resource.save( resource._path, buff )
+        logging.debug("\t\t%d lines changed @> %s"%(changed, resource._path))
+        self.__changes.append( (resource._path, changed) )
+    
+    def __loadTranslator(self):
+        ### The input can be a list of translation files (like the ones that
+        ### are split up by language), they are all combined into the first.
+        paths = self.__input if isinstance(self.__input, (list, tuple)) else [self.__input]
+        trans = TranslationFile( paths[0], self.__defaultLangCode() )
+        trans.load()
+        for path in paths[1:]:
+            logging.debug("\tAdding translator: %s"%path)
+            other = TranslationFile( path, self.__defaultLangCode() )
+            other.load()
+            trans.combine( other )
+        return trans
+    
     def __m2r(self): 
         logging.debug("Pushing menus into resources...")
         if isSystemLevelMenu(self.__input):
             logging.debug("\tMenus file is System Level.")
             file = SysMenuFile( self.__input )
-            file.load()
+            file.load( lazy=True )
             for cpath,name in self.__output:
                 resource = scanRCFile(cpath)
                 if not self.__validLangcode(resource._langcode):
@@ -186,7 +243,7 @@ class Pusher:
                     logging.warning("Project %s does not exist in %s"%(resource._name, self.__input))
                     continue
                 logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
-                resource.updateMenus(projFile)
+                self.__save( resource, resource.updateMenus(projFile, save=False) )
                 
         else:
             logging.debug("\tMenus file is Project or language Level.")
@@ -200,7 +257,7 @@ class Pusher:
                     continue
                 if resource._langcode in langs:
                     logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
-                    resource.updateMenus(projFile)
+                    self.__save( resource, resource.updateMenus(projFile, save=False) )
                 else: raise MissingLangCodeError()  
 
     def __d2r(self): 
@@ -208,7 +265,7 @@ class Pusher:
         if isSystemLevelDialog(self.__input):
             logging.debug("\tDialogs file is System level.")
             file = SysDialogFile( self.__input )
-            file.load()
+            file.load( lazy=True )
             for cpath,name in self.__output:
                 resource = scanRCFile(cpath)
                 if not self.__validLangcode(resource._langcode): 
@@ -219,7 +276,7 @@ class Pusher:
                 except KeyError:
                     logging.warning("Project %s does not exist in %s"%(resource._name, self.__input))
                     continue
-                resource.updateDialogs(projFile)
+                self.__save( resource, resource.updateDialogs(projFile, save=False) )
         else:
             logging.debug("\tDialogs file is Project or language Level.")
             projFile = RCDialogFile( self.__input )
@@ -232,7 +289,7 @@ class Pusher:
                     continue
                 if resource._langcode in langs: 
                     logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
-                    resource.updateDialogs(projFile)
+                    self.__save( resource, resource.updateDialogs(projFile, save=False) )
                 else: raise MissingLangCodeError()  
     
     def __s2r(self): 
@@ -240,7 +297,7 @@ class Pusher:
         if isSystemLevelStringTable(self.__input):
             logging.debug("\tString table file is System Level.")
             file = SysStrTblFile( self.__input )
-            file.load()
+            file.load( lazy=True )
             for cpath,name in self.__output:
                 resource = scanRCFile(cpath)
                 if not self.__validLangcode(resource._langcode): 
@@ -251,7 +308,7 @@ class Pusher:
                 except KeyError:
                     logging.warning("Project %s does not exist in %s"%(resource._name, self.__input))
                     continue
-                resource.updateStringTables(projFile)
+                self.__save( resource, resource.updateStringTables(projFile, save=False) )
         else:
             logging.debug("\tString Table File is Project or Language Level.")
             projFile = RCStrTblFile( self.__input )
@@ -264,63 +321,119 @@ class Pusher:
                     continue
                 if resource._langcode in langs: 
                     logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
-                    resource.updateStringTables(projFile)
+                    self.__save( resource, resource.updateStringTables(projFile, save=False) )
                 else: raise MissingLangCodeError()        
     
     def __t2r(self):
         logging.debug("Pushing Translator into resources...")
-        trans = TranslationFile( self.__input, self.__defaultLangCode() )
-        trans.load()
-        logging.debug("\tPulling out sys utils")
-        menuFile = trans.getSysMenuFile('')
-        dlogFile = trans.getSysDialogFile('')
-        strsFile = trans.getSysStrTblFile('')
-        projFiles = {}
+        trans = self.__loadTranslator()
+        # The translator is compiled straight into what each project needs,
+        # none of the system or project level files are made for this.
+        logging.debug("\tCompiling project lookups")
+        lookups = trans.getLookups()
         for cpath,name in self.__output:
             resource = scanRCFile( cpath )
             if not self.__validLangcode( resource._langcode ): 
                 logging.debug("\t\tIgnoring '%s' because its not the right langcode. @> %s"%(name,cpath)) 
                 continue
             
-            try:
-                if resource._name in projFiles:
-                    logging.debug("\t\tReloading proj lvl files for %s..."%resource._name)
-                    projMenus, projDlogs, projConts = projFiles[ resource._name ]
-                else:
-                    logging.debug("\t\tPulling out proj lvl files for %s..."%resource._name)
-                    projMenus = menuFile.genProjLevelFile(resource._name, '')
-                    projDlogs = dlogFile.genProjLevelFile(resource._name, '')
-                    projConts = strsFile.genProjLevelFile(resource._name, '')
-                    projFiles[ resource._name ] = (projMenus, projDlogs, projConts)
-            except KeyError:
+            lookup = lookups.get( resource._name )
+            if lookup is None and not trans.isPartial():
                 logging.warning("Project %s does not exist in %s. (path=%s,name=%s)"%(resource._name,self.__input,cpath,name))
                 continue
+            elif lookup is None or lookup.isEmpty():
+                # a partial translator doesn't have anything for it.
+                logging.debug("\t\tNothing to update in '%s' @> %s"%(name,cpath))
+                continue
             
             logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
-            buff = resource.updateMenus( projMenus, save=False )
-            buff = resource.updateDialogs( projDlogs, save=False, buffer=buff )
-            resource.updateStringTables( projConts, buffer=buff )
+            self.__save( resource, resource.updateFromLookup( lookup, save=False ) )
+            
+    def __db2r(self):
+        logging.debug("Pushing Master DB into resources...")
+        db = SysMasterDB( self.__input )
+        try:
+            projFiles = {}
+            for cpath,name in self.__output:
+                resource = scanRCFile( cpath )
+                if not self.__validLangcode( resource._langcode ): 
+                    logging.debug("\t\tIgnoring '%s' because its not the right langcode. @> %s"%(name,cpath)) 
+                    continue
+            
+                if resource._name in projFiles:
+                    projMenus, projDlogs, projConts = projFiles[ resource._name ]
+                elif db.hasProject( resource._name ):
+                    # only the project we need is queried out of the database.
+                    logging.debug("\t\tPulling out proj lvl files for %s..."%resource._name)
+                    projMenus = InMemMenu('', db.getMenus(resource._name))
+                    projDlogs = InMemDialog('', db.getDialogs(resource._name))
+                    projConts = InMemTable('', db.getStringTable(resource._name))
+                    projFiles[ resource._name ] = (projMenus, projDlogs, projConts)
+                else:
+                    logging.warning("Project %s does not exist in %s. (path=%s,name=%s)"%(resource._name,self.__input,cpath,name))
+                    continue
             
+                logging.debug("\t\tUpdating %s @> %s"%(name,cpath))
+                buff = resource.updateMenus( projMenus, save=False )
+                buff = resource.updateDialogs( projDlogs, save=False, buffer=buff )
+                buff = resource.updateStringTables( projConts, save=False, buffer=buff )
+                self.__save( resource, buff )
+        finally: db.close()
+    
+    def __db2sys(self):
+        logging.debug("Pushing Master DB into System Level Utilities...")
+        if opath.isdir(self.__outputPath):
+            basename = opath.join(self.__outputPath, "System_Strings.master")
+        else: basename = opath.splitext(self.__outputPath)[0]
+        db = SysMasterDB( self.__input )
+        try:
+            projects = None
+            if self.__projects:
+                projects = [ name for name in db.getProjectList() if namematch(name, self.__projects) ]
+            db.exportFiles( basename, projects,
+                            doMenus=PusherOutputs.isMenu(self.__outputType), 
+                            doDialogs=PusherOutputs.isDialog(self.__outputType), 
+                            doStrings=PusherOutputs.isStringTable(self.__outputType) )
+        finally: db.close()
+        
     def __trans2sys(self):
         logging.debug("Pushing Translator into System Level Utilities...")
-        trans = TranslationFile( self.__input, self.__defaultLangCode() )
-        trans.load()
+        trans = self.__loadTranslator()
+        langcodes = self.__langcodes
+        if self.__langs:
+            langcodes = [ code for code in trans._makeLangList() if self.__validLangcode(code) ]
+        
         if self.__makenew:
             logging.debug("\tPulling out new sys utils")
-            trans.getSysMenuFile( opath.join(self.__outputPath, "System_Strings.master.menus"), True, self.__langcodes )
-            trans.getSysDialogFile( opath.join(self.__outputPath, "System_Strings.master.dialogs"), True, self.__langcodes )
-            trans.getSysStrTblFile( opath.join(self.__outputPath, "System_Strings.master.strtbls"), True, self.__langcodes )
+            for getter, ext in [(trans.getSysMenuFile, ".menus"), 
+                                (trans.getSysDialogFile, ".dialogs"), 
+                                (trans.getSysStrTblFile, ".strtbls")]:
+                file = getter( opath.join(self.__outputPath, "System_Strings.master"+ext), False, langcodes )
+                self.__limitProjects( file ).save()
             logging.debug("\tSaved new system files from translator!")
             return
         
         logging.debug("\tPulling new sys utils to merge")
-        menuFile = trans.getSysMenuFile('')
-        dlogFile = trans.getSysDialogFile('')
-        strsFile = trans.getSysStrTblFile('')
+        menuFile = self.__limitProjects( trans.getSysMenuFile('', langcodes=langcodes) )
+        dlogFile = self.__limitProjects( trans.getSysDialogFile('', langcodes=langcodes) )
+        strsFile = self.__limitProjects( trans.getSysStrTblFile('', langcodes=langcodes) )
+        
+        # If there is a master database, it gets updated as well.
+        if opath.isdir(self.__outputPath):
+            dbpath = opath.join(self.__outputPath, "System_Strings.master"+MASTER_DB_EXT)
+        else: dbpath = self.__outputPath
+        if isMasterDB( dbpath ):
+            logging.debug("\tUpdating @> %s"%dbpath)
+            db = SysMasterDB( dbpath )
+            try: db.updateFromTranslation( menuFile, dlogFile, strsFile )
+            finally: db.close()
         strtbl, menus, dlogs = False, False, False
         
         for cpath,_ in self.__output:
-            if opath.splitext(cpath)[1] == "strtbls" and \
+            if opath.isdir(self.__outputPath) and \
+               opath.dirname(cpath) != opath.normpath(self.__outputPath):
+                continue # the project and language level files are below it.
+            if opath.splitext(cpath)[1] == ".strtbls" and \
                PusherOutputs.isStringTable( self.__outputType ):
                 
                 if strtbl: #only allow one?
@@ -332,7 +445,7 @@ class Pusher:
                 tmp.updateFromTranslation(strsFile, autosave=True)
                 strtbl = True
                 
-            elif opath.splitext(cpath)[1] == "menus" and \
+            elif opath.splitext(cpath)[1] == ".menus" and \
                PusherOutputs.isMenu( self.__outputType ):
                 
                 if menus: #only allow one?
@@ -344,7 +457,7 @@ class Pusher:
                 tmp.updateFromTranslation(menuFile, autosave=True)
                 menus = True
                 
-            elif opath.splitext(cpath)[1] == "dialogs" and \
+            elif opath.splitext(cpath)[1] == ".dialogs" and \
                PusherOutputs.isDialog( self.__outputType ):
                 
                 if dlogs:  #only allow one?
@@ -99,6 +99,15 @@ prsr_UPDATE_desc= \
 from either a utility file or a translator file back into resource files.
 """
 
+prsr_WATCH='watch'
+prsr_WATCH_help='keep the master files of a system directory up to date as its resources change'
+prsr_WATCH_desc= \
+"""Watch looks over a system directory every few seconds for resources, resource 
+headers and utility files that changed. Only the projects they are in are 
+exported again, from the first level that was affected, and the master files 
+are updated in place. Run a full export first, then leave this running.
+"""
+
 prsr_SEARCH='search'
 prsr_SEARCH_help='similar to parse but strictly for locating strings'
 prsr_SEARCH_desc= \
@@ -145,6 +154,6 @@ to check something, choose stdout.
 """
 
 # Useful for queries
-TOP_LEVEL_PARSERS  = [prsr_PARSE, prsr_EXPORT, prsr_UPDATE, prsr_SEARCH, prsr_STATS, prsr_BKUP, prsr_SCRIPT]
+TOP_LEVEL_PARSERS  = [prsr_PARSE, prsr_EXPORT, prsr_UPDATE, prsr_WATCH, prsr_SEARCH, prsr_STATS, prsr_BKUP, prsr_SCRIPT]
 PARSER_SUB_PARSERS = [subprsr_RCS, subprsr_CODE, subprsr_CSV]
 EXPORT_SUB_PARSERS = [subprsr_UTIL, subprsr_TRANSLATOR] 
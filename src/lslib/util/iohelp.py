@@ -7,6 +7,7 @@
 #
 
 import os
+import fnmatch
 
 # Here are some special filter and exclusion lists.
 class RCFilters:
@@ -116,7 +117,16 @@ def ignoredirectory( dir, ignoredirs=None ):
         else: return False
     except: return False
      
-def dirwalk( directory, exclude=None, filter=None, ignore=None ):
+def namematch( name, patterns=None ):
+    """Checks if a name (like a project's or a language code) matches any of
+    the glob patterns given, ie ['User*', '20??']. Case doesn't matter. If 
+    there aren't any patterns, everything matches.
+    """
+    if not patterns: return True
+    name = str(name).lower()
+    return any( fnmatch.fnmatchcase(name, str(pattern).lower()) for pattern in patterns )
+     
+def dirwalk( directory, exclude=None, filter=None, ignore=None, projects=None ):
     """Walks through a directory and excludes certain file types
     or filter to just get certain file extensions. This function
     returns an iterator that can be used in place of os.walk.
@@ -124,10 +134,16 @@ def dirwalk( directory, exclude=None, filter=None, ignore=None ):
     a tuple (cpath, name) where:
         cpath = the complete path of the file (can be passed to open)
         name  = the trimmed name of the file (can be used for printing)
+    Directories and files are walked in sorted order, so the same tree is 
+    always walked the same way. If `projects` is a list of glob patterns, 
+    only the files in directories whose name matches one are given (the 
+    directories under them are still walked, since projects can be nested).
     """
-    for root, _, files in os.walk( directory ):
+    for root, dirs, files in os.walk( directory ):
+        dirs.sort()
         if ignoredirectory( root, ignore ): continue
-        for file in files:
+        if not namematch( os.path.basename(root), projects ): continue
+        for file in sorted(files):
             if fileok( file, exclude, filter ):
                 yield (os.path.join(root, file), file)
     
@@ -144,14 +160,14 @@ def lastdirname( path ):
     dirs, _ = os.path.split( path )
     return os.path.basename(dirs)
     
-def dirwalkl( directory, exclude=None, filter=None, ignore=None ):    
+def dirwalkl( directory, exclude=None, filter=None, ignore=None, projects=None ):    
     """Works exactly like dirwalk, except that it yields a list
     of matches per directory, rather than every single match.
     """
     curdir = ''
     ret = []
     import logging
-    for cpath, name in dirwalk(directory, exclude, filter, ignore):
+    for cpath, name in dirwalk(directory, exclude, filter, ignore, projects):
         if filter==RCFilters.HeaderFilter: logging.debug("FOUND HEADER MATCH: %s"%name)
         if os.path.dirname(cpath) == curdir: #add to return list
             ret.append((cpath,name))
@@ -161,6 +177,7 @@ def dirwalkl( directory, exclude=None, filter=None, ignore=None ):
                 ret = []
             curdir = os.path.dirname(cpath)
             ret.append((cpath,name))
+    if len(ret) > 0: yield ret # the last directory.
     
 def ScanUntilMatch( path, check ):
     """ Scans a file until a line matches the check. If no line
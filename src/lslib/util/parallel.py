@@ -0,0 +1,108 @@
+#
+# Author: Alexander Dean <dstar@csh.rit.edu>
+# Copyright (c) 2011, RailComm LLC
+# All rights reserved. Redistribution and use in source and binary forms, with
+# or without modification are permitted provided that the conditions are met
+# under the Modified BSD License.
+#
+"""Helpers for spreading out work that doesn't depend on anything else (like
+loading a few thousand utility files) over several workers. The results always
+come back in the order the work was handed out, so whatever is built out of
+them is exactly the same no matter how many jobs were used.
+"""
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_shared = None # see sharedData()
+
+class Jobs:
+    """Defaults for orderedMap. DEFAULT is the number of workers to use when
+    none is given, 1 means everything is done in this process like normal.
+    Processes are used unless THREADS is True; threads are cheaper to start
+    but parsing is mostly python so they end up fighting over the GIL.
+    """
+    DEFAULT = 1
+    THREADS = False
+
+
+def sharedData():
+    """The `shared` object given to the orderedMap that is running this."""
+    return _shared
+
+def _setShared( shared ):
+    ### Runs in each worker as it starts, see orderedMap.
+    global _shared
+    _shared = shared
+
+def orderedMap( func, items, jobs=None, threads=None, chunksize=1, inflight=None, shared=None ):
+    """Works like the builtin map(), except `func` is run over the `items` by
+    a pool of `jobs` workers. Results are yielded in the same order as the
+    items they came from. When processes are used `func` has to be a module
+    level function and both the items and what it returns must be picklable.
+    If a pool can't be started, everything is just run here instead.
+    
+    If `inflight` is given, the items are only taken as they are needed and
+    no more than that many are handed out ahead of what was yielded. So if 
+    whatever is using the results falls behind, the items stop being taken 
+    too (which is how orderedMaps can be chained into a pipeline).
+    
+    If `shared` is given, `func` can get it with sharedData(). It's handed to
+    each worker once when it starts instead of with every item, so something
+    big that every item needs is only copied once per worker (and not at all
+    if the processes are forked).
+    """
+    if jobs is None: jobs = Jobs.DEFAULT
+    if threads is None: threads = Jobs.THREADS
+    if inflight is not None:
+        for result in _boundedMap(func, items, jobs, threads, max(1, inflight), shared): 
+            yield result
+        return
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        for result in _localMap(func, items, shared): yield result
+        return
+
+    executor = _startPool(jobs, threads, min(jobs, len(items)), shared)
+    if executor is None:
+        for result in _localMap(func, items, shared): yield result
+        return
+    with executor:
+        for result in executor.map(func, items, chunksize=chunksize):
+            yield result
+
+def _boundedMap( func, items, jobs, threads, inflight, shared=None ):
+    ### orderedMap that only keeps `inflight` items handed out at a time.
+    if jobs <= 1:
+        for result in _localMap(func, items, shared): yield result
+        return
+    executor = _startPool(jobs, threads, jobs, shared)
+    if executor is None:
+        for result in _localMap(func, items, shared): yield result
+        return
+    with executor:
+        pending = deque()
+        for item in items:
+            pending.append( executor.submit(func, item) )
+            if len(pending) >= inflight: yield pending.popleft().result()
+        while len(pending) > 0: yield pending.popleft().result()
+
+def _startPool( jobs, threads, workers, shared ):
+    ### The executor for orderedMap, or None if one couldn't be started.
+    pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    extra = {} if shared is None else { "initializer":_setShared, "initargs":(shared,) }
+    try: return pool( max_workers=workers, **extra )
+    except (OSError, ImportError, NotImplementedError) as e:
+        logging.warning("Could not start %d jobs, running one at a time: %s"%(jobs, e))
+        return None
+
+def _localMap( func, items, shared ):
+    ### Runs everything here, with `shared` set the same way a worker has it.
+    global _shared
+    if shared is None:
+        for item in items: yield func(item)
+        return
+    before, _shared = _shared, shared
+    try:
+        for item in items: yield func(item)
+    finally: _shared = before